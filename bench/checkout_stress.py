@@ -0,0 +1,171 @@
+"""Hammer checkout from many processes and threads and check nothing oversells.
+
+Every thread is a signed-in buyer that keeps putting one unit of a hot,
+stock-tracked product (plus an untracked one) in its cart and checking out
+with COD until the product sells out. Processes share one database, so this
+exercises the same contention as several gunicorn workers. At the end the
+units sold, still held and still in stock must add up to the starting stock.
+
+    python bench/checkout_stress.py --processes 4 --threads 8 --stock 100
+    DATABASE_URL=postgresql://... python bench/checkout_stress.py
+
+Without DATABASE_URL a throwaway SQLite file is used. The database is
+created from the models and filled with bench data, so never point this at
+a real store.
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "bench-pass"
+ADDRESS = dict(customer_name="Bench", customer_phone="9999999999", address_line1="1 Load St",
+               address_line2="", city="Bengaluru", state="Karnataka", pincode="560001",
+               payment_method="cod")
+
+
+def make_app(database_url):
+    from mercado import create_app
+    from mercado.config import Config
+
+    class Bench(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        WTF_CSRF_ENABLED = False
+        TESTING = True
+        CACHE_TYPE = "null"
+
+    return create_app(Bench)
+
+
+def setup(database_url, buyers, stock):
+    from mercado.extensions import db
+    from mercado.models import Category, Product, User
+
+    app = make_app(database_url)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        category = Category(name="Bench")
+        db.session.add(category)
+        db.session.flush()
+        hot = Product(title="Flash sale phone", price=9999, sale_price=9999, category_id=category.id, stock=stock)
+        cold = Product(title="Phone case", price=299, sale_price=299, category_id=category.id)
+        db.session.add_all([hot, cold])
+        for i in range(buyers):
+            user = User(name=f"Buyer {i}", email=f"buyer{i}@example.com")
+            user.set_password(PASSWORD)
+            db.session.add(user)
+        db.session.commit()
+        return hot.id, cold.id
+
+
+def buyer(app, n, hot, cold, deadline, results):
+    client = app.test_client()
+    client.post("/login", data={"email": f"buyer{n}@example.com", "password": PASSWORD})
+    outcome = {"orders": 0, "sold_out": 0, "errors": 0, "latencies": []}
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            client.get(f"/add_to_cart/{cold}")
+            r = client.get(f"/add_to_cart/{hot}")
+            with client.session_transaction() as sess:
+                flashes = [msg for _, msg in sess.get("_flashes", [])]
+            if any("out of stock" in msg or "left in stock" in msg for msg in flashes):
+                outcome["sold_out"] += 1
+                break
+            r = client.post("/checkout", data=dict(ADDRESS, customer_email=f"buyer{n}@example.com"))
+            if r.status_code == 302 and "/order/success/" in r.location:
+                outcome["orders"] += 1
+            elif r.status_code == 302:
+                outcome["sold_out"] += 1
+                break
+            else:
+                outcome["errors"] += 1
+        except Exception as exc:  # e.g. "database is locked" under SQLite
+            outcome["errors"] += 1
+            outcome.setdefault("messages", []).append(repr(exc)[:200])
+        outcome["latencies"].append(time.perf_counter() - start)
+    results.append(outcome)
+
+
+def process(database_url, first, threads, hot, cold, deadline, queue):
+    app = make_app(database_url)
+    results = []
+    workers = [threading.Thread(target=buyer, args=(app, first + i, hot, cold, deadline, results))
+               for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    queue.put(results)
+
+
+def verify(database_url, hot, stock):
+    from sqlalchemy import func, select
+    from mercado.extensions import db
+    from mercado.models import OrderItem, Product, StockReservation
+
+    app = make_app(database_url)
+    with app.app_context():
+        left = db.session.scalar(select(Product.stock).where(Product.id == hot))
+        sold = db.session.scalar(select(func.coalesce(func.sum(OrderItem.quantity), 0))
+                                 .where(OrderItem.product_id == hot))
+        held = db.session.scalar(select(func.coalesce(func.sum(StockReservation.quantity), 0))
+                                 .where(StockReservation.product_id == hot))
+    return left, sold, held
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="buyers per process")
+    parser.add_argument("--stock", type=int, default=100, help="units of the hot product")
+    parser.add_argument("--seconds", type=float, default=60, help="give up after this long")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL") or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    buyers = args.processes * args.threads
+    hot, cold = setup(database_url, buyers, args.stock)
+
+    queue = multiprocessing.Queue()
+    deadline = time.time() + args.seconds
+    started = time.perf_counter()
+    procs = [multiprocessing.Process(target=process, args=(database_url, p * args.threads, args.threads,
+                                                            hot, cold, deadline, queue))
+             for p in range(args.processes)]
+    for p in procs:
+        p.start()
+    results = [r for _ in procs for r in queue.get()]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - started
+
+    orders = sum(r["orders"] for r in results)
+    errors = sum(r["errors"] for r in results)
+    latencies = sorted(t for r in results for t in r["latencies"])
+    left, sold, held = verify(database_url, hot, args.stock)
+
+    print(f"{buyers} buyers in {args.processes} processes, {elapsed:.1f}s")
+    print(f"orders {orders}  ({orders / elapsed:.1f}/s)  errors {errors}")
+    if latencies:
+        q = statistics.quantiles(latencies, n=100)
+        print(f"attempt latency p50 {q[49] * 1000:.0f}ms  p95 {q[94] * 1000:.0f}ms  p99 {q[98] * 1000:.0f}ms")
+    for message in sorted({m for r in results for m in r.get("messages", [])})[:5]:
+        print("  error:", message)
+    print(f"hot product: {args.stock} units = {sold} sold + {held} held + {left} in stock")
+
+    if left is None or left < 0 or sold + held + left != args.stock:
+        print("FAIL: stock does not add up")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""Benchmark the main routes against a seeded store and keep JSON baselines.
+
+Each scenario is one visitor action (a page view, or a short flow such as
+add to cart -> view cart) repeated by ``--concurrency`` threads, each its
+own signed-in customer. For every scenario it reports latency percentiles,
+SQL statements per iteration and throughput:
+
+    python bench/routes.py --out bench/baselines/local.json
+    python bench/routes.py --http --concurrency 8 --compare bench/baselines/local.json
+    DATABASE_URL=postgresql://... python bench/routes.py --reuse
+
+By default the requests go through the Flask test client; ``--http`` serves
+the app on a local port with a threaded WSGI server and drives it over real
+sockets instead. Checkout pays online through the in-process stub gateway.
+
+Without DATABASE_URL a throwaway SQLite file is created and filled by
+``mercado.seed`` (sizes from the options below, same data for the same
+``--seed``). ``--reuse`` benchmarks a database seeded earlier with
+``flask seed`` instead. ``--compare`` prints the change against a saved
+baseline and exits non-zero when a scenario's p95 grows by more than
+``--tolerance`` or it runs more queries than before. Query counts do not
+depend on the machine, so those diffs are meaningful in review even when
+the latencies came from someone else's laptop.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN_EMAIL = "bench-admin@example.com"
+ADMIN_PASSWORD = "bench-pass"
+ADDRESS = dict(customer_name="Bench", customer_phone="9999999999", address_line1="1 Load St",
+               address_line2="", city="Bengaluru", state="Karnataka", pincode="560001",
+               payment_method="online")
+SEARCH_TERMS = ("speaker", "smart watch", "kettle", "wireless", "pro", "yoga", "power bank", "jacket")
+
+
+def make_app(database_url, cache_type):
+    from mercado import create_app
+    from mercado.config import Config
+
+    class Bench(Config):
+        SQLALCHEMY_DATABASE_URI = database_url
+        WTF_CSRF_ENABLED = False
+        CACHE_TYPE = cache_type
+        PAYMENT_GATEWAY = "stub"
+        RAZORPAY_KEY_ID = "rzp_test_bench"
+        RAZORPAY_KEY_SECRET = "bench-secret"
+
+    return create_app(Bench)
+
+
+def setup(app, args):
+    """Create and seed the database unless reusing one; return route inputs."""
+    from sqlalchemy import select
+    from mercado import seed
+    from mercado.extensions import db
+    from mercado.models import Category, Product, User
+
+    with app.app_context():
+        if not args.reuse:
+            db.create_all()
+            seed.seed(categories=args.categories, products=args.products, users=args.users,
+                      orders=args.orders, seed=args.seed)
+        if not db.session.scalar(select(User.id).where(User.email == ADMIN_EMAIL)):
+            admin = User(name="Bench admin", email=ADMIN_EMAIL, is_admin=True)
+            admin.set_password(ADMIN_PASSWORD)
+            db.session.add(admin)
+            db.session.commit()
+        customers = db.session.scalars(select(User.email).where(User.email.like(f"%@{seed.SEED_DOMAIN}"))
+                                       .order_by(User.id).limit(args.concurrency)).all()
+        if len(customers) < args.concurrency:
+            sys.exit(f"need {args.concurrency} seeded customers, found {len(customers)}: run flask seed")
+        return {
+            "categories": db.session.scalars(select(Category.id)).all(),
+            "products": db.session.scalars(select(Product.id).order_by(Product.id.desc()).limit(5000)).all(),
+            # untracked products never sell out, so checkout always succeeds
+            "untracked": db.session.scalars(select(Product.id).where(Product.stock.is_(None))
+                                            .order_by(Product.id).limit(500)).all(),
+            "customers": customers,
+            "app": app,
+        }
+
+
+# ---------------- Clients ----------------
+class TestClient:
+    """The Flask test client, counting requests."""
+
+    def __init__(self, app, base_url=None):
+        self.client = app.test_client()
+        self.requests = 0
+
+    def request(self, method, path, data=None):
+        self.requests += 1
+        r = self.client.open(path, method=method, data=data)
+        return r.status_code, r.get_data(), r.headers.get("Location")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """urllib against a live server, with cookies and without following redirects."""
+
+    def __init__(self, app, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect)
+        self.requests = 0
+
+    def request(self, method, path, data=None):
+        self.requests += 1
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(req, timeout=60) as r:
+                return r.status, r.read(), r.headers.get("Location")
+        except urllib.error.HTTPError as r:
+            return r.code, r.read(), r.headers.get("Location")
+
+
+def serve(app):
+    """Serve ``app`` on a free local port in a background thread; returns its URL."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class Quiet(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=Quiet)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+# ---------------- Scenarios ----------------
+def _ok(status, *expected):
+    if status not in (expected or (200,)):
+        raise RuntimeError(f"HTTP {status}")
+
+
+def home(c, rng, data):
+    _ok(c.request("GET", "/")[0])
+
+
+def shop(c, rng, data):
+    _ok(c.request("GET", f"/shop?page={rng.randint(1, 20)}")[0])
+
+
+def category(c, rng, data):
+    _ok(c.request("GET", f"/category/{rng.choice(data['categories'])}?page={rng.randint(1, 5)}")[0])
+
+
+def product(c, rng, data):
+    _ok(c.request("GET", f"/p/{rng.choice(data['products'])}")[0])
+
+
+def api_search(c, rng, data):
+    _ok(c.request("GET", "/api/search?" + urllib.parse.urlencode({"q": rng.choice(SEARCH_TERMS)}))[0])
+
+
+def cart(c, rng, data):
+    pid = rng.choice(data["untracked"])
+    _ok(c.request("GET", f"/add_to_cart/{pid}")[0], 302)
+    _ok(c.request("GET", "/cart")[0])
+    _ok(c.request("GET", f"/remove_from_cart/{pid}")[0], 302)
+
+
+def checkout(c, rng, data):
+    from mercado import payments
+
+    _ok(c.request("GET", f"/add_to_cart/{rng.choice(data['untracked'])}")[0], 302)
+    status, body, _ = c.request("POST", "/checkout", dict(ADDRESS, customer_email=c.email))
+    _ok(status)
+    oid = re.search(rb'name="oid" value="(\d+)"', body).group(1).decode()
+    gateway_order_id = re.search(rb'var rzpOrderId = "([^"]+)"', body).group(1).decode()
+    # what checkout.js would do once the customer pays
+    with data["app"].app_context():
+        payment = payments.get_gateway("rzp_test_bench", "bench-secret").pay(gateway_order_id)
+    signature = payments.sign("bench-secret", f"{gateway_order_id}|{payment['id']}".encode())
+    _ok(c.request("POST", "/payment/callback", {"oid": oid, "razorpay_payment_id": payment["id"],
+                                               "razorpay_signature": signature})[0], 302)
+    _ok(c.request("GET", f"/order/success/{oid}")[0])
+
+
+def admin_dashboard(c, rng, data):
+    _ok(c.request("GET", "/admin/")[0])
+
+
+def admin_orders(c, rng, data):
+    _ok(c.request("GET", f"/admin/orders?page={rng.randint(1, 20)}")[0])
+
+
+SCENARIOS = {f.__name__: f for f in (home, shop, category, product, api_search, cart, checkout,
+                                     admin_dashboard, admin_orders)}
+ADMIN_SCENARIOS = ("admin_dashboard", "admin_orders")
+
+
+# ---------------- Runner ----------------
+class QueryCounter:
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def login(client, email, password):
+    status, _, location = client.request("POST", "/login", {"email": email, "password": password})
+    if status != 302:
+        raise RuntimeError(f"could not sign in as {email}")
+    client.email = email
+
+
+def run_scenario(name, clients, data, iterations, warmup, seed, counter):
+    fn = SCENARIOS[name]
+    latencies, errors = [], []
+    per_thread = max(1, iterations // len(clients))
+
+    def worker(n, client):
+        rng = random.Random(f"{seed}:{name}:{n}")
+        for i in range(warmup + per_thread):
+            start = time.perf_counter()
+            try:
+                fn(client, rng, data)
+            except Exception as exc:
+                errors.append(repr(exc)[:200])
+                continue
+            if i >= warmup:
+                latencies.append(time.perf_counter() - start)
+
+    # warm-up requests are counted too, so measure them apart
+    requests_before = sum(c.requests for c in clients)
+    queries_before = counter.count
+    threads = [threading.Thread(target=worker, args=(n, c)) for n, c in enumerate(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    done = len(clients) * (warmup + per_thread)
+
+    result = {
+        "iterations": len(latencies),
+        "errors": len(errors),
+        "requests_per_iteration": round((sum(c.requests for c in clients) - requests_before) / done, 2),
+        "queries_per_iteration": round((counter.count - queries_before) / done, 1),
+        "throughput_per_s": round(done / elapsed, 1),
+    }
+    if len(latencies) >= 2:
+        q = statistics.quantiles(latencies, n=100, method="inclusive")
+        result.update(p50_ms=round(q[49] * 1000, 2), p95_ms=round(q[94] * 1000, 2),
+                      p99_ms=round(q[98] * 1000, 2), mean_ms=round(statistics.fmean(latencies) * 1000, 2))
+    if errors:
+        result["first_error"] = errors[0]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against ``baseline``; return the names that regressed."""
+    regressed = []
+    print(f"\n{'scenario':<16}{'p95 ms':>18}{'queries':>16}{'req/s':>18}")
+    for name, now in results.items():
+        then = baseline.get("scenarios", {}).get(name)
+        if not then or "p95_ms" not in then or "p95_ms" not in now:
+            continue
+        change = (now["p95_ms"] - then["p95_ms"]) / then["p95_ms"] if then["p95_ms"] else 0
+        worse = change > tolerance or now["queries_per_iteration"] > then["queries_per_iteration"]
+        if worse:
+            regressed.append(name)
+        print(f"{name:<16}{then['p95_ms']:>8} -> {now['p95_ms']:<7}"
+              f"{then['queries_per_iteration']:>6} -> {now['queries_per_iteration']:<6}"
+              f"{then['throughput_per_s']:>8} -> {now['throughput_per_s']:<7}"
+              f"{'  REGRESSED' if worse else ''}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("scenarios", nargs="*", metavar="SCENARIO",
+                        help=f"default: all of {', '.join(SCENARIOS)}")
+    parser.add_argument("--http", action="store_true", help="drive a live local server instead of the test client")
+    parser.add_argument("--iterations", type=int, default=200, help="measured iterations per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured iterations per thread first")
+    parser.add_argument("--concurrency", type=int, default=1, help="threads (customers) per scenario")
+    parser.add_argument("--cache", default="memory", choices=("memory", "sqlite", "null"))
+    parser.add_argument("--reuse", action="store_true", help="use the existing DATABASE_URL data as is")
+    parser.add_argument("--categories", type=int, default=20)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth, as a fraction")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(sorted(unknown))}")
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        if args.reuse:
+            sys.exit("--reuse needs DATABASE_URL")
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    app = make_app(database_url, args.cache)
+    data = setup(app, args)
+
+    from mercado.extensions import db
+    with app.app_context():
+        counter = QueryCounter(db.engines.values())
+    base_url = serve(app) if args.http else None
+    client_class = HttpClient if args.http else TestClient
+    customers = []
+    for email in data["customers"]:
+        client = client_class(app, base_url)
+        login(client, email, "seed-pass")
+        customers.append(client)
+    admins = []
+    for _ in range(args.concurrency):
+        client = client_class(app, base_url)
+        login(client, ADMIN_EMAIL, ADMIN_PASSWORD)
+        admins.append(client)
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        clients = admins if name in ADMIN_SCENARIOS else customers
+        results[name] = r = run_scenario(name, clients, data, args.iterations, args.warmup, args.seed, counter)
+        print(f"{name:<16} p50 {r.get('p50_ms', '-'):>8}ms  p95 {r.get('p95_ms', '-'):>8}ms  "
+              f"p99 {r.get('p99_ms', '-'):>8}ms  {r['queries_per_iteration']:>6} queries  "
+              f"{r['throughput_per_s']:>7}/s" + (f"  {r['errors']} errors: {r['first_error']}" if r["errors"] else ""))
+
+    report = {
+        "meta": {
+            "mode": "http" if args.http else "test_client",
+            "database": app.config["SQLALCHEMY_DATABASE_URI"].split(":", 1)[0],
+            "cache": args.cache, "concurrency": args.concurrency, "iterations": args.iterations,
+            "data": {k: getattr(args, k) for k in ("categories", "products", "users", "orders", "seed")}
+            if not args.reuse else "reused",
+            "python": platform.python_version(), "machine": platform.machine(),
+        },
+        "scenarios": results,
+    }
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=2, sort_keys=True)
+            fh.write("\n")
+    status = 1 if any(r["errors"] for r in results.values()) else 0
+    if args.compare:
+        with open(args.compare) as fh:
+            if compare(results, json.load(fh), args.tolerance):
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,12 @@
 from flask import Flask
 from .config import Dev
-from .extensions import db, login_manager, migrate
-from .models import User
+from .extensions import db, login_manager, migrate, cache
 from .blueprints.auth.routes import auth_bp
 from .blueprints.shop.routes import shop_bp
 from .blueprints.admin.routes import admin_bp
+from .cli import register_commands
+from . import assets, database, images, instrumentation, metrics
+from . import identity, pricing, stats, tasks, product_io, inventory  # noqa: F401 (model/session events, job handlers)
 
 
 def create_app(config_object=Dev):
@@ -12,14 +14,17 @@ def create_app(config_object=Dev):
     app.config.from_object(config_object)
 
     # --- Init extensions ---
+    database.configure(app)  # pool/pragma settings and the optional replica
     db.init_app(app)
+    database.install(app, db)
     migrate.init_app(app, db)
     login_manager.init_app(app)
+    cache.init_app(app)
 
-    # --- Flask-Login user loader ---
+    # --- Flask-Login user loader (served from the session, see identity.py) ---
     @login_manager.user_loader
     def load_user(uid):
-        return User.query.get(int(uid))
+        return identity.load(uid)
 
     login_manager.login_view = "auth.login"
 
@@ -28,11 +33,19 @@ def create_app(config_object=Dev):
     app.register_blueprint(shop_bp)
     app.register_blueprint(admin_bp, url_prefix="/admin")
 
-    # --- Inject categories into all templates ---
-    @app.context_processor
-    def inject_categories():
-        names = app.config.get("CATEGORIES", [])
-        cats = [{"id": i + 1, "name": name} for i, name in enumerate(names)]
-        return {"categories": cats}
+    # --- Per-request SQL/template timing (after the blueprints' context processors) ---
+    instrumentation.init_app(app, db)
+
+    # --- Fingerprinted CSS/JS (static_url) ---
+    assets.init_app(app)
+
+    # --- Resized product images (/media, image_srcset) ---
+    images.init_app(app)
+
+    # --- /metrics, /healthz, /readyz ---
+    metrics.init_app(app)
+
+    # --- CLI commands (flask search ...) ---
+    register_commands(app)
 
     return app
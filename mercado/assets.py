@@ -0,0 +1,182 @@
+"""Compiled, fingerprinted CSS/JS (``flask assets build``).
+
+Sources live in ``mercado/assets``: ``app.css`` (Tailwind directives plus
+our own rules) and the scripts in ``js/``. The build
+
+* runs the Tailwind CLI (TAILWIND_CMD, e.g. the standalone ``tailwindcss``
+  binary or ``npx tailwindcss@3``) over ``app.css``; tailwind.config.js
+  points it at the templates, so only the classes we use are kept, and the
+  result is minified;
+* bundles the scripts, in ``JS_BUNDLE`` order, into one file;
+* writes each as ``<name>.<content hash>.<ext>`` to ``static/dist`` with
+  gzip (and, when the ``brotli`` package is installed, brotli) copies next
+  to it, and records the names in ``manifest.json``.
+
+``static_url("app.css")`` resolves a name through the manifest. Hashed
+files are served from ``/assets/`` with a year-long ``immutable``
+Cache-Control and the precompressed copy the browser accepts, since a
+change to the content always changes the URL. Files from earlier builds
+are kept (unless ``--clean``), so pages rendered by workers still running
+the previous release keep working during a deploy.
+
+Behind nginx, ``location /assets/ { alias .../static/dist/; gzip_static on;
+expires max; }`` serves the same files without touching Python.
+
+Until the first build (a fresh checkout) ``static_url`` serves the sources
+uncompiled and base.html falls back to Tailwind's in-browser compiler.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shlex
+import subprocess
+import tempfile
+
+from flask import Response, abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # optional: without it only .gz copies are written
+    brotli = None
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "assets")
+JS_BUNDLE = ("js/loader.js", "js/search.js", "js/icons.js")
+IMMUTABLE = "public, max-age=31536000, immutable"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = {"mtime": None, "files": {}}
+
+
+class BuildError(Exception):
+    pass
+
+
+def dist_dir(app=None):
+    app = app or current_app
+    return app.config.get("ASSETS_DIR") or os.path.join(app.static_folder, "dist")
+
+
+# ---------------- Build ----------------
+def _compile_css(cmd):
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "app.css")
+        args = shlex.split(cmd) + ["-c", os.path.join(SOURCE_DIR, "tailwind.config.js"),
+                                   "-i", os.path.join(SOURCE_DIR, "app.css"), "-o", out, "--minify"]
+        try:
+            subprocess.run(args, cwd=SOURCE_DIR, check=True, capture_output=True, timeout=300)
+        except FileNotFoundError:
+            raise BuildError(f"{args[0]!r} not found: install the Tailwind CLI or set TAILWIND_CMD") from None
+        except subprocess.CalledProcessError as exc:
+            raise BuildError(f"Tailwind failed: {exc.stderr.decode(errors='replace')[-2000:]}") from None
+        with open(out, "rb") as fh:
+            return fh.read()
+
+
+def _bundle_js():
+    parts = []
+    for name in JS_BUNDLE:
+        with open(os.path.join(SOURCE_DIR, name), "rb") as fh:
+            # each script keeps its own scope, as it had in its <script> tag
+            parts.append(b"(function(){\n" + fh.read().strip() + b"\n})();\n")
+    return b"".join(parts)
+
+
+def _write(directory, name, data):
+    stem, ext = os.path.splitext(name)
+    hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    path = os.path.join(directory, hashed)
+    with open(path, "wb") as fh:
+        fh.write(data)
+    # mtime=0 keeps the .gz identical from build to build
+    with open(path + ".gz", "wb") as fh:
+        fh.write(gzip.compress(data, 9, mtime=0))
+    if brotli is not None:
+        with open(path + ".br", "wb") as fh:
+            fh.write(brotli.compress(data, quality=11))
+    return hashed
+
+
+def build(app, clean=False):
+    """Compile and fingerprint the assets; returns the new manifest."""
+    directory = dist_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    files = {
+        "app.css": _write(directory, "app.css", _compile_css(app.config.get("TAILWIND_CMD", "tailwindcss"))),
+        "app.js": _write(directory, "app.js", _bundle_js()),
+    }
+    tmp = os.path.join(directory, "manifest.json.tmp")
+    with open(tmp, "w") as fh:
+        json.dump(files, fh, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(directory, "manifest.json"))
+    if clean:
+        keep = set(files.values()) | {"manifest.json"}
+        for name in os.listdir(directory):
+            if name.split(".gz")[0].split(".br")[0] not in keep:
+                os.remove(os.path.join(directory, name))
+    return files
+
+
+# ---------------- Lookup ----------------
+def manifest():
+    """{logical name: hashed file name} from the last build, or {}."""
+    path = os.path.join(dist_dir(), "manifest.json")
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if mtime != _manifest["mtime"]:
+        with open(path) as fh:
+            _manifest.update(files=json.load(fh), mtime=mtime)
+    return _manifest["files"]
+
+
+def built():
+    return bool(manifest())
+
+
+def static_url(name):
+    """URL of asset ``name`` ("app.css", "app.js"): the fingerprinted build
+    when there is one, else the uncompiled source."""
+    return url_for("asset", filename=manifest().get(name, name))
+
+
+# ---------------- Serving ----------------
+def _source(filename):
+    # development fallback before the first build: never cached
+    if filename == "app.css":
+        with open(os.path.join(SOURCE_DIR, "app.css"), "rb") as fh:
+            body = fh.read()
+    elif filename == "app.js":
+        body = _bundle_js()
+    else:
+        abort(404)
+    response = Response(body, mimetype=mimetypes.guess_type(filename)[0])
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def serve(filename):
+    directory = dist_dir()
+    if filename.endswith((".gz", ".br")) or filename == "manifest.json" \
+            or not os.path.isfile(os.path.join(directory, filename)):
+        return _source(filename)
+    mimetype = mimetypes.guess_type(filename)[0]
+    chosen, encoding = filename, None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings.quality(name) > 0 and os.path.isfile(os.path.join(directory, filename + suffix)):
+            chosen, encoding = filename + suffix, name
+            break
+    response = send_from_directory(directory, chosen, mimetype=mimetype, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def init_app(app):
+    app.add_url_rule("/assets/<path:filename>", "asset", serve)
+    app.add_template_global(static_url)
+    app.add_template_global(built, "assets_built")
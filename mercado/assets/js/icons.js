@@ -0,0 +1,3 @@
+// feather-icons (loaded with defer just before this bundle) swaps each
+// <i data-feather="..."> for its SVG
+feather.replace({ 'stroke-width': 1.5 });
@@ -0,0 +1,5 @@
+window.addEventListener("load", () => {
+  const loader = document.getElementById("loader");
+  loader.classList.add("fade-out");
+  setTimeout(() => loader.style.display = "none", 500);
+});
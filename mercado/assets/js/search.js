@@ -0,0 +1,42 @@
+// desktop and mobile headers each have a search box; wire up both
+document.querySelectorAll('#searchInput').forEach((searchInput) => {
+  const searchResults = searchInput.parentElement.querySelector('#searchResults');
+  let timer = null;
+
+  searchInput.addEventListener('input', function() {
+    const q = this.value.trim();
+    clearTimeout(timer);
+    if (q.length < 2) { searchResults.classList.add('hidden'); return; }
+
+    // debounce so fast typing sends one request, not one per keystroke
+    timer = setTimeout(() => {
+      fetch(`/api/search?q=${encodeURIComponent(q)}`)
+        .then(r => r.json())
+        .then(data => {
+          if (!data || !data.length) {
+            searchResults.innerHTML = `<div class="p-3 text-gray-500">No products found</div>`;
+            searchResults.classList.remove('hidden');
+            return;
+          }
+          searchResults.innerHTML = data.map(p => `
+            <a href="/p/${p.id}" class="flex items-center gap-3 p-3 hover:bg-gray-50 transition">
+              <picture class="flex-shrink-0">
+                ${p.srcset ? `<source type="image/webp" srcset="${p.srcset}" sizes="48px">` : ''}
+                <img src="${p.image}" alt="${p.title}" class="w-12 h-12 object-cover rounded">
+              </picture>
+              <div>
+                <div class="font-medium">${p.title}</div>
+                <div class="text-sm text-gray-500">₹${p.price}</div>
+              </div>
+            </a>
+          `).join('') + `<a href="/search?q=${encodeURIComponent(q)}" class="block p-3 text-sm text-blue-600 hover:bg-gray-50">See all results →</a>`;
+          searchResults.classList.remove('hidden');
+        })
+        .catch(()=>{ searchResults.classList.add('hidden'); });
+    }, 150);
+  });
+
+  document.addEventListener('click', (e) => {
+    if (!searchResults.contains(e.target) && e.target !== searchInput) searchResults.classList.add('hidden');
+  });
+});
@@ -0,0 +1,10 @@
+// `flask assets build` runs the Tailwind CLI with this file: only classes
+// that appear in the templates and scripts below end up in app.css
+module.exports = {
+  content: {
+    relative: true,
+    files: ["../templates/**/*.html", "./js/**/*.js"],
+  },
+  theme: { extend: {} },
+  plugins: [],
+};
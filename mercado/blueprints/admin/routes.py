@@ -1,14 +1,50 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import csv
+import io
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from flask import (Blueprint, render_template, redirect, url_for, flash, request, current_app, abort,
+                   Response, stream_with_context)
 from flask_login import login_required, current_user
-from ...extensions import db
-from ...models import Product, AdminSettings, Order
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+from ...extensions import db, cache
+from ...models import Product, AdminSettings, Order, OrderItem
+from ...pagination import ORDER_SORTS, InvalidCursor, keyset_page
 from ...forms import ProductForm, SettingsForm
-from ...config import Config
-from mercado.models import Category   # ⬅️ import category config
+from ... import catalog, images, inventory, search, stats, jobs, product_io, reports
 
 admin_bp = Blueprint('admin', __name__, template_folder='../../templates/admin')
 
 
+def _invalidate_product(pid, *category_ids):
+    """Drop cached pages showing product ``pid``: its detail page, its
+    category pages (old and new on a move) and the all-product listings."""
+    cids = {cid for cid in category_ids if cid}
+    cache.invalidate(f"product:{pid}", "listing", *(f"category:{cid}" for cid in cids))
+
+
+def _attach_upload(form, p):
+    """Store the picture uploaded with ``form`` as ``p``'s image. False
+    (after flashing why) when the file is not a usable image."""
+    upload = form.image_file.data
+    if not upload:
+        return True
+    try:
+        key, width, height = images.ingest(upload.read())
+    except images.ImageError as exc:
+        flash(f"Image not saved: {exc}.", "danger")
+        return False
+    images.attach(p, key, width, height)
+    # resized in the background; /media renders any copy not ready yet
+    images.prerender(key, width)
+    return True
+
+
+ORDER_STATUSES = ("Pending", "Paid", "Shipped", "Delivered", "Cancelled")
+
+
 def admin_required(fn):
     from functools import wraps
     @wraps(fn)
@@ -24,17 +60,13 @@ def admin_required(fn):
 @login_required
 @admin_required
 def dashboard():
-    stats = {
-        "products": Product.query.count(),
-        "orders": Order.query.count(),
-        "pending": Order.query.filter_by(status="Pending").count(),
-        "paid": Order.query.filter_by(status="Paid").count(),
-        "shipped": Order.query.filter_by(status="Shipped").count(),
-    }
     latest_orders = Order.query.order_by(Order.created_at.desc()).limit(8).all()
     latest_products = Product.query.order_by(Product.id.desc()).limit(8).all()
+    # counts and series come from the summary tables kept by stats.py
     return render_template("admin/dashboard.html",
-                           stats=stats,
+                           stats=stats.counters(),
+                           hourly=stats.series("h", 24),
+                           daily=stats.series("d", 30),
                            latest_orders=latest_orders,
                            latest_products=latest_products)
 
@@ -53,8 +85,8 @@ def products():
 def product_new():
     form = ProductForm()
 
-    # 🔥 populate category dropdown from Config
-    form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+    # 🔥 populate category dropdown from the category registry
+    form.category_id.choices = catalog.category_choices()
 
     if form.validate_on_submit():
         p = Product(
@@ -65,9 +97,15 @@ def product_new():
             image_url=form.image_url.data,
             is_featured=form.is_featured.data,
             category_id=form.category_id.data,   # ⬅️ save category
+            stock=form.stock.data,
         )
+        if not _attach_upload(form, p):
+            return render_template("admin/product_form.html", form=form, is_new=True)
         db.session.add(p)
+        db.session.flush()
+        search.index_product(p)
         db.session.commit()
+        _invalidate_product(p.id, p.category_id)
         flash("Product created.", "success")
         return redirect(url_for("admin.products"))
     return render_template("admin/product_form.html", form=form, is_new=True)
@@ -78,16 +116,37 @@ def product_new():
 @admin_required
 def product_edit(pid):
     p = Product.query.get_or_404(pid)
+    old_category_id = p.category_id
     form = ProductForm(obj=p)
 
     # 🔥 populate category dropdown again for editing
-    form.category_id.choices = [(c.id, c.name) for c in Category.query.all()]
+    form.category_id.choices = catalog.category_choices()
+
+    if not form.is_submitted():
+        form.stock_loaded.data = p.stock
 
     if form.validate_on_submit():
-        form.populate_obj(p)
+        # stock only changes through inventory.py, never by writing back the
+        # number this form loaded (sales since then would be undone)
+        for field in form:
+            if field.name not in ("stock", "stock_loaded", "image_file", "csrf_token", "submit"):
+                field.populate_obj(p, field.name)
         if form.discount_percent.data is None:
             p.discount_percent = 0
+        if not _attach_upload(form, p):
+            db.session.rollback()
+            return render_template("admin/product_form.html", form=form, is_new=False)
+        if not inventory.restock(p.id, form.stock_loaded.data, form.stock.data):
+            db.session.rollback()
+            current = db.session.get(Product, pid).stock
+            form.stock_loaded.data = current
+            flash(f"Stock tracking was changed by someone else (stock is now "
+                  f"{'untracked' if current is None else current}). Check it and save again.", "warning")
+            return render_template("admin/product_form.html", form=form, is_new=False)
+        db.session.flush()
+        search.index_product(p)
         db.session.commit()
+        _invalidate_product(p.id, p.category_id, old_category_id)
         flash("Product updated.", "success")
         return redirect(url_for("admin.products"))
     return render_template("admin/product_form.html", form=form, is_new=False)
@@ -98,12 +157,105 @@ def product_edit(pid):
 @admin_required
 def product_delete(pid):
     p = Product.query.get_or_404(pid)
+    category_id = p.category_id
     db.session.delete(p)
+    search.remove_product(pid)
     db.session.commit()
+    _invalidate_product(pid, category_id)
     flash("Product deleted.", "success")
     return redirect(url_for("admin.products"))
 
 
+@admin_bp.route("/products/export.<fmt>")
+@login_required
+@admin_required
+def products_export(fmt):
+    if fmt not in ("csv", "jsonl"):
+        abort(404)
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    # streamed in keyset batches; the whole file never sits in memory
+    return Response(stream_with_context(product_io.export_products(fmt)), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=products.{fmt}"})
+
+
+@admin_bp.route("/products/import", methods=["POST"])
+@login_required
+@admin_required
+def products_import():
+    upload = request.files.get("file")
+    if not upload or not upload.filename:
+        flash("Choose a CSV or JSONL file to import.", "warning")
+        return redirect(url_for("admin.products"))
+    fmt = product_io.guess_format(upload.filename)
+
+    # big files go to the job queue instead of holding this request
+    size = request.content_length or 0
+    if size > current_app.config.get("IMPORT_INLINE_MAX_BYTES", 2 * 1024 * 1024):
+        folder = os.path.join(current_app.instance_path, "imports")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{uuid.uuid4().hex}.{fmt}")
+        upload.save(path)
+        jobs.enqueue("catalog.import", {"path": path, "fmt": fmt})
+        db.session.commit()
+        flash("Import queued; products will appear as the worker processes the file.", "success")
+        return redirect(url_for("admin.products"))
+
+    stream = io.TextIOWrapper(upload.stream, encoding="utf-8-sig", newline="")
+    result = product_io.import_products(product_io.read_rows(stream, fmt))
+    msg = f"Imported: {result.created} created, {result.updated} updated, {result.error_count} rejected."
+    if result.errors:
+        first = result.errors[0]
+        msg += f" First error on line {first.line}: {first.errors}"
+    flash(msg, "warning" if result.error_count else "success")
+    return redirect(url_for("admin.products"))
+
+
+# ---------------- Reports ----------------
+def _report_filters():
+    try:
+        filters = {
+            "date_from": reports.parse_date(request.args.get("date_from", "").strip()),
+            "date_to": reports.parse_date(request.args.get("date_to", "").strip()),
+        }
+    except ValueError:
+        abort(400)
+    filters["statuses"] = [s for s in request.args.getlist("status") if s]
+    return filters
+
+
+@admin_bp.route("/reports")
+@login_required
+@admin_required
+def reports_index():
+    filters = _report_filters()
+    gst = reports.gst_summary(**filters) if request.args.get("run") else None
+    return render_template("admin/reports.html", gst=gst, statuses=(*ORDER_STATUSES, "cashondelivery"),
+                           selected=filters["statuses"], formats=reports.FORMATS)
+
+
+@admin_bp.route("/reports/orders.<fmt>")
+@login_required
+@admin_required
+def reports_orders(fmt):
+    if fmt not in reports.FORMATS:
+        abort(404)
+    ext, mimetype = ("jsonl", "application/x-ndjson") if fmt == "jsonl" else ("csv", "text/csv")
+    return Response(stream_with_context(reports.export_orders(fmt, **_report_filters())), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=orders-{fmt}.{ext}"})
+
+
+@admin_bp.route("/reports/gst.csv")
+@login_required
+@admin_required
+def reports_gst_csv():
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=reports.GST_FIELDS)
+    writer.writeheader()
+    writer.writerows(reports.gst_summary(**_report_filters()))
+    return Response(buf.getvalue(), mimetype="text/csv",
+                    headers={"Content-Disposition": "attachment; filename=gst-summary.csv"})
+
+
 @admin_bp.route("/settings", methods=["GET", "POST"])
 @login_required
 @admin_required
@@ -126,15 +278,71 @@ def settings():
 @login_required
 @admin_required
 def orders():
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template("admin/orders.html", orders=orders)
+    f = {k: request.args.get(k, "").strip() for k in ("status", "email", "pincode", "date_from", "date_to")}
+    query = _filter_orders(Order.query, f)
+
+    sort = request.args.get("sort")
+    if sort not in ORDER_SORTS:
+        sort = "newest"
+    per_page = current_app.config.get("ADMIN_ORDERS_PER_PAGE", 50)
+    try:
+        page = keyset_page(query, ORDER_SORTS[sort], request.args.get("after"), per_page)
+    except InvalidCursor:
+        abort(400)
+
+    # item counts for this page in one grouped query
+    ids = [o.id for o in page.items]
+    counts = dict(db.session.execute(
+        select(OrderItem.order_id, func.sum(OrderItem.quantity))
+        .where(OrderItem.order_id.in_(ids)).group_by(OrderItem.order_id)
+    ).all()) if ids else {}
+    # totals over everything matching the filters: the running counters
+    # when unfiltered, else a COUNT/SUM over at most SUMMARY_LIMIT matches,
+    # so neither costs a scan of the whole order table per page
+    if any(f.values()):
+        limit = current_app.config.get("ADMIN_ORDERS_SUMMARY_LIMIT", 10000)
+        matched = _filter_orders(db.session.query(Order.total_paise), f).limit(limit + 1).subquery()
+        count, total = db.session.query(func.count(), func.sum(matched.c.total_paise)).one()
+        summary = {"orders": min(count, limit), "paise": total or 0, "capped": count > limit}
+    else:
+        totals = stats.counters()
+        summary = {"orders": totals["orders"], "paise": totals["orders_paise"], "capped": False}
+
+    args = {k: v for k, v in f.items() if v}
+    next_url = url_for("admin.orders", sort=sort, after=page.next_cursor, **args) if page.next_cursor else None
+    return render_template("admin/orders.html", orders=page.items, counts=counts, summary=summary,
+                           filters=f, sort=sort, sorts=list(ORDER_SORTS), statuses=(*ORDER_STATUSES, "cashondelivery"),
+                           next_url=next_url, first_url=url_for("admin.orders", sort=sort, **args),
+                           is_first=not request.args.get("after"))
+
+
+def _filter_orders(query, f):
+    if f["status"]:
+        query = query.filter(Order.status == f["status"])
+    if f["email"]:
+        query = query.filter(Order.customer_email == f["email"])
+    if f["pincode"]:
+        query = query.filter(Order.pincode == f["pincode"])
+    if f["date_from"]:
+        query = query.filter(Order.created_at >= _parse_date(f["date_from"]))
+    if f["date_to"]:
+        # inclusive of the whole "to" day
+        query = query.filter(Order.created_at < _parse_date(f["date_to"]) + timedelta(days=1))
+    return query
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        abort(400)
 
 
 @admin_bp.route("/orders/<int:oid>")
 @login_required
 @admin_required
 def order_detail(oid):
-    order = Order.query.get_or_404(oid)
+    order = Order.query.options(selectinload(Order.items)).filter_by(id=oid).first_or_404()
     return render_template("admin/order_detail.html", order=order)
 
 
@@ -144,8 +352,10 @@ def order_detail(oid):
 def order_status(oid):
     order = Order.query.get_or_404(oid)
     new_status = request.form.get("status")
-    if new_status in {"Pending", "Paid", "Shipped", "Delivered", "Cancelled"}:
+    if new_status in ORDER_STATUSES:
         order.status = new_status
+        # keeps payments.reconcile_pending off orders cancelled by hand
+        order.cancel_reason = "admin" if new_status == "Cancelled" else None
         db.session.commit()
         flash("Status updated.", "success")
     return redirect(url_for("admin.order_detail", oid=oid))
@@ -155,5 +365,5 @@ def order_status(oid):
 @login_required
 @admin_required
 def order_print(oid):
-    order = Order.query.get_or_404(oid)
+    order = Order.query.options(selectinload(Order.items)).filter_by(id=oid).first_or_404()
     return render_template("admin/order_print.html", order=order)
@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from ...extensions import db
 from ...models import User
 from ...forms import LoginForm, RegisterForm
+from ... import identity, carts
 auth_bp = Blueprint('auth', __name__, template_folder='../../templates/auth')
 
 @auth_bp.route("/login", methods=["GET","POST"])
@@ -12,7 +13,9 @@ def login():
     if form.validate_on_submit():
         u = User.query.filter_by(email=form.email.data.lower()).first()
         if u and u.check_password(form.password.data):
-            login_user(u, remember=form.remember.data); return redirect(url_for("shop.home"))
+            login_user(u, remember=form.remember.data); identity.remember(u)
+            carts.merge_visitor(u.id)
+            return redirect(url_for("shop.home"))
         flash("Invalid email or password", "danger")
     return render_template("auth/login.html", form=form)
 
@@ -42,4 +45,4 @@ def register():
 
 @auth_bp.route("/logout")
 @login_required
-def logout(): logout_user(); return redirect(url_for("shop.home"))
+def logout(): logout_user(); identity.forget(); return redirect(url_for("shop.home"))
@@ -1,10 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, jsonify
+import secrets
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, abort
 from flask_login import login_required, current_user
-from ...extensions import db
-from ...models import Product, AdminSettings, Order, OrderItem, Category
+from sqlalchemy import insert, literal, select, union_all
+from sqlalchemy.exc import IntegrityError
+from ...extensions import db, cache
+from ...models import Product, Order, OrderItem, Category, ON_SALE
 from ...forms import AddressForm
-import razorpay
+from ... import catalog, images, search, payments, jobs, carts, inventory, pricing, metrics
+from ...pagination import PRODUCT_SORTS, InvalidCursor, keyset_page
 from ...config import Config
+from ...database import read_only
 
 shop_bp = Blueprint('shop', __name__, template_folder='../../templates/shop')
 
@@ -12,18 +17,13 @@ from datetime import datetime
 
 @shop_bp.app_context_processor
 def inject_counts_and_globals():
-    cart = session.get("cart", {}) or {}
-    # sum of quantities in cart, not just number of distinct items
-    try:
-        cart_count = sum(int(q) for q in cart.values())
-    except Exception:
-        cart_count = 0
-
-    wishlist = session.get("wishlist", []) or []
-    wishlist_count = len(wishlist)
+    # counts come from the cached basket snapshot, not a query per render
+    basket = carts.get()
+    cart_count = basket.cart_count
+    wishlist_count = len(basket.wishlist)
 
-    # optional: categories & current year available to all templates
-    categories = Category.query.order_by(Category.name.asc()).all()
+    # categories come from the cached registry, not a query per render
+    categories = catalog.categories()
     current_year = datetime.utcnow().year
 
     return {
@@ -38,41 +38,109 @@ def inject_counts_and_globals():
 def inr(amount):
     return f"₹{amount:,.2f}"
 
-def _cart():
-    return session.get("cart", {})
+@shop_bp.app_template_filter('paise')
+def paise(amount):
+    """Integer paise as rupees, exactly: 123450 -> ₹1,234.50."""
+    amount = amount or 0
+    sign = "-" if amount < 0 else ""
+    return f"{sign}₹{abs(amount) // 100:,}.{abs(amount) % 100:02d}"
+
+def _price_range(query):
+    """Apply ?min_price= / ?max_price= on the stored selling price."""
+    lo = request.args.get("min_price", type=float)
+    hi = request.args.get("max_price", type=float)
+    if lo is not None:
+        query = query.filter(Product.sale_price >= lo)
+    if hi is not None:
+        query = query.filter(Product.sale_price <= hi)
+    return query
+
+# query parameters _paged reads; the cache keys listing pages on these
+LISTING_ARGS = ("sort", "after", "format", "min_price", "max_price")
+
+def _paged(query, template, partial="shop/_cards.html", sorts=PRODUCT_SORTS, keep=(), **context):
+    """Render one keyset page of ``query``; ``?format=json`` returns the next
+    batch of cards for infinite scroll instead of the full page. ``keep``
+    names the view's own query parameters to carry over to the next page."""
+    sort = request.args.get("sort")
+    if sort not in sorts:
+        sort = "newest"
+    per_page = current_app.config.get("PRODUCTS_PER_PAGE", 24)
+    try:
+        page = keyset_page(query, sorts[sort], request.args.get("after"), per_page)
+    except InvalidCursor:
+        abort(400)
+
+    next_url = None
+    # only parameters the page is cached on, never arbitrary ones
+    args = {k: request.args[k] for k in (*keep, "sort", "min_price", "max_price") if k in request.args}
+    if page.next_cursor:
+        next_url = url_for(request.endpoint, **request.view_args, **args, after=page.next_cursor)
+
+    if request.args.get("format") == "json":
+        return jsonify({
+            "items": [{
+                "id": p.id,
+                "title": p.title,
+                "price": p.price,
+                "sale_price": p.sale_price,
+                "discount_percent": p.discount_percent or 0,
+                "url": url_for("shop.product_detail", pid=p.id),
+            } for p in page.items],
+            "html": render_template(partial, products=page.items),
+            "next": next_url,
+        })
+    return render_template(template, products=page.items, partial=partial,
+                           next_url=next_url, sort=sort, listing_args=args, **context)
 
 # ---------------- Home ----------------
+HOME_SECTIONS = ("featured", "sale", "latest")
+
+def _home_products(limit=8):
+    """Featured, sale and latest products in one UNION ALL round trip."""
+    branches = {
+        "featured": Product.query.filter_by(is_featured=True),
+        "sale": Product.query.filter(ON_SALE),
+        "latest": Product.query,
+    }
+    # each branch is wrapped in a subquery so it can keep its own ORDER BY/LIMIT
+    picks = union_all(*[
+        select(q.order_by(Product.id.desc()).limit(limit).subquery().c.id,
+               literal(name).label("section"))
+        for name, q in branches.items()
+    ]).subquery()
+    rows = db.session.execute(
+        select(Product, picks.c.section)
+        .join(picks, Product.id == picks.c.id)
+        .order_by(Product.id.desc())
+    ).all()
+    sections = {name: [] for name in HOME_SECTIONS}
+    for p, section in rows:
+        sections[section].append(p)
+    return sections
+
 @shop_bp.route("/")
+@cache.cached(tags=["listing", "catalog:settings"])
+@read_only
 def home():
-    settings = AdminSettings.query.first()
-    if not settings:
-        settings = AdminSettings()
-        db.session.add(settings)
-        db.session.commit()
-
-    featured = Product.query.filter_by(is_featured=True).order_by(Product.id.desc()).limit(8).all()
-    sale = Product.query.filter(Product.discount_percent > 0).order_by(Product.id.desc()).limit(8).all()
-    latest = Product.query.order_by(Product.id.desc()).limit(8).all()
-
-    categories = Category.query.order_by(Category.name.asc()).all()
-    return render_template(
-        "shop/home.html",
-        settings=settings,
-        featured=featured,
-        sale=sale,
-        latest=latest,
-        categories=categories
-    )
+    # settings and categories come from the catalog registry; the carousels
+    # are a {% cache %} fragment that only calls load_sections on a miss, so
+    # a warm hit runs no catalog queries even for logged-in visitors
+    return render_template("shop/home.html", settings=catalog.settings(), load_sections=_home_products)
 
 # ---------------- Category Page ----------------
 @shop_bp.route("/category/<int:cid>")
+@cache.cached(tags=lambda cid: [f"category:{cid}"], query=LISTING_ARGS)
+@read_only
 def category(cid):
-    category = Category.query.get_or_404(cid)
-    products = Product.query.filter_by(category_id=cid).all()
-    return render_template("shop/category.html", category=category, products=products)
+    category = catalog.category(cid) or abort(404)
+    query = _price_range(Product.query.filter_by(category_id=cid))
+    return _paged(query, "shop/category.html", category=category)
 
 # ---------------- Product Detail ----------------
 @shop_bp.route("/p/<int:pid>")
+@cache.cached(tags=lambda pid: [f"product:{pid}"])
+@read_only
 def product_detail(pid):
     p = Product.query.get_or_404(pid)
     return render_template("shop/product_detail.html", p=p)
@@ -80,11 +148,8 @@ def product_detail(pid):
 # ---------------- Cart ----------------
 @shop_bp.route("/cart")
 def view_cart():
-    ids = [int(k) for k in _cart().keys()]
-    products = Product.query.filter(Product.id.in_(ids)).all() if ids else []
-    items, total, qmap = [], 0.0, {int(k): int(v) for k, v in _cart().items()}
-    for p in products:
-        qty = qmap.get(p.id, 1)
+    items, total = [], 0.0
+    for p, qty in carts.lines():
         price = p.sale_price * qty
         items.append((p, qty, price))
         total += price
@@ -92,9 +157,13 @@ def view_cart():
 
 @shop_bp.route("/add_to_cart/<int:pid>")
 def add_to_cart(pid):
-    cart = _cart()
-    cart[str(pid)] = cart.get(str(pid), 0) + 1
-    session["cart"] = cart
+    if db.session.get(Product, pid) is None:
+        abort(404)
+    try:
+        carts.add(pid)
+    except inventory.OutOfStock as exc:
+        flash(f"Sorry, only {exc.available} left in stock." if exc.available else "Sorry, this item is out of stock.", "warning")
+        return redirect(request.referrer or url_for("shop.product_detail", pid=pid))
     flash("Added to cart.", "success")
     return redirect(request.referrer or url_for("shop.view_cart"))
 
@@ -103,61 +172,83 @@ def update_cart():
     cart = {}
     for key, val in request.form.items():
         if key.startswith("qty_"):
-            pid = key.split("_", 1)[1]
+            try:
+                pid = int(key.split("_", 1)[1])
+            except ValueError:
+                continue
             try:
                 qty = max(0, int(val))
             except:
                 qty = 1
-            if qty > 0:
-                cart[pid] = qty
-    session["cart"] = cart
-    flash("Cart updated.", "success")
+            cart[pid] = qty
+    if carts.set_quantities(cart):
+        flash("Some quantities were reduced to the stock we have left.", "warning")
+    else:
+        flash("Cart updated.", "success")
     return redirect(url_for("shop.view_cart"))
 
 @shop_bp.route("/remove_from_cart/<int:pid>")
 def remove_from_cart(pid):
-    cart = _cart()
-    cart.pop(str(pid), None)
-    session["cart"] = cart
+    carts.remove(pid)
     flash("Removed.", "success")
     return redirect(url_for("shop.view_cart"))
 
 # ---------------- Wishlist ----------------
 @shop_bp.route("/wishlist")
 def wishlist():
-    ids = [int(x) for x in session.get("wishlist", [])]
-    products = Product.query.filter(Product.id.in_(ids)).all() if ids else []
-    return render_template("shop/wishlist.html", products=products)
+    return _paged(carts.wishlist_query(), "shop/wishlist.html", partial="shop/_wishlist_cards.html")
 
 @shop_bp.route("/toggle_wishlist/<int:pid>")
 def toggle_wishlist(pid):
-    wl = set(session.get("wishlist", []))
-    if pid in wl:
-        wl.remove(pid)
-        flash("Removed from wishlist.", "success")
-    else:
-        wl.add(pid)
+    if db.session.get(Product, pid) is None:
+        abort(404)
+    if carts.toggle_wishlist(pid):
         flash("Added to wishlist.", "success")
-    session["wishlist"] = list(wl)
+    else:
+        flash("Removed from wishlist.", "success")
     return redirect(request.referrer or url_for("shop.wishlist"))
 
 # ---------------- Checkout ----------------
+def _already_placed(order):
+    """A checkout form submitted again (double click, retried POST) gets the
+    order it already placed instead of a second one."""
+    key_id, key_secret = payments.keys()
+    if order.status == "Pending" and key_id and key_secret:
+        return render_template("shop/pay_razorpay.html", order=order, key_id=key_id)
+    return redirect(url_for("shop.order_success", oid=order.id))
+
+def _placed_with(key):
+    return Order.query.filter_by(idempotency_key=key, user_id=current_user.id).first() if key else None
+
 @shop_bp.route("/checkout", methods=["GET", "POST"])
 @login_required
 def checkout():
-    cart = _cart()
-    if not cart:
+    form = AddressForm()
+    if request.method == "POST":
+        placed = _placed_with(form.idempotency_key.data)
+        if placed:
+            return _already_placed(placed)
+
+    lines = carts.lines()
+    if not lines:
         flash("Your cart is empty.", "warning")
         return redirect(url_for("shop.home"))
 
-    ids = [int(k) for k in cart.keys()]
-    products = Product.query.filter(Product.id.in_(ids)).all()
-    qmap = {int(k): int(v) for k, v in cart.items()}
-    total = sum(p.sale_price * qmap.get(p.id, 1) for p in products)
+    prices = {p.id: pricing.to_paise(p.sale_price) for p, _ in lines}
+    total = sum(prices[p.id] * qty for p, qty in lines)
+    form.idempotency_key.data = form.idempotency_key.data or secrets.token_urlsafe(16)
 
-    form = AddressForm()
     if form.validate_on_submit():
         payment_method = request.form.get("payment_method")  # NEW
+        key_id, key_secret = payments.keys()
+        # online payments keep the units held until the payment arrives
+        online = payment_method != "cod" and key_id and key_secret
+        if payment_method == "cod":
+            status = "cashondelivery"
+        else:
+            # fallback if Razorpay keys not set: the order counts as paid
+            status = "Pending" if online else "Paid"
+
         order = Order(
             user_id=current_user.id,
             customer_name=form.customer_name.data,
@@ -168,53 +259,70 @@ def checkout():
             city=form.city.data,
             state=form.state.data,
             pincode=form.pincode.data,
-            total_amount=total,
-            status="Pending"
+            total_paise=total,
+            status=status,
+            idempotency_key=form.idempotency_key.data,
         )
         db.session.add(order)
-        db.session.flush()
-
-        for p in products:
-            qty = qmap.get(p.id, 1)
-            db.session.add(OrderItem(
-                order_id=order.id,
-                product_id=p.id,
-                product_title=p.title,
-                quantity=qty,
-                price_each=p.sale_price
-            ))
-
-        # ----------- Handle COD -----------
-        if payment_method == "cod":
-            order.status = "cashondelivery"
-            db.session.commit()
-            session["cart"] = {}
-            flash("Your order has been placed with Cash on Delivery!", "success")
-            return redirect(url_for("shop.order_success", oid=order.id))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            # the same form, submitted twice at once: the other request won
+            db.session.rollback()
+            placed = _placed_with(form.idempotency_key.data)
+            metrics.inc("swiftcart_checkouts_total", outcome="duplicate")
+            return _already_placed(placed) if placed else abort(409)
+
+        # one executemany however many lines the order has
+        db.session.execute(insert(OrderItem), [
+            {"order_id": order.id, "product_id": p.id, "product_title": p.title,
+             "quantity": qty, "price_each_paise": prices[p.id]}
+            for p, qty in lines
+        ])
+        try:
+            inventory.allocate(carts.owner(), order, lines,
+                               pay_within=current_app.config.get("PAYMENT_HOLD_SECONDS", 900) if online else None)
+        except inventory.OutOfStock:
+            db.session.rollback()
+            metrics.inc("swiftcart_checkouts_total", outcome="out_of_stock")
+            flash("Some items in your cart just sold out. Please review your cart.", "warning")
+            return redirect(url_for("shop.view_cart"))
 
         # ----------- Handle Online -----------
-        settings = AdminSettings.query.first()
-        key_id = (settings.razorpay_key_id if settings else None) or current_app.config.get("RAZORPAY_KEY_ID", "")
-        key_secret = (settings.razorpay_key_secret if settings else None) or current_app.config.get("RAZORPAY_KEY_SECRET", "")
-
-        if key_id and key_secret:
-            client = razorpay.Client(auth=(key_id, key_secret))
-            rzp_order = client.order.create({
-                "amount": int(total * 100),
-                "currency": "INR",
-                "payment_capture": 1,
-                "receipt": f"order_{order.id}"
-            })
-            order.razorpay_order_id = rzp_order.get("id")
+        if online:
+            # commit the Pending order and its holds before calling the
+            # gateway: the stock UPDATEs above lock the product rows (the
+            # whole database on SQLite) until the transaction ends, and a
+            # slow gateway must not hold up every other checkout
             db.session.commit()
+            if current_app.config.get("PAYMENT_ASYNC"):
+                # the payment page polls shop.payment_status until it is ready
+                payments.create_gateway_order_async(order, key_id, key_secret)
+            else:
+                try:
+                    payments.create_gateway_order(order, key_id, key_secret)
+                except payments.GatewayError as exc:
+                    db.session.rollback()
+                    current_app.logger.warning("payment gateway unavailable: %s", exc)
+                    payments.gateway_order_failed(order, exc)
+                    metrics.inc("swiftcart_checkouts_total", outcome="gateway_error")
+                    flash("The payment gateway is not responding. Please try again in a moment.", "danger")
+                    # that order is cancelled; submitting again places a new one
+                    form.idempotency_key.data = secrets.token_urlsafe(16)
+                    return render_template("shop/checkout.html", form=form, total=total)
+            metrics.inc("swiftcart_checkouts_total", outcome="online")
             return render_template("shop/pay_razorpay.html", order=order, key_id=key_id)
+
+        # ----------- Handle COD / no gateway -----------
+        jobs.enqueue("order.placed", {"order_id": order.id}, key=f"order.placed:{order.id}")
+        db.session.commit()
+        carts.clear()
+        metrics.inc("swiftcart_checkouts_total", outcome="cod" if payment_method == "cod" else "no_gateway")
+        if payment_method == "cod":
+            flash("Your order has been placed with Cash on Delivery!", "success")
         else:
-            # fallback if Razorpay keys not set
-            order.status = "Paid"
-            db.session.commit()
-            session["cart"] = {}
             flash("Order placed successfully.", "success")
-            return redirect(url_for("shop.order_success", oid=order.id))
+        return redirect(url_for("shop.order_success", oid=order.id))
 
     return render_template("shop/checkout.html", form=form, total=total)
 
@@ -227,50 +335,99 @@ def order_success(oid):
 
 @shop_bp.route("/payment/callback", methods=["POST"])
 def payment_callback():
-    oid = request.form.get("oid")
+    oid = request.form.get("oid", type=int)
+    order = db.session.get(Order, oid) if oid else None
+    if order is None:
+        return "OK", 200
     payment_id = request.form.get("razorpay_payment_id")
-    order = Order.query.get(int(oid)) if oid else None
-    if order:
-        order.razorpay_payment_id = payment_id
-        order.status = "Paid"
-        db.session.commit()
-        session["cart"] = {}
+    # only the gateway can produce this signature, so a forged or replayed
+    # form cannot mark an order paid; the webhook settles anything missed here
+    if not payments.verify_payment(order.razorpay_order_id, payment_id,
+                                   request.form.get("razorpay_signature"), payments.keys()[1]):
+        current_app.logger.warning("payment callback for #%s failed signature check", order.id)
+        metrics.inc("swiftcart_payments_total", outcome="bad_signature", via="callback")
+        flash("We could not confirm your payment yet. It will show up on your order once the gateway confirms it.", "warning")
         return redirect(url_for("shop.order_success", oid=order.id))
-    return "OK", 200
+    payments.mark_paid(order, payment_id)
+    db.session.commit()
+    if order.user_id:
+        carts.clear(f"u:{order.user_id}")
+    return redirect(url_for("shop.order_success", oid=order.id))
+
+@shop_bp.route("/payments/webhook", methods=["POST"])
+def payment_webhook():
+    body = request.get_data()
+    if not payments.verify_webhook(body, request.headers.get("X-Razorpay-Signature")):
+        abort(400)
+    # the gateway retries until it gets a 2xx: record and queue, nothing slower
+    payments.record_event(body, request.headers.get("X-Razorpay-Event-Id"))
+    return "", 204
+
+@shop_bp.route("/payment/status/<int:oid>")
+@login_required
+def payment_status(oid):
+    order = Order.query.get_or_404(oid)
+    if order.user_id != current_user.id:
+        abort(404)
+    return jsonify(payments.order_status(order))
+
+# ---------------- Search ----------------
+def _ranked_products(ids):
+    by_id = {p.id: p for p in Product.query.filter(Product.id.in_(ids)).all()} if ids else {}
+    return [by_id[i] for i in ids if i in by_id]
 
-# ---------------- API Search ----------------
 @shop_bp.route('/api/search')
+@read_only
 def api_search():
     query = request.args.get('q', '').strip()
     results = []
     if query:
-        products = Product.query.filter(Product.title.ilike(f"%{query}%")).limit(8).all()
+        products = _ranked_products(search.search(query, limit=8))
         results = [{
             "id": p.id,
             "title": p.title,
             "price": p.price,
-            "image": p.image_url or f"https://picsum.photos/seed/{p.id}/100/100"
+            # 48px thumbnails: 100px covers 2x screens
+            "image": images.image_src(p, 100),
+            "srcset": images.image_srcset(p, "webp"),
         } for p in products]
     return jsonify(results)
 
+SEARCH_MAX_PAGE = 100
+
+@shop_bp.route("/search")
+@read_only
+def search_results():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    if page > SEARCH_MAX_PAGE:
+        # nobody pages this deep; a huge offset overflows the database's integers
+        abort(400)
+    per_page = 24
+    # fetch one extra id to know whether a next page exists
+    ids = search.search(query, limit=per_page + 1, offset=(page - 1) * per_page) if query else []
+    products = _ranked_products(ids[:per_page])
+    return render_template("shop/search.html", q=query, products=products,
+                           page=page, has_next=len(ids) > per_page)
+
 @shop_bp.route("/policies")
 def policies():
     return render_template("shop/policies.html")
 
 # ---------------- All Products Page ----------------
 @shop_bp.route("/shop")
+@cache.cached(tags=["listing"], query=("filter", *LISTING_ARGS))
+@read_only
 def shop_all():
     filter_type = request.args.get("filter")
+    query = _price_range(Product.query)
 
     if filter_type == "sale":
-        products = Product.query.filter(Product.discount_percent > 0).order_by(Product.id.desc()).all()
+        query = query.filter(ON_SALE)
         title = "Hot Deals"
     elif filter_type == "new":
-        products = Product.query.order_by(Product.id.desc()).all()
         title = "Fresh Arrivals"
     else:
-        products = Product.query.order_by(Product.id.desc()).all()
         title = "All Products"
 
-    return render_template("shop/shop_all.html", products=products, title=title)
-
+    return _paged(query, "shop/shop_all.html", keep=("filter",), title=title)
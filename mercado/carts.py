@@ -0,0 +1,210 @@
+"""Server-side carts and wishlists.
+
+Lines live in the cart_item / wishlist_item tables, keyed by an owner string:
+"u:<user id>" for signed-in users, "a:<token>" for visitors, whose session
+only carries the short token. The cookie therefore stays the same size
+however big the cart gets, and a user's cart follows them across devices.
+Each owner's contents and counts are kept in the cache (``basket:<owner>``),
+so the header counts on every page cost a cache read, not a query. Writes
+go to the database and then replace the cached snapshot. Quantities of
+stock-tracked products are held for the cart through inventory.py.
+"""
+import secrets
+from collections import namedtuple
+
+from flask import current_app, session
+from flask_login import current_user
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from .extensions import db, cache
+from .models import CartItem, Product, WishlistItem
+from . import inventory
+
+Basket = namedtuple("Basket", "items wishlist cart_count")  # {pid: qty}, (pid, ...), total qty
+
+_EMPTY = Basket({}, (), 0)
+
+
+def owner(create=False):
+    """The current visitor's owner key, or None for a visitor with nothing stored."""
+    if current_user.is_authenticated:
+        return f"u:{current_user.id}"
+    token = session.get("basket")
+    if token is None and create:
+        token = session["basket"] = secrets.token_urlsafe(12)
+    return f"a:{token}" if token else None
+
+
+def _key(who):
+    return f"basket:{who}"
+
+
+def _load(who):
+    items = dict(db.session.execute(
+        select(CartItem.product_id, CartItem.quantity).where(CartItem.owner == who)).all())
+    wishlist = tuple(db.session.execute(
+        select(WishlistItem.product_id).where(WishlistItem.owner == who)
+        .order_by(WishlistItem.id)).scalars())
+    return Basket(items, wishlist, sum(items.values()))
+
+
+def _ttl():
+    return current_app.config.get("BASKET_CACHE_TTL", 300)
+
+
+def get(who=None):
+    who = who or owner()
+    if who is None:
+        return _EMPTY
+    return cache.get_or_set(_key(who), lambda: _load(who), ttl=_ttl())
+
+
+def _refresh(who):
+    cache.set(_key(who), _load(who), ttl=_ttl())
+
+
+# ---------------- Cart ----------------
+def lines(who=None):
+    """[(product, quantity)] for the cart, products and quantities in one query."""
+    who = who or owner()
+    if who is None:
+        return []
+    return db.session.execute(
+        select(Product, CartItem.quantity)
+        .join(CartItem, CartItem.product_id == Product.id)
+        .where(CartItem.owner == who)
+        .order_by(CartItem.id)
+    ).all()
+
+
+def add(pid, qty=1):
+    """Add ``qty`` of ``pid``; raises inventory.OutOfStock (nothing changed)."""
+    who = owner(create=True)
+    for retry in (True, False):
+        row = CartItem.query.filter_by(owner=who, product_id=pid).first()
+        try:
+            inventory.hold(who, pid, (row.quantity if row else 0) + qty)
+        except inventory.OutOfStock:
+            db.session.rollback()
+            raise
+        if row is None:
+            db.session.add(CartItem(owner=who, product_id=pid, quantity=qty))
+        else:
+            # added in SQL, so two adds at once both count
+            row.quantity = CartItem.quantity + qty
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # a concurrent add (a double click) inserted the line first:
+            # undo the hold too and add to their line instead
+            db.session.rollback()
+            if not retry:
+                raise
+    _refresh(who)
+
+
+def set_quantities(quantities):
+    """Replace the cart with ``{pid: qty}``; zero quantities drop the line.
+    Lines are cut down to the stock left; returns {pid: quantity kept} for those."""
+    who = owner(create=True)
+    rows = {r.product_id: r for r in CartItem.query.filter_by(owner=who)}
+    short = {}
+    for pid, qty in sorted(quantities.items()):
+        row = rows.pop(pid, None)
+        if qty > 0:
+            held = inventory.hold(who, pid, qty, partial=True)
+            if held < qty:
+                short[pid] = qty = held
+        if qty <= 0:
+            if row is not None:
+                db.session.delete(row)
+        elif row is None:
+            db.session.add(CartItem(owner=who, product_id=pid, quantity=qty))
+        elif row.quantity != qty:
+            row.quantity = qty
+    for row in rows.values():
+        db.session.delete(row)
+    inventory.release(who, [pid for pid, qty in quantities.items() if qty <= 0] + list(rows))
+    db.session.commit()
+    _refresh(who)
+    return short
+
+
+def remove(pid):
+    who = owner()
+    if who is None:
+        return
+    db.session.execute(delete(CartItem).where(CartItem.owner == who, CartItem.product_id == pid))
+    inventory.release(who, [pid])
+    db.session.commit()
+    _refresh(who)
+
+
+def clear(who=None):
+    """Empty the cart, returning any units it still holds."""
+    who = who or owner()
+    if who is None:
+        return
+    db.session.execute(delete(CartItem).where(CartItem.owner == who))
+    inventory.release(who)
+    db.session.commit()
+    _refresh(who)
+
+
+# ---------------- Wishlist ----------------
+def wishlist_query(who=None):
+    """Products on the wishlist, as a query the listing helpers can page."""
+    who = who or owner()
+    return Product.query.join(WishlistItem, WishlistItem.product_id == Product.id) \
+        .filter(WishlistItem.owner == (who or ""))
+
+
+def toggle_wishlist(pid):
+    """Add or remove ``pid``; returns True if it is now on the wishlist."""
+    who = owner(create=True)
+    removed = db.session.execute(
+        delete(WishlistItem).where(WishlistItem.owner == who, WishlistItem.product_id == pid)).rowcount
+    if not removed:
+        db.session.add(WishlistItem(owner=who, product_id=pid))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # a concurrent toggle added it first; it is on the wishlist either way
+        db.session.rollback()
+    _refresh(who)
+    return not removed
+
+
+# ---------------- Login ----------------
+def merge_visitor(user_id):
+    """Move the visitor's cart and wishlist onto ``user_id`` after login."""
+    token = session.pop("basket", None)
+    if not token:
+        return
+    visitor, user = f"a:{token}", f"u:{user_id}"
+    theirs = _load(visitor)
+    if theirs.items or theirs.wishlist:
+        mine = {r.product_id: r for r in CartItem.query.filter_by(owner=user)}
+        # the visitor's held units go back and the merged lines are held
+        # afresh, cut down to what is left
+        inventory.release(visitor)
+        for pid, qty in sorted(theirs.items.items()):
+            row = mine.get(pid)
+            qty = inventory.hold(user, pid, qty + (row.quantity if row else 0), partial=True)
+            if row is not None and qty:
+                row.quantity = qty
+            elif row is not None:
+                db.session.delete(row)
+            elif qty:
+                db.session.add(CartItem(owner=user, product_id=pid, quantity=qty))
+        wished = set(_load(user).wishlist)
+        for pid in theirs.wishlist:
+            if pid not in wished:
+                db.session.add(WishlistItem(owner=user, product_id=pid))
+        db.session.execute(delete(CartItem).where(CartItem.owner == visitor))
+        db.session.execute(delete(WishlistItem).where(WishlistItem.owner == visitor))
+        db.session.commit()
+        _refresh(user)
+    cache.delete(_key(visitor))
@@ -0,0 +1,100 @@
+"""Catalog registry: in-process cache of catalog data shared by every worker thread.
+
+Each cached entry is stamped with a version number. Committing a change to a
+watched model bumps the version, so the next reader reloads. Versions are
+``catalog:<name>`` tags in the cache backend, so with a shared backend every
+gunicorn worker sees the bump; the TTL is a backstop.
+"""
+import time
+from collections import namedtuple
+from itertools import chain
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .extensions import db, cache
+from .models import Category, Product, AdminSettings
+
+CategoryEntry = namedtuple("CategoryEntry", "id name")
+StoreSettings = namedtuple("StoreSettings", "store_name brand_subtext")
+
+# model class -> version stamp bumped when rows of that model are committed
+_WATCHED = {Category: "categories", Product: "products", AdminSettings: "settings"}
+
+_entries = {}
+
+
+def version(name):
+    return cache.tag_version("catalog:" + name)
+
+
+def bump(*names):
+    cache.invalidate(*("catalog:" + name for name in names))
+
+
+def _cached(key, loader, depends=None, ttl=None):
+    if ttl is None:
+        ttl = current_app.config.get("CATALOG_CACHE_TTL", 300)
+    ver = tuple(version(name) for name in (depends or (key,)))
+    now = time.monotonic()
+    hit = _entries.get(key)
+    if hit and hit[0] == ver and now - hit[1] < ttl:
+        return hit[2]
+    value = loader()
+    _entries[key] = (ver, now, value)
+    return value
+
+
+# ---------------- Categories ----------------
+def _load_categories():
+    rows = db.session.query(Category.id, Category.name).order_by(Category.name.asc()).all()
+    return tuple(CategoryEntry(cid, name) for cid, name in rows)
+
+
+def categories():
+    return _cached("categories", _load_categories)
+
+
+def category(cid):
+    return next((c for c in categories() if c.id == cid), None)
+
+
+def category_choices():
+    return [(c.id, c.name) for c in categories()]
+
+
+# ---------------- Store settings ----------------
+def _load_settings():
+    s = AdminSettings.query.first()
+    if not s:
+        s = AdminSettings()
+        db.session.add(s)
+        db.session.commit()
+    return StoreSettings(s.store_name, s.brand_subtext)
+
+
+def settings():
+    return _cached("settings", _load_settings)
+
+
+# ---------------- Invalidation ----------------
+@event.listens_for(Session, "after_flush")
+def _collect_changes(session, flush_context):
+    touched = session.info.setdefault("catalog_touched", set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        name = _WATCHED.get(type(obj))
+        if name:
+            touched.add(name)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(session):
+    touched = session.info.pop("catalog_touched", None)
+    if touched:
+        bump(*touched)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    session.info.pop("catalog_touched", None)
@@ -0,0 +1,303 @@
+import csv
+import json
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+from . import assets, images, search, perf, pricing, catalog, payments, jobs, stats, product_io, reports, inventory, seed as seeding
+
+search_cli = AppGroup("search", help="Product search index.")
+perf_cli = AppGroup("perf", help="Performance diagnostics.")
+pricing_cli = AppGroup("pricing", help="Bulk repricing.")
+payments_cli = AppGroup("payments", help="Payment gateway tools.")
+stats_cli = AppGroup("stats", help="Dashboard statistics.")
+catalog_cli = AppGroup("catalog", help="Bulk product import/export.")
+reports_cli = AppGroup("reports", help="Accounting exports.")
+inventory_cli = AppGroup("inventory", help="Stock reservations.")
+replicas_cli = AppGroup("replicas", help="Read replicas.")
+assets_cli = AppGroup("assets", help="Compiled CSS/JS.")
+images_cli = AppGroup("images", help="Local product images.")
+
+
+@search_cli.command("reindex")
+def search_reindex():
+    """Rebuild the product search index from the product table."""
+    search.reindex()
+    click.echo("Search index rebuilt.")
+
+
+@perf_cli.command("explain")
+@click.argument("name", required=False)
+def perf_explain(name):
+    """Print the query plan of each route query (optionally only those matching NAME)."""
+    for label, query in perf.route_queries():
+        if name and name not in label:
+            continue
+        click.secho(label, bold=True)
+        for line in perf.explain(query):
+            click.echo("  " + line)
+
+
+def _category_id(value):
+    if value.isdigit():
+        return int(value)
+    for c in catalog.categories():
+        if c.name.lower() == value.lower():
+            return c.id
+    raise click.BadParameter(f"no category named {value!r}", param_hint="--category")
+
+
+def _discount_rows(csv_file):
+    """(ids, {id: discount}, [(line, {field: [errors]})]) from a repricing CSV;
+    rows with errors are left out."""
+    ids, discounts, errors = [], {}, []
+    reader = csv.DictReader(csv_file)
+    rows = [(reader.line_num, row) for row in reader]
+    by_sku = pricing.ids_for_skus([r["sku"] for _, r in rows if not r.get("id") and r.get("sku")])
+    for line, row in rows:
+        row_errors = {}
+        raw_id, sku = (row.get("id") or "").strip(), row.get("sku")
+        pid = None
+        if raw_id:
+            if raw_id.isdigit():
+                pid = int(raw_id)
+            else:
+                row_errors["id"] = ["Not a valid integer value."]
+        elif sku:
+            pid = by_sku.get(sku)
+            if pid is None:
+                row_errors["sku"] = ["No product has this SKU."]
+        else:
+            row_errors["id"] = ["An id or sku is required."]
+        raw_discount = (row.get("discount_percent") or "").strip()
+        if raw_discount:
+            if not raw_discount.isdigit() or int(raw_discount) > 100:
+                row_errors["discount_percent"] = ["Number must be between 0 and 100."]
+        if row_errors:
+            errors.append((line, row_errors))
+            continue
+        ids.append(pid)
+        if raw_discount:
+            discounts[pid] = int(raw_discount)
+    return ids, discounts, errors
+
+
+@pricing_cli.command("apply")
+@click.option("--discount", type=click.IntRange(0, 100), help="Discount %% to apply to every match.")
+@click.option("--category", help="Category id or name.")
+@click.option("--csv", "csv_file", type=click.File("r"),
+              help="CSV with an id or sku column and an optional discount_percent column.")
+@click.option("--batch", default=500, show_default=True, help="Rows per UPDATE batch.")
+def pricing_apply(discount, category, csv_file, batch):
+    """Set discounts on a category or a CSV of products and recompute sale prices."""
+    if not category and not csv_file:
+        raise click.UsageError("Pass --category and/or --csv.")
+    ids, discounts = None, None
+    if csv_file:
+        ids, discounts, errors = _discount_rows(csv_file)
+        for line, row_errors in errors:
+            click.echo(f"line {line}: {row_errors}, skipped", err=True)
+    if discount is None and not discounts:
+        raise click.UsageError("Pass --discount or a discount_percent column.")
+    n = pricing.reprice(ids=ids, category_id=_category_id(category) if category else None,
+                        discount=discount, discounts=discounts, batch=batch)
+    click.echo(f"Repriced {n} products.")
+
+
+@pricing_cli.command("recompute")
+@click.option("--batch", default=500, show_default=True, help="Rows per UPDATE batch.")
+def pricing_recompute(batch):
+    """Recompute every stored sale price from price and discount."""
+    click.echo(f"Recomputed {pricing.reprice(batch=batch)} products.")
+
+
+@payments_cli.command("reconcile")
+@click.option("--older-than", type=int, help="Seconds since checkout (default PAYMENT_RECONCILE_AFTER).")
+def payments_reconcile(older_than):
+    """Ask the gateway about unpaid orders (Pending or swept to Cancelled) and mark paid ones Paid."""
+    click.echo(f"{payments.reconcile_pending(older_than=older_than)} orders marked paid.")
+
+
+@payments_cli.command("stub")
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", default=8765, show_default=True)
+@click.option("--delay", default=0.0, show_default=True, help="Seconds to wait before answering.")
+def payments_stub(host, port, delay):
+    """Serve a local stand-in for the Razorpay orders API.
+
+    Point the app at it with PAYMENT_GATEWAY_URL=http://HOST:PORT.
+    """
+    payments.stub_app(delay).run(host=host, port=port, threaded=True)
+
+
+@catalog_cli.command("import")
+@click.argument("file", type=click.File("r", encoding="utf-8-sig"))
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file name.")
+@click.option("--chunk", default=1000, show_default=True, help="Rows per INSERT/UPDATE batch.")
+@click.option("--dry-run", is_flag=True, help="Only validate.")
+def catalog_import(file, fmt, chunk, dry_run):
+    """Upsert products from a CSV or JSONL file (- for stdin), keyed on id, else sku."""
+    fmt = fmt or product_io.guess_format(file.name)
+    result = product_io.import_products(product_io.read_rows(file, fmt), chunk_size=chunk, dry_run=dry_run)
+    for err in result.errors:
+        click.echo(f"line {err.line}: {err.errors}", err=True)
+    if result.error_count > len(result.errors):
+        click.echo(f"... and {result.error_count - len(result.errors)} more rejected rows", err=True)
+    click.echo(f"{result.created} created, {result.updated} updated, {result.error_count} rejected.")
+
+
+@catalog_cli.command("export")
+@click.argument("file", type=click.File("w", encoding="utf-8"), default="-")
+@click.option("--format", "fmt", type=click.Choice(["csv", "jsonl"]), help="Default: from the file name, else csv.")
+def catalog_export(file, fmt):
+    """Write every product as CSV or JSONL to FILE (default stdout)."""
+    for part in product_io.export_products(fmt or product_io.guess_format(file.name)):
+        file.write(part)
+
+
+def _report_options(fn):
+    fn = click.option("--from", "date_from", help="First day (YYYY-MM-DD).")(fn)
+    fn = click.option("--to", "date_to", help="Last day, inclusive (YYYY-MM-DD).")(fn)
+    fn = click.option("--status", "statuses", multiple=True, help="Order status; repeatable.")(fn)
+    return fn
+
+
+def _report_filters(date_from, date_to, statuses):
+    try:
+        return {"date_from": reports.parse_date(date_from), "date_to": reports.parse_date(date_to),
+                "statuses": list(statuses)}
+    except ValueError:
+        raise click.BadParameter("dates are YYYY-MM-DD")
+
+
+@reports_cli.command("orders")
+@click.argument("file", type=click.File("w", encoding="utf-8", lazy=True), default="-")
+@click.option("--format", "fmt", type=click.Choice(reports.FORMATS), default="csv", show_default=True)
+@_report_options
+def reports_orders(file, fmt, date_from, date_to, statuses):
+    """Export order lines to FILE (default stdout)."""
+    for part in reports.export_orders(fmt, **_report_filters(date_from, date_to, statuses)):
+        file.write(part)
+    if fmt == "columnar" and file.name != "-":
+        with open(file.name + ".schema.json", "w") as fh:
+            json.dump(reports.columnar_schema(), fh, indent=2)
+
+
+@reports_cli.command("gst")
+@_report_options
+def reports_gst(date_from, date_to, statuses):
+    """Print the GST summary by day, state and category as CSV."""
+    writer = csv.DictWriter(click.get_text_stream("stdout"), fieldnames=reports.GST_FIELDS)
+    writer.writeheader()
+    writer.writerows(reports.gst_summary(**_report_filters(date_from, date_to, statuses)))
+
+
+@stats_cli.command("rebuild")
+@click.option("--batch", default=1000, show_default=True, help="Orders read per query.")
+def stats_rebuild(batch):
+    """Recompute dashboard counters and revenue buckets from the order table."""
+    click.echo(f"Rebuilt stats from {stats.rebuild(batch=batch)} orders.")
+
+
+@stats_cli.command("rollup")
+def stats_rollup():
+    """Fold pending changes into the dashboard counters (flask worker does this every 10s)."""
+    click.echo(f"Folded {stats.rollup()} pending changes.")
+
+
+@inventory_cli.command("sweep")
+def inventory_sweep():
+    """Return expired stock holds and cancel orders whose payment timed out."""
+    released, cancelled = inventory.sweep()
+    click.echo(f"Released {released} holds, cancelled {cancelled} unpaid orders.")
+
+
+@replicas_cli.command("status")
+def replicas_status():
+    """Probe each read replica and print whether it would take reads."""
+    replicas = current_app.extensions.get("db_replicas")
+    if replicas is None:
+        click.echo("No replicas configured; all reads go to the primary.")
+        return
+    for engine in replicas.engines:
+        ok, lag = replicas.probe(engine)
+        state = "ok" if ok else "DOWN"
+        if lag is not None:
+            state += f" (lag {lag:.1f}s)"
+        click.echo(f"{engine.url.render_as_string()}  {state}")
+
+
+@assets_cli.command("build")
+@click.option("--clean", is_flag=True, help="Delete files from earlier builds.")
+def assets_build(clean):
+    """Compile Tailwind CSS and bundle the JS into fingerprinted files."""
+    try:
+        files = assets.build(current_app, clean=clean)
+    except assets.BuildError as exc:
+        raise click.ClickException(str(exc))
+    for name, hashed in sorted(files.items()):
+        click.echo(f"{name} -> {hashed}")
+
+
+@images_cli.command("fetch")
+@click.option("--batch", default=50, show_default=True, help="Products per round.")
+def images_fetch(batch):
+    """Download and resize every product image_url not stored locally yet."""
+    if images.Image is None:
+        raise click.ClickException("Pillow is not installed")
+    fetched = failed = 0
+    while True:
+        done, bad = images.fetch_pending(limit=batch)
+        fetched, failed = fetched + done, failed + bad
+        if done + bad < batch:
+            break
+    click.echo(f"{fetched} images stored, {failed} failed.")
+
+
+@click.command("seed")
+@click.option("--categories", default=20, show_default=True)
+@click.option("--products", default=10000, show_default=True)
+@click.option("--users", default=1000, show_default=True)
+@click.option("--orders", default=20000, show_default=True)
+@click.option("--max-items", default=4, show_default=True, help="Most lines per order.")
+@click.option("--days", default=365, show_default=True, help="Spread products and orders over this many days.")
+@click.option("--batch", default=5000, show_default=True, help="Rows per INSERT batch.")
+@click.option("--seed", "seed_", default=42, show_default=True, help="Random seed; same seed, same data.")
+@with_appcontext
+def seed(categories, products, users, orders, max_items, days, batch, seed_):
+    """Add synthetic categories, products, customers and orders for load tests."""
+    def progress(kind, done, total):
+        click.echo(f"\r{kind}: {done}/{total}", nl=done >= total)
+
+    seeding.seed(categories=categories, products=products, users=users, orders=orders,
+                 max_items=max_items, days=days, batch=batch, seed=seed_, progress=progress)
+    click.echo(f"Seeded. Customers sign in as user<n>@{seeding.SEED_DOMAIN} / {seeding.SEED_PASSWORD}.")
+
+
+@click.command("worker")
+@click.option("--concurrency", type=int, help="Jobs run at once (default JOBS_CONCURRENCY).")
+@click.option("--burst", is_flag=True, help="Exit once the queue is empty.")
+@with_appcontext
+def worker(concurrency, burst):
+    """Run background jobs from the job table."""
+    cfg = current_app.config
+    n = jobs.work(concurrency=concurrency or cfg.get("JOBS_CONCURRENCY", 4),
+                  poll_interval=cfg.get("JOBS_POLL_INTERVAL", 1.0), burst=burst)
+    click.echo(f"Worker stopped after {n} jobs.")
+
+
+def register_commands(app):
+    app.cli.add_command(search_cli)
+    app.cli.add_command(perf_cli)
+    app.cli.add_command(pricing_cli)
+    app.cli.add_command(payments_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(reports_cli)
+    app.cli.add_command(inventory_cli)
+    app.cli.add_command(replicas_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(seed)
+    app.cli.add_command(worker)
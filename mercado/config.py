@@ -4,21 +4,148 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-key-change")
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///mercado.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # engine settings applied by database.py: SQLite runs in WAL mode and
+    # waits SQLITE_BUSY_TIMEOUT ms for the write lock; server databases get
+    # a pool of DB_POOL_SIZE (+ DB_MAX_OVERFLOW) pre-pinged connections,
+    # each giving up on connecting after DB_CONNECT_TIMEOUT s
+    SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+    # optional read replicas for storefront browsing (views marked read_only),
+    # comma separated and used round-robin. A replica failing its probe (or
+    # lagging over REPLICA_MAX_LAG s) is skipped for REPLICA_RETRY_AFTER s;
+    # a visitor who writes reads from the primary for REPLICA_PIN_SECONDS
+    DATABASE_REPLICA_URLS = os.getenv("DATABASE_REPLICA_URLS", "")
+    DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+    REPLICA_CHECK_INTERVAL = int(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+    REPLICA_RETRY_AFTER = int(os.getenv("REPLICA_RETRY_AFTER", "30"))
+    REPLICA_MAX_LAG = int(os.getenv("REPLICA_MAX_LAG", "10"))
+    REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", "10"))
 
     RAZORPAY_KEY_ID = os.getenv("RAZORPAY_KEY_ID", "")
     RAZORPAY_KEY_SECRET = os.getenv("RAZORPAY_KEY_SECRET", "")
 
-    # ✅ Central list of categories (Flipkart-style bar)
-    CATEGORIES = [
-        "Mobiles & Tablets",
-        "TVs & Appliances",
-        "Electronics",
-        "Fashion",
-        "Home & Kitchen",
-        "Beauty & Toys",
-        "Furniture",
-        "Flight Bookings",
-    ]
+    # payment gateway: "razorpay" or "stub" (in-process, no network).
+    # PAYMENT_GATEWAY_URL points the Razorpay client elsewhere, e.g. at
+    # `flask payments stub` (http://127.0.0.1:8765).
+    PAYMENT_GATEWAY = os.getenv("PAYMENT_GATEWAY", "razorpay")
+    PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL", "")
+    PAYMENT_CONNECT_TIMEOUT = float(os.getenv("PAYMENT_CONNECT_TIMEOUT", "3.05"))
+    PAYMENT_READ_TIMEOUT = float(os.getenv("PAYMENT_READ_TIMEOUT", "10"))
+    PAYMENT_RETRIES = int(os.getenv("PAYMENT_RETRIES", "2"))
+    PAYMENT_POOL_SIZE = int(os.getenv("PAYMENT_POOL_SIZE", "10"))
+    PAYMENT_STUB_DELAY = float(os.getenv("PAYMENT_STUB_DELAY", "0"))
+    # create gateway orders on a background thread pool while the payment
+    # page polls, instead of holding the request worker
+    PAYMENT_ASYNC = os.getenv("PAYMENT_ASYNC", "0") == "1"
+    PAYMENT_WORKERS = int(os.getenv("PAYMENT_WORKERS", "4"))
+
+    # shared secret of the gateway webhook (/payments/webhook); unset rejects all
+    RAZORPAY_WEBHOOK_SECRET = os.getenv("RAZORPAY_WEBHOOK_SECRET", "")
+    # the reconciler asks the gateway about orders still Pending (or already
+    # cancelled by the sweeper) this many seconds after checkout, up to
+    # PAYMENT_RECONCILE_DAYS old; paid ones are settled a batch at a time
+    PAYMENT_RECONCILE_AFTER = int(os.getenv("PAYMENT_RECONCILE_AFTER", "600"))
+    PAYMENT_RECONCILE_DAYS = int(os.getenv("PAYMENT_RECONCILE_DAYS", "2"))
+    PAYMENT_RECONCILE_BATCH = int(os.getenv("PAYMENT_RECONCILE_BATCH", "200"))
+
+    # Categories live in the Category table; the registry in catalog.py
+    # caches them for this many seconds at most before re-reading.
+    CATALOG_CACHE_TTL = int(os.getenv("CATALOG_CACHE_TTL", "300"))
+
+    # "auto" uses SQLite FTS5 when available, else the in-process index
+    SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+    SEARCH_MEMORY_TTL = int(os.getenv("SEARCH_MEMORY_TTL", "300"))
+
+    # response/fragment cache: "memory" (per-process LRU), "sqlite" (shared
+    # by all workers on the host) or "null"
+    CACHE_TYPE = os.getenv("CACHE_TYPE", "memory")
+    CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "300"))
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+    CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH")  # default: instance/cache.sqlite
+
+    # seconds a session's cached identity (name, admin flag) is trusted
+    # before it is re-read from the user table
+    IDENTITY_MAX_AGE = int(os.getenv("IDENTITY_MAX_AGE", "900"))
+
+    # background jobs (`flask worker`): threads per worker process, seconds
+    # between polls when idle, base retry backoff in seconds
+    JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", "4"))
+    JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+    JOBS_BACKOFF = int(os.getenv("JOBS_BACKOFF", "10"))
+
+    # outgoing mail for order notifications; unset MAIL_SERVER only logs
+    MAIL_SERVER = os.getenv("MAIL_SERVER", "")
+    MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
+    MAIL_USE_TLS = os.getenv("MAIL_USE_TLS", "1") == "1"
+    MAIL_USERNAME = os.getenv("MAIL_USERNAME", "")
+    MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "")
+    MAIL_FROM = os.getenv("MAIL_FROM", "orders@swiftcart.local")
+
+    # seconds a cart/wishlist snapshot (and the header counts) stays cached
+    BASKET_CACHE_TTL = int(os.getenv("BASKET_CACHE_TTL", "300"))
+
+    # storefront grids are keyset-paginated at this many cards per page
+    PRODUCTS_PER_PAGE = int(os.getenv("PRODUCTS_PER_PAGE", "24"))
+    ADMIN_ORDERS_PER_PAGE = int(os.getenv("ADMIN_ORDERS_PER_PAGE", "50"))
+    # a filtered admin order list totals at most this many matches
+    ADMIN_ORDERS_SUMMARY_LIMIT = int(os.getenv("ADMIN_ORDERS_SUMMARY_LIMIT", "10000"))
+
+    # accounting exports read this many order lines per query/transaction,
+    # optionally sleeping between batches to leave room for storefront traffic
+    REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "2000"))
+    REPORT_BATCH_PAUSE = float(os.getenv("REPORT_BATCH_PAUSE", "0"))
+    # GST summary: rate included in selling prices, and the state the store
+    # ships from (same-state sales split into CGST+SGST, others are IGST)
+    GST_RATE = float(os.getenv("GST_RATE", "18"))
+    STORE_STATE = os.getenv("STORE_STATE", "")
+
+    # seconds stock stays held for a cart since its line was last changed,
+    # and for an order awaiting online payment before it is cancelled
+    CART_HOLD_SECONDS = int(os.getenv("CART_HOLD_SECONDS", "1800"))
+    PAYMENT_HOLD_SECONDS = int(os.getenv("PAYMENT_HOLD_SECONDS", "900"))
+
+    # per-request SQL/template timing (instrumentation.py) for a sampled
+    # fraction of requests: a Server-Timing header, and a log line for slow
+    # requests, too many queries or one query repeated (likely N+1)
+    PERF_INSTRUMENT = os.getenv("PERF_INSTRUMENT", "1") == "1"
+    PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", "1.0"))
+    PERF_SERVER_TIMING = os.getenv("PERF_SERVER_TIMING", "1") == "1"
+    PERF_SLOW_REQUEST_MS = int(os.getenv("PERF_SLOW_REQUEST_MS", "500"))
+    PERF_MAX_QUERIES = int(os.getenv("PERF_MAX_QUERIES", "30"))
+    PERF_REPEAT_THRESHOLD = int(os.getenv("PERF_REPEAT_THRESHOLD", "5"))
+
+    # Prometheus metrics at /metrics, merged across worker processes through
+    # per-process files in METRICS_DIR (default instance/metrics; clear it on
+    # deploy). METRICS_TOKEN, if set, is required as a bearer token
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    METRICS_DIR = os.getenv("METRICS_DIR")
+    METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # `flask assets build`: the Tailwind CLI to run (standalone binary or
+    # e.g. "npx tailwindcss@3") and where fingerprinted files are written
+    # (default mercado/static/dist)
+    TAILWIND_CMD = os.getenv("TAILWIND_CMD", "tailwindcss")
+    ASSETS_DIR = os.getenv("ASSETS_DIR")
+
+    # product images (images.py): where originals and resized copies are
+    # stored (default instance/images), processes doing the resizing, and
+    # limits on what is accepted from an upload or a product's image_url
+    IMAGES_DIR = os.getenv("IMAGES_DIR")
+    IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+    IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+    IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "40000000"))
+    IMAGE_FETCH_TIMEOUT = float(os.getenv("IMAGE_FETCH_TIMEOUT", "10"))
+    IMAGE_RENDER_TIMEOUT = float(os.getenv("IMAGE_RENDER_TIMEOUT", "30"))
+
+    # admin catalog uploads larger than this are imported by `flask worker`
+    IMPORT_INLINE_MAX_BYTES = int(os.getenv("IMPORT_INLINE_MAX_BYTES", str(2 * 1024 * 1024)))
 
 
 class Dev(Config):
@@ -27,3 +154,8 @@ class Dev(Config):
 
 class Prod(Config):
     DEBUG = False
+    # commits must survive a power loss, not just a process crash
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "FULL")
+    CACHE_TYPE = os.getenv("CACHE_TYPE", "sqlite")
+    CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+    PERF_SAMPLE_RATE = float(os.getenv("PERF_SAMPLE_RATE", "0.05"))
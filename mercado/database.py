@@ -0,0 +1,270 @@
+"""Database engines: pool settings, SQLite pragmas and the read replica.
+
+``configure`` fills in SQLALCHEMY_ENGINE_OPTIONS for the configured dialect
+before Flask-SQLAlchemy builds its engines:
+
+* SQLite runs in WAL mode with a busy timeout, so readers never block the
+  writer and concurrent writers (several gunicorn workers checking out at
+  once) wait their turn instead of failing with "database is locked".
+* PostgreSQL/MySQL get a sized pool with pre-ping and recycling, so a
+  restarted database or a proxy dropping idle connections costs a
+  reconnect rather than a 500.
+
+Replicas are listed in DATABASE_REPLICA_URLS (comma separated; the older
+DATABASE_REPLICA_URL still works) and bound as "replica0", "replica1", ...
+``RoutingSession`` sends plain SELECTs made during a ``read_only`` view to
+one of them, round-robin per request; everything else (writes, flushes,
+SELECT ... FOR UPDATE, any query outside a read-only view) goes to the
+primary. A background thread per process probes each replica every
+REPLICA_CHECK_INTERVAL seconds, so a request never waits on a probe; one
+that fails (or, on PostgreSQL, lags more than REPLICA_MAX_LAG seconds
+behind) is skipped until a probe REPLICA_RETRY_AFTER seconds later passes,
+and with none healthy reads fall back to the primary. Replica connections
+give up after DB_CONNECT_TIMEOUT seconds rather than the OS default.
+
+Cache fills (``primary_reads``) always read the primary: a page built from
+a lagging replica and stored under the current tag versions would keep
+serving the old rows after the change that bumped them.
+
+A request that writes pins its visitor to the primary for
+REPLICA_PIN_SECONDS (a timestamp in the session), so the pages they load
+next, such as the product they just reviewed or the stock they just took,
+show their own changes rather than a lagging copy.
+"""
+import contextlib
+import functools
+import itertools
+import os
+import threading
+import time
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, insert, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+REPLICA = "replica"
+PIN_KEY = "db_pin"
+
+
+def engine_options(url, cfg):
+    """Engine options for ``url`` (a database URL) from the DB_* settings."""
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        # pysqlite's own timeout is the busy handler's wait, in seconds
+        return {"connect_args": {"timeout": cfg.get("SQLITE_BUSY_TIMEOUT", 5000) / 1000}}
+    return {
+        "pool_size": cfg.get("DB_POOL_SIZE", 10),
+        "max_overflow": cfg.get("DB_MAX_OVERFLOW", 20),
+        "pool_timeout": cfg.get("DB_POOL_TIMEOUT", 10),
+        "pool_recycle": cfg.get("DB_POOL_RECYCLE", 1800),
+        "pool_pre_ping": True,
+        # psycopg2, mysqlclient and PyMySQL all take it in seconds
+        "connect_args": {"connect_timeout": cfg.get("DB_CONNECT_TIMEOUT", 5)},
+    }
+
+
+def configure(app):
+    """Set engine options and the replica bind; call before ``db.init_app``."""
+    cfg = app.config
+    url = cfg["SQLALCHEMY_DATABASE_URI"]
+    if "SQLALCHEMY_ENGINE_OPTIONS" not in cfg:
+        cfg["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(url, cfg)
+    urls = replica_urls(cfg)
+    if urls:
+        binds = dict(cfg.get("SQLALCHEMY_BINDS") or {})
+        for i, replica in enumerate(urls):
+            binds.setdefault(f"{REPLICA}{i}", {"url": replica, **engine_options(replica, cfg)})
+        cfg["SQLALCHEMY_BINDS"] = binds
+
+
+def replica_urls(cfg):
+    raw = cfg.get("DATABASE_REPLICA_URLS") or cfg.get("DATABASE_REPLICA_URL") or ""
+    return [u.strip() for u in raw.split(",") if u.strip()]
+
+
+def _sqlite_pragmas(cfg):
+    journal_mode = "WAL" if cfg.get("SQLITE_WAL", True) else "DELETE"
+    synchronous = cfg.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    busy_timeout = int(cfg.get("SQLITE_BUSY_TIMEOUT", 5000))
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL is a property of the file; the other two are per connection
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={busy_timeout}")
+        cursor.close()
+
+    return on_connect
+
+
+def install(app, db):
+    """Hook the SQLite pragmas onto every SQLite engine and set up replica
+    routing; call after ``db.init_app``."""
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+                event.listen(engine, "connect", _sqlite_pragmas(app.config))
+        engines = [db.engines[f"{REPLICA}{i}"] for i in range(len(replica_urls(app.config)))]
+    if engines:
+        app.extensions["db_replicas"] = Replicas(engines, app.config, app.logger)
+        app.after_request(_pin_after_write)
+
+
+def insert_new(session, model, values):
+    """INSERT ``values`` into ``model``'s table unless a row with the same
+    unique key exists. Returns the new row's id, or None for a duplicate;
+    either way the session's transaction carries on.
+
+    SQLite and PostgreSQL use ``ON CONFLICT DO NOTHING``. A SAVEPOINT would
+    not do on SQLite: pysqlite sends no BEGIN before one, so when it is the
+    transaction's first statement its RELEASE commits the row for good.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(model).values(**values).on_conflict_do_nothing()
+        return session.execute(stmt.returning(model.id)).scalar()
+    try:
+        with session.begin_nested():
+            return session.execute(insert(model).values(**values).returning(model.id)).scalar()
+    except IntegrityError:
+        return None
+
+
+# ---------------- Read replicas ----------------
+class Replicas:
+    """The replica engines of one app, handed out round-robin among the healthy ones."""
+
+    def __init__(self, engines, cfg, logger):
+        self.engines = engines
+        self.check_interval = cfg.get("REPLICA_CHECK_INTERVAL", 5)
+        self.retry_after = cfg.get("REPLICA_RETRY_AFTER", 30)
+        self.max_lag = cfg.get("REPLICA_MAX_LAG", 10)
+        self.logger = logger
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self._health = {}  # engine -> healthy, written only by the prober
+        self._prober = None  # pid of the process whose prober is running
+
+    def probe(self, engine):
+        """Check ``engine`` now. Returns (healthy, lag in seconds or None)."""
+        try:
+            with engine.connect() as conn:
+                if engine.dialect.name != "postgresql":
+                    conn.execute(text("SELECT 1"))
+                    return True, None
+                # an idle replica has replayed everything it received: no lag
+                lag = conn.execute(text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+                    " ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")).scalar()
+        except SQLAlchemyError as exc:
+            self.logger.warning("replica %s unreachable: %s", engine.url.render_as_string(), exc)
+            return False, None
+        lag = float(lag or 0)
+        if lag > self.max_lag:
+            self.logger.warning("replica %s is %.1fs behind", engine.url.render_as_string(), lag)
+        return lag <= self.max_lag, lag
+
+    def _probe_forever(self):
+        due = {}
+        while True:
+            for engine in self.engines:
+                if time.monotonic() >= due.get(engine, 0.0):
+                    ok = self.probe(engine)[0]
+                    self._health[engine] = ok
+                    due[engine] = time.monotonic() + (self.check_interval if ok else self.retry_after)
+            time.sleep(max(0.1, min(due.values()) - time.monotonic()))
+
+    def _start(self):
+        # threads don't survive a fork, so each gunicorn worker starts its own
+        pid = os.getpid()
+        if self._prober != pid:
+            with self._lock:
+                if self._prober != pid:
+                    self._health = {}
+                    threading.Thread(target=self._probe_forever, name="replica-prober", daemon=True).start()
+                    self._prober = pid
+
+    def healthy(self, engine):
+        """The last probe's verdict; a replica not probed yet counts as down."""
+        return self._health.get(engine, False)
+
+    def pick(self):
+        """The next healthy replica, or None to read from the primary."""
+        self._start()
+        start = next(self._turn)
+        for i in range(len(self.engines)):
+            engine = self.engines[(start + i) % len(self.engines)]
+            if self.healthy(engine):
+                return engine
+        return None
+
+
+def read_only(view):
+    """Mark a view as read-only: its plain SELECTs may be served by a replica."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def primary_reads():
+    """Send the reads made inside the block to the primary."""
+    if not has_request_context():
+        yield
+        return
+    depth = g.get("db_primary_reads", 0)
+    g.db_primary_reads = depth + 1
+    try:
+        yield
+    finally:
+        g.db_primary_reads = depth
+
+
+def pin(seconds=None):
+    """Send this visitor's reads to the primary for the next ``seconds``."""
+    seconds = current_app.config.get("REPLICA_PIN_SECONDS", 10) if seconds is None else seconds
+    session[PIN_KEY] = max(session.get(PIN_KEY, 0), int(time.time() + seconds))
+
+
+def _pin_after_write(response):
+    if g.get("db_wrote"):
+        pin()
+    return response
+
+
+def _replica():
+    """The replica for this request's reads, or None. Chosen once per
+    request, so one page never mixes two replicas' views of the data."""
+    if "db_replica" not in g:
+        replicas = current_app.extensions.get("db_replicas")
+        g.db_replica = None
+        if replicas is not None and session.get(PIN_KEY, 0) < time.time():
+            g.db_replica = replicas.pick()
+    return g.db_replica
+
+
+class RoutingSession(Session):
+    """``db.session``: reads in read-only views go to a replica, if any."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context():
+            if self._flushing or isinstance(clause, UpdateBase):
+                g.db_wrote = True
+            elif (isinstance(clause, Select) and clause._for_update_arg is None
+                  and g.get("db_read_only", False) and not g.get("db_wrote")
+                  and not g.get("db_primary_reads")):
+                replica = _replica()
+                if replica is not None:
+                    return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
@@ -1,6 +1,321 @@
+import functools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import request, session, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
-db = SQLAlchemy()
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from .database import RoutingSession, primary_reads
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
+
+
+# ---------------- Cache backends ----------------
+class NullBackend:
+    """Stores nothing; every lookup is a miss."""
+
+    def get_many(self, keys):
+        return [None] * len(keys)
+
+    def set(self, key, value, ttl):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def tag_versions(self, tags):
+        return [0] * len(tags)
+
+    def bump_tags(self, tags):
+        pass
+
+
+class MemoryBackend:
+    """Per-process LRU bounded by entry count, with a TTL per entry."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._tags = {}
+
+    def get_many(self, keys):
+        now = time.time()
+        out = []
+        with self._lock:
+            for key in keys:
+                hit = self._data.get(key)
+                if hit is None or hit[0] < now:
+                    self._data.pop(key, None)
+                    out.append(None)
+                else:
+                    self._data.move_to_end(key)
+                    out.append(hit[1])
+        return out
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def tag_versions(self, tags):
+        return [self._tags.get(t, 0) for t in tags]
+
+    def bump_tags(self, tags):
+        with self._lock:
+            for t in tags:
+                self._tags[t] = self._tags.get(t, 0) + 1
+
+
+class SQLiteBackend:
+    """Cache in a local SQLite file so every gunicorn worker on the host shares
+    entries and tag versions. WAL mode lets readers run alongside a writer."""
+
+    PURGE_EVERY = 200
+
+    def __init__(self, path, max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_entry "
+                         "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entry_expires ON cache_entry (expires_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_tag "
+                         "(name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        marks = ",".join("?" * len(keys))
+        rows = self._conn().execute(
+            f"SELECT key, value FROM cache_entry WHERE key IN ({marks}) AND expires_at >= ?",
+            (*keys, time.time()),
+        ).fetchall()
+        found = {k: pickle.loads(v) for k, v in rows}
+        return [found.get(k) for k in keys]
+
+    def set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge(conn)
+
+    def _purge(self, conn):
+        conn.execute("DELETE FROM cache_entry WHERE expires_at < ?", (time.time(),))
+        # over the size bound: drop the entries closest to expiry
+        conn.execute("DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry "
+                     "ORDER BY expires_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache_entry")
+        conn.execute("DELETE FROM cache_tag")
+
+    def tag_versions(self, tags):
+        if not tags:
+            return []
+        marks = ",".join("?" * len(tags))
+        rows = dict(self._conn().execute(
+            f"SELECT name, version FROM cache_tag WHERE name IN ({marks})", tuple(tags)).fetchall())
+        return [rows.get(t, 0) for t in tags]
+
+    def bump_tags(self, tags):
+        self._conn().executemany(
+            "INSERT INTO cache_tag (name, version) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET version = version + 1",
+            [(t,) for t in tags],
+        )
+
+
+# ---------------- Cache ----------------
+class Cache:
+    """Response and fragment cache with tag-based invalidation.
+
+    Every entry records the version of each of its tags when it was stored.
+    ``invalidate(tag)`` bumps the tag's version, which turns every entry
+    carrying that tag into a miss without having to find and delete them.
+    """
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.default_ttl = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get("CACHE_TYPE", "memory")
+        self.default_ttl = app.config.get("CACHE_DEFAULT_TTL", 300)
+        if kind == "memory":
+            self.backend = MemoryBackend(app.config.get("CACHE_MAX_ENTRIES", 2048))
+        elif kind == "sqlite":
+            path = app.config.get("CACHE_SQLITE_PATH") or os.path.join(app.instance_path, "cache.sqlite")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.backend = SQLiteBackend(path, app.config.get("CACHE_MAX_ENTRIES", 20000))
+        elif kind == "null":
+            self.backend = NullBackend()
+        else:
+            raise ValueError(f"Unknown CACHE_TYPE {kind!r}")
+        app.extensions["cache"] = self
+        app.jinja_env.add_extension(CacheExtension)
+
+    # -- entries --
+    def get(self, key):
+        from . import metrics
+        hit = self.backend.get_many([key])[0]
+        if hit is not None:
+            tags, versions, value = hit
+            if self.backend.tag_versions(tags) == versions:
+                metrics.inc("swiftcart_cache_requests_total", result="hit")
+                return value
+        metrics.inc("swiftcart_cache_requests_total", result="miss")
+        return None
+
+    def set(self, key, value, tags=(), ttl=None):
+        tags = list(tags)
+        versions = self.backend.tag_versions(tags)
+        self.backend.set(key, (tags, versions, value), ttl or self.default_ttl)
+
+    def delete(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def get_or_set(self, key, make, tags=(), ttl=None):
+        value = self.get(key)
+        if value is None:
+            # read tag versions before building, so a concurrent invalidation
+            # makes the stored value stale rather than being lost
+            tags = list(tags)
+            versions = self.backend.tag_versions(tags)
+            with primary_reads():
+                value = make()
+            self.backend.set(key, (tags, versions, value), ttl or self.default_ttl)
+        return value
+
+    # -- tags --
+    def tag_version(self, tag):
+        return self.backend.tag_versions([tag])[0]
+
+    def invalidate(self, *tags):
+        if tags:
+            self.backend.bump_tags(tags)
+
+    # -- fragments and views --
+    def fragment(self, key, render, tags=(), ttl=None):
+        return Markup(self.get_or_set("fragment:" + key, lambda: str(render()), tags, ttl))
+
+    def cached(self, tags=(), ttl=None, unless=None, query=()):
+        """Cache a GET view's whole response for anonymous visitors.
+
+        ``tags`` may be a callable receiving the view's URL arguments.
+        Entries are keyed on the endpoint, its URL arguments and only the
+        ``query`` parameters the view reads, so made-up query strings share
+        one entry instead of pushing real pages out of the cache; the view
+        must not echo any other parameter into its response.
+        Requests with per-visitor state (logged in, cart or wishlist
+        contents, pending flash messages) are served uncached, so the header
+        counts are always rendered for the actual visitor.
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method not in ("GET", "HEAD") or _has_visitor_state() or (unless and unless()):
+                    return view(*args, **kwargs)
+                params = [(k, v) for k in query for v in request.args.getlist(k)]
+                key = f"view:{request.endpoint}:{urlencode(sorted(kwargs.items()))}?{urlencode(params)}"
+                hit = self.get(key)
+                if hit is not None:
+                    body, status, headers = hit
+                    return make_response(body, status, headers)
+                entry_tags = tags(**kwargs) if callable(tags) else tags
+                entry_tags = ["catalog:categories", *entry_tags]
+                versions = self.backend.tag_versions(entry_tags)
+                # a replica's rows may predate the versions just read
+                with primary_reads():
+                    response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough \
+                        and not session.modified and "Set-Cookie" not in response.headers:
+                    headers = [(k, v) for k, v in response.headers.items() if k.lower() != "content-length"]
+                    self.backend.set(key, (entry_tags, versions, (response.get_data(), 200, headers)),
+                                     ttl or self.default_ttl)
+                return response
+            return wrapper
+        return decorator
+
+
+def _has_visitor_state():
+    from flask_login import current_user
+    if current_user.is_authenticated:
+        return True
+    if session.get("_flashes"):
+        return True
+    if session.get("basket"):
+        from . import carts
+        basket = carts.get()
+        return bool(basket.items or basket.wishlist)
+    return False
+
+
+class CacheExtension(Extension):
+    """``{% cache "key", tags=["product:1"], ttl=60 %}...{% endcache %}``"""
+
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        kwargs = []
+        while parser.stream.skip_if("comma"):
+            name = parser.stream.expect("name").value
+            parser.stream.expect("assign")
+            kwargs.append(nodes.Keyword(name, parser.parse_expression()))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(self.call_method("_render", args, kwargs), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, tags=(), ttl=None, caller=None):
+        return cache.fragment(key, caller, tags, ttl)
+
+
+cache = Cache()
@@ -1,9 +1,11 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField
 from wtforms import (
     StringField, PasswordField, BooleanField,
     FloatField, IntegerField, TextAreaField,
-    SubmitField, SelectField
+    SubmitField, SelectField, HiddenField
 )
+from wtforms.widgets import HiddenInput
 from wtforms.validators import DataRequired, Email, Length, Optional, NumberRange, URL
 
 
@@ -26,15 +28,31 @@ class ProductForm(FlaskForm):
     description = TextAreaField('Description', validators=[Optional()])
     price = FloatField('Price', validators=[DataRequired(), NumberRange(min=0)])
     discount_percent = IntegerField('Discount %', validators=[Optional(), NumberRange(min=0, max=100)])
-    image_url = StringField('Image URL', validators=[Optional(), URL(require_tld=False, allow_ip=True)])
+    image_url = StringField('Image URL', validators=[Optional(), URL(allow_ip=False)])
+    # stored locally by images.py; takes precedence over image_url
+    image_file = FileField('Upload image', validators=[FileAllowed(['jpg', 'jpeg', 'png', 'webp', 'gif'])])
     
     # ✅ New field for category
     category_id = SelectField('Category', coerce=int, validators=[DataRequired()])
     
     is_featured = BooleanField('Featured')
+    # blank: stock is not tracked
+    stock = IntegerField('Stock', validators=[Optional(), NumberRange(min=0)])
+    # the stock shown when the form was opened; edits apply the difference
+    stock_loaded = IntegerField(widget=HiddenInput(), validators=[Optional()])
     submit = SubmitField('Save')
 
 
+class ProductImportForm(ProductForm):
+    """ProductForm's rules applied to one row of a bulk import."""
+    sku = StringField('SKU', validators=[Optional(), Length(max=64)])
+    # from an export: matches the product even when it has no SKU
+    id = IntegerField('ID', validators=[Optional(), NumberRange(min=1)])
+
+    class Meta:
+        csrf = False
+
+
 class SettingsForm(FlaskForm):
     store_name = StringField('Store Name', validators=[Optional()])
     brand_subtext = StringField('Brand Subtext', validators=[Optional()])
@@ -52,4 +70,6 @@ class AddressForm(FlaskForm):
     city = StringField('City', validators=[DataRequired()])
     state = StringField('State', validators=[DataRequired()])
     pincode = StringField('PIN Code', validators=[DataRequired(), Length(min=4, max=10)])
+    # issued with the form; a second POST of the same form places no new order
+    idempotency_key = HiddenField(validators=[Optional(), Length(max=64)])
     submit = SubmitField('Proceed to Pay')
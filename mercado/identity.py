@@ -0,0 +1,84 @@
+"""Identity cache: load the logged-in user without touching the user table.
+
+At login the user's id, name and admin flag go into the signed session
+cookie along with the user's identity version (the ``user:<id>`` cache tag).
+Committing a change to a user's password, admin flag or name bumps that tag,
+so every session carrying the old snapshot reloads the row once.
+IDENTITY_MAX_AGE caps how long a snapshot is trusted when the cache backend
+is per-process and a bump made by another worker is not visible.
+"""
+import time
+
+from flask import current_app, session
+from flask_login import UserMixin
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from .extensions import db, cache
+from .models import User
+
+# changing any of these makes cached identities stale
+_WATCHED_FIELDS = ("password_hash", "is_admin", "name")
+
+
+class SessionUser(UserMixin):
+    """What the request needs to know about the logged-in user."""
+
+    def __init__(self, id, name, is_admin):
+        self.id = id
+        self.name = name
+        self.is_admin = is_admin
+
+
+def _version(uid):
+    return cache.tag_version(f"user:{uid}")
+
+
+def remember(user):
+    session["_ident"] = [user.id, user.name, bool(user.is_admin), _version(user.id), int(time.time())]
+
+
+def forget():
+    session.pop("_ident", None)
+
+
+def load(uid):
+    uid = int(uid)
+    payload = session.get("_ident")
+    max_age = current_app.config.get("IDENTITY_MAX_AGE", 900)
+    if (payload and payload[0] == uid and payload[3] == _version(uid)
+            and time.time() - payload[4] < max_age):
+        return SessionUser(uid, payload[1], payload[2])
+
+    user = db.session.get(User, uid)
+    if user is None:
+        forget()
+        return None
+    remember(user)
+    return SessionUser(user.id, user.name, bool(user.is_admin))
+
+
+# ---------------- Invalidation ----------------
+@event.listens_for(Session, "after_flush")
+def _collect_stale(db_session, flush_context):
+    stale = db_session.info.setdefault("identity_stale", set())
+    for obj in db_session.dirty:
+        if isinstance(obj, User):
+            state = inspect(obj)
+            if any(state.attrs[f].history.has_changes() for f in _WATCHED_FIELDS):
+                stale.add(obj.id)
+    for obj in db_session.deleted:
+        if isinstance(obj, User):
+            stale.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_on_commit(db_session):
+    stale = db_session.info.pop("identity_stale", None)
+    if stale:
+        cache.invalidate(*(f"user:{uid}" for uid in stale))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(db_session):
+    db_session.info.pop("identity_stale", None)
@@ -0,0 +1,332 @@
+"""Local product images: originals stored once, resized copies served.
+
+An image arrives as an upload on the product form or from a product's
+``image_url``. ``flask worker`` fetches pending URLs every minute
+(``images.fetch``), so once it has run a page never links a remote host.
+Fetching only goes to public addresses: every hop of a redirect is resolved
+and refused if any address is private, loopback, link-local or reserved, so
+an admin-entered URL cannot reach the shop's own network. The
+original goes into IMAGES_DIR named by the SHA-256 of its bytes, so a picture
+shared by many products is stored once. ``product.image_key`` records that
+digest, and ``image_width``/``image_height`` the size the picture is shown at.
+
+Derivatives are WebP and JPEG copies at the WIDTHS buckets, never wider than
+the original. Resizing is CPU-bound and would hold the GIL, so Pillow runs in
+a process pool (IMAGE_WORKERS). Each copy is written next to its original the
+first time it is wanted; ingestion renders them all up front.
+``/media/<key>/<width>.<ext>`` serves them with an immutable Cache-Control,
+since a new picture always gets a new key.
+
+``image_srcset`` lists the buckets for ``<img srcset>``/``<source>``, so the
+browser downloads the smallest copy that fills the slot at its pixel density.
+Products with no local copy keep linking ``image_url`` (or the picsum
+placeholder). Pillow is optional: without it nothing is ingested.
+"""
+import hashlib
+import io
+import ipaddress
+import multiprocessing
+import os
+import re
+import socket
+import threading
+from urllib.parse import urljoin, urlsplit
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import requests
+from flask import abort, current_app, send_file, url_for
+from sqlalchemy import event
+
+from .extensions import db, cache
+from .jobs import job
+from .models import Product
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: without it products keep their remote image_url
+    Image = ImageOps = None
+
+WIDTHS = (160, 320, 480, 640, 960, 1280)
+FORMATS = {"webp": "WEBP", "jpg": "JPEG"}
+ACCEPTED = {"JPEG", "PNG", "WEBP", "GIF"}
+IMMUTABLE = "public, max-age=31536000, immutable"
+_KEY = re.compile(r"[0-9a-f]{64}")
+MAX_REDIRECTS = 5
+_ORIENTATION = 0x0112  # EXIF tag; 5-8 mean the picture is stored rotated 90 degrees
+
+
+class ImageError(Exception):
+    pass
+
+
+def images_dir(app=None):
+    app = app or current_app
+    return app.config.get("IMAGES_DIR") or os.path.join(app.instance_path, "images")
+
+
+def original_path(key):
+    return os.path.join(images_dir(), key[:2], key)
+
+
+def derivative_path(key, width, ext):
+    return os.path.join(images_dir(), key[:2], f"{key}-{width}.{ext}")
+
+
+def widths_for(width):
+    """(bucket, actual width) pairs worth offering for an original ``width``
+    pixels wide: every smaller bucket, then the first one that holds it all."""
+    pairs = [(w, w) for w in WIDTHS if w < width]
+    if len(pairs) < len(WIDTHS):
+        pairs.append((WIDTHS[len(pairs)], width))
+    return pairs
+
+
+# ---------------- Resizing ----------------
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _render(src, dest, width, ext):
+    # runs in a pool process
+    with Image.open(src) as im:
+        # JPEGs decode straight at a reduced scale; (width, width) keeps
+        # both sides big enough whichever way EXIF turns the picture
+        im.draft("RGB", (width, width))
+        im = ImageOps.exif_transpose(im)
+        if im.width > width:
+            im = im.resize((width, max(1, round(im.height * width / im.width))), Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        if ext == "jpg":
+            if im.mode in ("RGBA", "LA", "P"):
+                # cards are white, so flatten transparency onto white
+                im = im.convert("RGBA")
+                background = Image.new("RGB", im.size, "white")
+                background.paste(im, mask=im.getchannel("A"))
+                im = background
+            im.convert("RGB").save(out, "JPEG", quality=82, optimize=True, progressive=True)
+        else:
+            im = im if im.mode in ("RGB", "RGBA") else im.convert("RGBA" if "A" in im.getbands() else "RGB")
+            im.save(out, "WEBP", quality=80, method=4)
+    _write_atomic(dest, out.getvalue())
+
+
+_pool = None
+_pending = {}  # destination path -> Future, so concurrent requests share one resize
+_lock = threading.Lock()
+
+
+def _submit(src, dest, width, ext):
+    global _pool
+    with _lock:
+        future = _pending.get(dest)
+        if future is None:
+            if _pool is None:
+                # spawn, not fork: a forked child would inherit the app's
+                # threads and locks mid-flight
+                _pool = ProcessPoolExecutor(current_app.config.get("IMAGE_WORKERS", 2),
+                                            mp_context=multiprocessing.get_context("spawn"))
+            try:
+                future = _pool.submit(_render, src, dest, width, ext)
+            except BrokenProcessPool:
+                _pool = None  # a worker died (e.g. OOM); the next call starts a new pool
+                raise
+            _pending[dest] = future
+            future.add_done_callback(lambda f: _pending.pop(dest, None))
+    return future
+
+
+def derive(key, width, ext):
+    """Path of ``key``'s copy at bucket ``width`` as ``ext``, rendering it
+    first if needed; None when the original is unknown."""
+    dest = derivative_path(key, width, ext)
+    if os.path.exists(dest):
+        return dest
+    src = original_path(key)
+    if Image is None or not os.path.exists(src):
+        return None
+    _submit(src, dest, width, ext).result(timeout=current_app.config.get("IMAGE_RENDER_TIMEOUT", 30))
+    return dest
+
+
+def prerender(key, width, wait=False):
+    """Queue every derivative of ``key`` (original ``width`` pixels wide)."""
+    src = original_path(key)
+    futures = [_submit(src, derivative_path(key, bucket, ext), bucket, ext)
+               for bucket, _ in widths_for(width) for ext in FORMATS
+               if not os.path.exists(derivative_path(key, bucket, ext))]
+    if wait:
+        for future in futures:
+            future.result()
+
+
+# ---------------- Ingestion ----------------
+def ingest(data):
+    """Store image bytes ``data``; returns (key, width, height)."""
+    cfg = current_app.config
+    if Image is None:
+        raise ImageError("Pillow is not installed")
+    if len(data) > cfg.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024):
+        raise ImageError("image is too large")
+    try:
+        # verify() catches truncated files but leaves the image unusable
+        with Image.open(io.BytesIO(data)) as im:
+            im.verify()
+        with Image.open(io.BytesIO(data)) as im:
+            fmt, (width, height) = im.format, im.size
+            orientation = im.getexif().get(_ORIENTATION)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise ImageError(f"not a readable image ({exc})") from None
+    if fmt not in ACCEPTED:
+        raise ImageError(f"unsupported image format {fmt}")
+    if width * height > cfg.get("IMAGE_MAX_PIXELS", 40_000_000):
+        raise ImageError(f"image is too large ({width}x{height})")
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    key = hashlib.sha256(data).hexdigest()
+    path = original_path(key)
+    if not os.path.exists(path):
+        _write_atomic(path, data)
+    return key, width, height
+
+
+def check_public(url):
+    """Raise ImageError unless ``url`` is http(s) on a host whose every
+    address is public."""
+    parts = urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise ImageError("only http(s) image URLs can be fetched")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or 0, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, ValueError) as exc:
+        raise ImageError(f"cannot resolve {parts.hostname} ({exc})") from None
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global or address.is_multicast:
+            raise ImageError(f"{parts.hostname} is not a public address")
+
+
+def fetch(url):
+    """Download ``url`` and ingest it; returns (key, width, height)."""
+    cfg = current_app.config
+    limit = cfg.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024)
+    try:
+        # redirects are followed by hand so each hop is checked before it is requested
+        for _ in range(MAX_REDIRECTS + 1):
+            check_public(url)
+            response = requests.get(url, stream=True, allow_redirects=False,
+                                    timeout=cfg.get("IMAGE_FETCH_TIMEOUT", 10),
+                                    headers={"User-Agent": "swiftcart-images"})
+            if not response.is_redirect:
+                break
+            url = urljoin(url, response.headers["Location"])
+            response.close()
+        else:
+            raise ImageError("too many redirects")
+        with response:
+            response.raise_for_status()
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > limit:
+                    raise ImageError("image is too large")
+    except requests.RequestException as exc:
+        raise ImageError(f"download failed ({exc})") from None
+    return ingest(bytes(data))
+
+
+def attach(product, key, width, height):
+    product.image_key, product.image_width, product.image_height = key, width, height
+
+
+@event.listens_for(Product.image_url, "set", active_history=True)
+def _url_changed(product, value, oldvalue, initiator):
+    # a new URL needs fetching again (an upload attaches after setting it)
+    if value != oldvalue:
+        product.image_key = None
+
+
+def _invalidate(product):
+    cache.invalidate(f"product:{product.id}", "listing", f"category:{product.category_id}")
+
+
+def fetch_pending(limit=50):
+    """Fetch the image_url of up to ``limit`` products without a local copy;
+    returns (fetched, failed)."""
+    fetched = failed = 0
+    products = (Product.query.filter(Product.image_key.is_(None), Product.image_url != "")
+                .order_by(Product.id).limit(limit).all())
+    for product in products:
+        try:
+            key, width, height = fetch(product.image_url)
+        except ImageError as exc:
+            current_app.logger.warning("image for product %s (%s): %s", product.id, product.image_url, exc)
+            # "" marks it tried: pages keep linking image_url until it changes
+            product.image_key = ""
+            failed += 1
+        else:
+            prerender(key, width, wait=True)
+            attach(product, key, width, height)
+            fetched += 1
+        # one short transaction per product; a download can take seconds
+        db.session.commit()
+        _invalidate(product)
+    return fetched, failed
+
+
+@job("images.fetch", max_attempts=1, timeout=900, every=60)
+def fetch_pending_job():
+    if Image is None:
+        return
+    fetched, failed = fetch_pending()
+    if fetched or failed:
+        current_app.logger.info("image fetch: %s stored, %s failed", fetched, failed)
+
+
+# ---------------- Templates ----------------
+def media_url(key, width, ext="jpg"):
+    return url_for("media", key=key, width=width, ext=ext)
+
+
+def image_src(p, width, height=None):
+    """URL of ``p``'s picture about ``width`` pixels wide."""
+    if p.image_key:
+        pairs = widths_for(p.image_width)
+        bucket = next((b for b, actual in pairs if actual >= width), pairs[-1][0])
+        return media_url(p.image_key, bucket)
+    return p.image_url or f"https://picsum.photos/seed/{p.id}/{width}/{height or width}"
+
+
+def image_srcset(p, ext="jpg"):
+    """``srcset`` of ``p``'s local copies as ``ext``; "" when there are none."""
+    if not p.image_key:
+        return ""
+    return ", ".join(f"{media_url(p.image_key, bucket, ext)} {actual}w"
+                     for bucket, actual in widths_for(p.image_width))
+
+
+# ---------------- Serving ----------------
+def serve(key, width, ext):
+    if not _KEY.fullmatch(key) or width not in WIDTHS or ext not in FORMATS:
+        abort(404)
+    try:
+        path = derive(key, width, ext)
+    except Exception as exc:
+        current_app.logger.warning("resizing image %s to %s.%s failed: %s", key, width, ext, exc)
+        abort(404)
+    if path is None:
+        abort(404)
+    response = send_file(path, mimetype=f"image/{'jpeg' if ext == 'jpg' else ext}", max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE
+    return response
+
+
+def init_app(app):
+    app.add_url_rule("/media/<key>/<int:width>.<ext>", "media", serve)
+    app.add_template_global(image_src)
+    app.add_template_global(image_srcset)
@@ -0,0 +1,171 @@
+"""Per-request performance instrumentation.
+
+For a sampled request (PERF_SAMPLE_RATE of them) this records:
+
+* every SQL statement: count, total time and the slowest few, from the
+  engines' cursor events;
+* time spent in context processors and in Jinja rendering, from wrapping the
+  processors and Flask's template signals (an ``{% include "_card.html" %}``
+  is part of its page's render time);
+* statements run again and again with only their parameters changing,
+  e.g. ``order.items`` loaded once per order in a loop, the usual N+1.
+
+The totals go out as a ``Server-Timing`` header (visible in the browser's
+network tab) and a request that is slower than PERF_SLOW_REQUEST_MS, runs
+more than PERF_MAX_QUERIES statements or repeats one statement shape
+PERF_REPEAT_THRESHOLD times is logged with its worst statements. Requests
+that are not sampled pay for one ``g`` lookup per statement, so this can
+stay on in production with a low rate.
+"""
+import heapq
+import random
+import re
+import time
+from collections import Counter
+
+from flask import before_render_template, current_app, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+# literals and bind markers (?, %s, %(name)s, :name) -> "?", so statements
+# that differ only in their parameters have the same shape
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|(?<!:):\w+")
+_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+
+
+def _oneline(statement, limit=300):
+    return " ".join(statement.split())[:limit]
+
+
+def shape(statement):
+    return _LISTS.sub("(?)", _LITERALS.sub("?", statement))
+
+
+class RequestStats:
+    SLOWEST = 3
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.slowest = []  # heap of (seconds, statement)
+        self.shapes = Counter()
+        self.template_time = 0.0
+        self.context_time = 0.0
+        self._render_depth = 0
+        self._render_started = 0.0
+
+    def query(self, statement, seconds):
+        self.queries += 1
+        self.sql_time += seconds
+        self.shapes[shape(statement)] += 1
+        if len(self.slowest) < self.SLOWEST:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+    def repeated(self, threshold):
+        """(count, shape) of the statements run at least ``threshold`` times."""
+        return [(n, s) for s, n in self.shapes.most_common() if n >= threshold]
+
+    def server_timing(self, total):
+        return ", ".join((
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"',
+            f"ctx;dur={self.context_time * 1000:.1f}",
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ))
+
+
+def current():
+    """This request's RequestStats, or None when it is not being sampled."""
+    return g.get("_perf") if has_request_context() else None
+
+
+# ---------------- SQL ----------------
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current() is not None:
+        conn.info["_perf_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current()
+    started = conn.info.pop("_perf_started", None)
+    if stats is not None and started is not None:
+        stats.query(statement, time.perf_counter() - started)
+
+
+# ---------------- Templates ----------------
+def _before_render(sender, template, context, **extra):
+    stats = current()
+    if stats is not None:
+        if not stats._render_depth:
+            stats._render_started = time.perf_counter()
+        stats._render_depth += 1
+
+
+def _rendered(sender, template, context, **extra):
+    stats = current()
+    if stats is not None and stats._render_depth:
+        stats._render_depth -= 1
+        if not stats._render_depth:
+            stats.template_time += time.perf_counter() - stats._render_started
+
+
+def _timed_processor(processor):
+    def wrapper():
+        stats = current()
+        if stats is None:
+            return processor()
+        started = time.perf_counter()
+        try:
+            return processor()
+        finally:
+            stats.context_time += time.perf_counter() - started
+    wrapper.__name__ = processor.__name__
+    return wrapper
+
+
+# ---------------- Requests ----------------
+def _start():
+    if random.random() < current_app.config.get("PERF_SAMPLE_RATE", 1.0):
+        g._perf = RequestStats()
+
+
+def _finish(response):
+    stats = g.pop("_perf", None)
+    if stats is None:
+        return response
+    cfg = current_app.config
+    total = time.perf_counter() - stats.started
+    if cfg.get("PERF_SERVER_TIMING", True):
+        response.headers["Server-Timing"] = stats.server_timing(total)
+
+    repeated = stats.repeated(cfg.get("PERF_REPEAT_THRESHOLD", 5))
+    if (total * 1000 >= cfg.get("PERF_SLOW_REQUEST_MS", 500)
+            or stats.queries > cfg.get("PERF_MAX_QUERIES", 30) or repeated):
+        lines = [f"{request.method} {request.full_path.rstrip('?')} ({request.endpoint}): "
+                 f"{total * 1000:.0f}ms, {stats.queries} queries in {stats.sql_time * 1000:.0f}ms, "
+                 f"context {stats.context_time * 1000:.0f}ms, templates {stats.template_time * 1000:.0f}ms"]
+        for n, statement in repeated[:3]:
+            lines.append(f"  likely N+1, run {n} times: {_oneline(statement)}")
+        for seconds, statement in sorted(stats.slowest, reverse=True):
+            lines.append(f"  {seconds * 1000:.1f}ms: {_oneline(statement)}")
+        current_app.logger.warning("\n".join(lines))
+    return response
+
+
+def init_app(app, db):
+    """Hook into ``app``'s engines, templates and requests; call after the
+    blueprints are registered, so their context processors are timed too."""
+    if not app.config.get("PERF_INSTRUMENT", True):
+        return
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    for processors in app.template_context_processors.values():
+        processors[:] = [_timed_processor(p) for p in processors]
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+    app.before_request(_start)
+    app.after_request(_finish)
@@ -0,0 +1,270 @@
+"""Stock levels and reservations.
+
+``product.stock`` counts the units still available to sell; NULL means the
+product is not stock-tracked and never runs out. Units are taken off with a
+single conditional UPDATE (``stock = stock - n WHERE id = ? AND stock >= n``),
+so two workers can never sell the same unit and only the rows of the
+products involved are locked: a flash sale on one product does not queue
+checkouts of anything else.
+
+Taken units are recorded as stock_reservation rows with an expiry. Putting a
+product in the cart holds its units for CART_HOLD_SECONDS; checkout moves
+the hold onto the order, where it lasts PAYMENT_HOLD_SECONDS until the
+payment arrives (or is final straight away for COD). ``sweep``, queued every
+minute by ``flask worker`` and also available as ``flask inventory sweep``,
+returns expired holds to stock and cancels the orders whose payment never
+came. A hold is only ever returned by the statement that deletes its row,
+so the sweeper and a request racing for the same hold cannot both give the
+units back.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from .extensions import db, cache
+from .jobs import job
+from .models import Order, Product, StockReservation
+
+
+class OutOfStock(Exception):
+    def __init__(self, product_id, available):
+        super().__init__(f"only {available} of product #{product_id} left")
+        self.product_id = product_id
+        self.available = available
+
+
+def _until(setting, default):
+    return datetime.utcnow() + timedelta(seconds=current_app.config.get(setting, default))
+
+
+def _touched(pid):
+    # product pages show "out of stock"; refresh them once the change commits
+    db.session.info.setdefault("stock_touched", set()).add(pid)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    touched = session.info.pop("stock_touched", None)
+    if touched:
+        cache.invalidate(*(f"product:{pid}" for pid in touched))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("stock_touched", None)
+
+
+# ---------------- Stock ----------------
+def _take(pid, n):
+    """Take ``n`` units off ``pid``'s stock. Returns what is left, or None for
+    an untracked product; raises OutOfStock when fewer than ``n`` remain."""
+    left = db.session.execute(
+        update(Product).where(Product.id == pid, Product.stock >= n)
+        .values(stock=Product.stock - n).returning(Product.stock),
+        execution_options={"synchronize_session": False},
+    ).scalar()
+    if left is None:
+        available = db.session.scalar(select(Product.stock).where(Product.id == pid))
+        if available is None:
+            return None
+        raise OutOfStock(pid, available)
+    if left == 0:
+        _touched(pid)
+    return left
+
+
+def _give(pid, n):
+    """Put ``n`` units back; a no-op for untracked products."""
+    left = db.session.execute(
+        update(Product).where(Product.id == pid, Product.stock.is_not(None))
+        .values(stock=Product.stock + n).returning(Product.stock),
+        execution_options={"synchronize_session": False},
+    ).scalar()
+    if left is not None and left == n:
+        _touched(pid)
+
+
+def _claim(rid):
+    """Delete hold ``rid``; True if this call removed it (and so owns its units)."""
+    return db.session.execute(
+        delete(StockReservation).where(StockReservation.id == rid),
+        execution_options={"synchronize_session": False},
+    ).rowcount == 1
+
+
+def _cart_holds(owner, pids=None):
+    stmt = select(StockReservation.id, StockReservation.product_id, StockReservation.quantity) \
+        .where(StockReservation.owner == owner, StockReservation.order_id.is_(None))
+    if pids is not None:
+        stmt = stmt.where(StockReservation.product_id.in_(pids))
+    return db.session.execute(stmt.order_by(StockReservation.product_id)).all()
+
+
+def restock(pid, loaded, new):
+    """Change ``pid``'s stock from ``loaded``, the level the admin (or import)
+    saw, to ``new``. Only the difference is applied, so units sold or held in
+    the meantime stay sold or held; a cut larger than what is left stops at
+    0. None means untracked. Returns False, changing nothing, when someone
+    else switched tracking on or off since ``loaded`` was read."""
+    if new == loaded:
+        return True
+    stmt = update(Product).where(Product.id == pid)
+    if new is None:
+        stmt = stmt.values(stock=None)
+    elif loaded is None:
+        stmt = stmt.where(Product.stock.is_(None)).values(stock=new)
+    else:
+        level = Product.stock + (new - loaded)
+        stmt = stmt.where(Product.stock.is_not(None)).values(stock=case((level < 0, 0), else_=level))
+    if db.session.execute(stmt, execution_options={"synchronize_session": False}).rowcount != 1:
+        return False
+    _touched(pid)
+    return True
+
+
+# ---------------- Carts ----------------
+def hold(owner, pid, qty, partial=False):
+    """Make ``owner``'s cart hold ``qty`` units of ``pid``, taking or giving
+    back the difference. Returns the quantity held; raises OutOfStock, or
+    with ``partial`` holds whatever is left instead. Part of the caller's
+    transaction."""
+    held = sum(q for rid, _, q in _cart_holds(owner, [pid]) if _claim(rid))
+    tracked = held > 0
+    if qty > held:
+        want = qty - held
+        while want:
+            try:
+                tracked = _take(pid, want) is not None or tracked
+                break
+            except OutOfStock as exc:
+                if not partial:
+                    _give(pid, held)
+                    raise
+                want = exc.available
+        qty = held + want
+    elif qty < held:
+        _give(pid, held - qty)
+    if tracked and qty > 0:
+        db.session.add(StockReservation(owner=owner, product_id=pid, quantity=qty,
+                                        expires_at=_until("CART_HOLD_SECONDS", 1800)))
+    return qty
+
+
+def release(owner, pids=None):
+    """Return ``owner``'s cart holds (on ``pids``, or all of them) to stock."""
+    for rid, pid, qty in _cart_holds(owner, pids):
+        if _claim(rid):
+            _give(pid, qty)
+
+
+# ---------------- Orders ----------------
+def allocate(owner, order, lines, pay_within=None):
+    """Move ``owner``'s cart holds onto ``order``, taking fresh units for
+    lines whose hold lapsed. With ``pay_within`` (seconds) the units stay
+    held until ``settle`` or the sweeper; without, the sale is final.
+    Raises OutOfStock, after which the caller must roll back. The stock
+    UPDATEs lock the products' rows until the transaction ends, so commit
+    before anything slow, such as a gateway call.
+
+    When every line's hold is intact (or the products are untracked) this
+    is a fixed handful of statements however many lines there are."""
+    holds = _cart_holds(owner)
+    held = {}
+    if holds:
+        # a hold swept away in the meantime simply isn't returned here
+        claimed = set(db.session.execute(
+            delete(StockReservation).where(StockReservation.id.in_([rid for rid, _, _ in holds]))
+            .returning(StockReservation.id),
+            execution_options={"synchronize_session": False},
+        ).scalars())
+        for rid, pid, qty in holds:
+            if rid in claimed:
+                held[pid] = held.get(pid, 0) + qty
+    tracked = {pid for pid, stock in db.session.execute(
+        select(Product.id, Product.stock).where(Product.id.in_([p.id for p, _ in lines]))) if stock is not None}
+
+    order_holds = []
+    expires_at = datetime.utcnow() + timedelta(seconds=pay_within) if pay_within else None
+    # product id order, so concurrent checkouts lock rows in the same order
+    for p, qty in sorted(lines, key=lambda line: line[0].id):
+        have = held.pop(p.id, 0)
+        if p.id not in tracked and not have:
+            continue
+        if qty > have:
+            _take(p.id, qty - have)
+        elif qty < have:
+            _give(p.id, have - qty)
+        if expires_at:
+            order_holds.append({"order_id": order.id, "product_id": p.id,
+                                "quantity": qty, "expires_at": expires_at})
+    for pid, qty in held.items():
+        _give(pid, qty)
+    if order_holds:
+        db.session.execute(insert(StockReservation), order_holds)
+
+
+def settle(order):
+    """Make ``order``'s sale final once it is paid."""
+    rows = db.session.execute(
+        select(StockReservation.id).where(StockReservation.order_id == order.id)).scalars().all()
+    if rows:
+        db.session.execute(delete(StockReservation).where(StockReservation.id.in_(rows)),
+                           execution_options={"synchronize_session": False})
+    elif order.status == "Cancelled":
+        # paid after the sweeper gave up on it: take the units again if we can
+        for item in order.items:
+            try:
+                _take(item.product_id, item.quantity)
+            except OutOfStock:
+                current_app.logger.warning("order #%s paid after its hold expired; product #%s is oversold",
+                                           order.id, item.product_id)
+
+
+def cancel(order):
+    """Give an unpaid order's held units back and mark it Cancelled."""
+    for rid, pid, qty in db.session.execute(
+            select(StockReservation.id, StockReservation.product_id, StockReservation.quantity)
+            .where(StockReservation.order_id == order.id).order_by(StockReservation.product_id)).all():
+        if _claim(rid):
+            _give(pid, qty)
+    if order.status == "Pending":
+        order.status = "Cancelled"
+
+
+# ---------------- Sweeper ----------------
+def sweep(now=None, batch=500):
+    """Return expired holds to stock and cancel orders still unpaid when
+    theirs ran out. Returns (holds released, orders cancelled)."""
+    now = now or datetime.utcnow()
+    released = cancelled = 0
+    while True:
+        rows = db.session.execute(
+            select(StockReservation.id, StockReservation.product_id,
+                   StockReservation.quantity, StockReservation.order_id)
+            .where(StockReservation.expires_at < now)
+            .order_by(StockReservation.product_id).limit(batch)).all()
+        order_ids = set()
+        for rid, pid, qty, oid in rows:
+            if _claim(rid):
+                _give(pid, qty)
+                released += 1
+                if oid:
+                    order_ids.add(oid)
+        if order_ids:
+            for order in Order.query.filter(Order.id.in_(order_ids), Order.status == "Pending"):
+                order.status = "Cancelled"
+                order.cancel_reason = "expired"
+                cancelled += 1
+        # one short transaction per batch
+        db.session.commit()
+        if len(rows) < batch:
+            return released, cancelled
+
+
+@job("inventory.sweep", max_attempts=1, timeout=120, every=60)
+def sweep_job():
+    released, cancelled = sweep()
+    if released:
+        current_app.logger.info("inventory sweep: %s holds released, %s orders cancelled", released, cancelled)
@@ -0,0 +1,221 @@
+"""Durable background jobs stored in the ``job`` table.
+
+``enqueue`` adds a job to the caller's transaction, so it exists exactly when
+the order (or whatever triggered it) is committed, and a request pays for
+one INSERT however much work the job does. ``flask worker`` claims due jobs
+with a conditional UPDATE and runs them on a thread pool. A claim is a lease:
+a worker that dies mid-job leaves it ``running`` until ``locked_until``
+passes, then another worker picks it up. Failed jobs retry with exponential
+backoff until ``max_attempts``. Handlers may run more than once, so they
+must be idempotent. Jobs registered with ``every`` are also queued by the
+worker on that schedule, once per interval however many workers run.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select, update
+
+from .database import insert_new
+from .extensions import db
+from .models import Job
+
+JobSpec = namedtuple("JobSpec", "func max_attempts timeout")
+
+_registry = {}
+
+
+_periodic = {}  # name -> interval in seconds
+
+
+def job(name, max_attempts=5, timeout=300, every=None):
+    """Register ``func(**payload)`` as the handler for jobs called ``name``.
+
+    ``timeout`` is the lease in seconds: a run taking longer may be started
+    again by another worker. With ``every`` (seconds), ``flask worker``
+    queues the job (without payload) at that interval.
+    """
+    def decorator(func):
+        _registry[name] = JobSpec(func, max_attempts, timeout)
+        if every:
+            _periodic[name] = every
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0, max_attempts=None):
+    """Queue a job in the current transaction; workers see it after commit.
+
+    With ``key``, a job already queued under that key is returned instead of
+    adding a second one.
+    """
+    if key is not None:
+        existing = Job.query.filter_by(idempotency_key=key).first()
+        if existing is not None:
+            return existing
+    spec = _registry.get(name)
+    values = dict(
+        name=name,
+        payload=payload or {},
+        idempotency_key=key,
+        status="queued",
+        attempts=0,
+        max_attempts=max_attempts or (spec.max_attempts if spec else 5),
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    if key is None:
+        job = Job(**values)
+        db.session.add(job)
+        return job
+    # losing a race on the key must not undo the caller's work
+    jid = insert_new(db.session, Job, values)
+    if jid is None:
+        return Job.query.filter_by(idempotency_key=key).one()
+    return db.session.get(Job, jid)
+
+
+def _due(now):
+    return or_(
+        and_(Job.status == "queued", Job.run_at <= now),
+        and_(Job.status == "running", Job.locked_until < now, Job.attempts < Job.max_attempts),
+    )
+
+
+def claim(worker_id, limit):
+    """Lease up to ``limit`` due jobs to ``worker_id``; returns their ids."""
+    now = datetime.utcnow()
+    # leases that ran out on the last allowed attempt are given up on
+    db.session.execute(
+        update(Job)
+        .where(Job.status == "running", Job.locked_until < now, Job.attempts >= Job.max_attempts)
+        .values(status="failed", finished_at=now, last_error="lease expired on final attempt"),
+        execution_options={"synchronize_session": False},
+    )
+    rows = db.session.execute(
+        select(Job.id, Job.name).where(_due(now)).order_by(Job.run_at, Job.id).limit(limit)
+    ).all()
+    claimed = []
+    for jid, name in rows:
+        spec = _registry.get(name)
+        lease = now + timedelta(seconds=spec.timeout if spec else 300)
+        # only one worker's UPDATE can still match the due condition
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == jid, _due(now))
+            .values(status="running", attempts=Job.attempts + 1, locked_by=worker_id, locked_until=lease),
+            execution_options={"synchronize_session": False},
+        )
+        if result.rowcount:
+            claimed.append(jid)
+    db.session.commit()
+    return claimed
+
+
+def schedule(last_slots):
+    """Queue the periodic jobs that are due. ``last_slots`` ({name: slot})
+    remembers what this worker already queued; the idempotency key makes
+    the other workers' attempts for the same slot no-ops."""
+    now = time.time()
+    queued = False
+    for name, every in _periodic.items():
+        slot = int(now // every)
+        if last_slots.get(name) == slot:
+            continue
+        enqueue(name, key=f"{name}@{slot}")
+        # finished runs of a periodic job are of no further interest
+        db.session.execute(
+            delete(Job).where(Job.name == name, Job.status == "done",
+                              Job.finished_at < datetime.utcnow() - timedelta(days=1)),
+            execution_options={"synchronize_session": False},
+        )
+        last_slots[name] = slot
+        queued = True
+    if queued:
+        db.session.commit()
+
+
+def _finish(jid, worker_id, **values):
+    """Close out a job, unless the lease was lost to another worker."""
+    return db.session.execute(
+        update(Job)
+        .where(Job.id == jid, Job.status == "running", Job.locked_by == worker_id)
+        .values(locked_until=None, **values),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+
+
+def run(jid, worker_id):
+    """Run one claimed job. Returns True if it succeeded."""
+    job = db.session.get(Job, jid)
+    name, payload, attempts, max_attempts = job.name, dict(job.payload), job.attempts, job.max_attempts
+    spec = _registry.get(name)
+    try:
+        if spec is None:
+            raise LookupError(f"no handler registered for job {name!r}")
+        spec.func(**payload)
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc(limit=5)
+        current_app.logger.warning("job %s #%s failed (attempt %s/%s)", name, jid, attempts, max_attempts)
+        if attempts >= max_attempts:
+            _finish(jid, worker_id, status="failed", last_error=error, finished_at=datetime.utcnow())
+        else:
+            backoff = min(current_app.config.get("JOBS_BACKOFF", 10) * 2 ** (attempts - 1), 3600)
+            _finish(jid, worker_id, status="queued", last_error=error,
+                    run_at=datetime.utcnow() + timedelta(seconds=backoff))
+        db.session.commit()
+        return False
+
+    # the handler's writes and the "done" mark commit together, so a lease
+    # lost mid-run never double-applies them
+    if _finish(jid, worker_id, status="done", finished_at=datetime.utcnow()):
+        db.session.commit()
+        return True
+    db.session.rollback()
+    current_app.logger.warning("job %s #%s lost its lease; discarding result", name, jid)
+    return False
+
+
+def _run_in_context(app, jid, worker_id):
+    with app.app_context():
+        return run(jid, worker_id)
+
+
+def work(concurrency=4, poll_interval=1.0, burst=False):
+    """Claim and run jobs until SIGINT/SIGTERM (or, with ``burst``, until idle)."""
+    app = current_app._get_current_object()
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+    processed = 0
+    running = set()
+    slots = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as pool:
+        while not stop.is_set():
+            if not burst:
+                schedule(slots)
+            free = concurrency - len(running)
+            claimed = claim(worker_id, free) if free else []
+            for jid in claimed:
+                running.add(pool.submit(_run_in_context, app, jid, worker_id))
+            if burst and not claimed and not running:
+                break
+            if running and (not free or not claimed):
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                processed += len(done)
+            elif not claimed:
+                stop.wait(poll_interval)
+        # finish what was already started before exiting
+        done, _ = wait(running)
+        processed += len(done)
+    return processed
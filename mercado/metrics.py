@@ -0,0 +1,285 @@
+"""Prometheus metrics shared by every worker process, plus health checks.
+
+Each process keeps its counters and histograms in memory and writes them,
+at most every METRICS_FLUSH_INTERVAL seconds, to its own JSON file in
+METRICS_DIR (atomically, via rename). ``/metrics`` merges the files of all
+processes, so whichever gunicorn worker answers the scrape reports the
+whole host, and the ``flask worker`` processes' payment outcomes show up
+too. Files of exited processes keep counting towards the totals, so the
+counters never go backwards; clear METRICS_DIR when deploying. Gauges (the
+connection pool) are only reported for live processes, labelled by pid.
+
+Exported:
+
+* swiftcart_http_requests_total{blueprint,endpoint,method,status}
+* swiftcart_http_request_duration_seconds{blueprint,endpoint} (histogram)
+* swiftcart_db_pool_wait_seconds{bind} (histogram): time to get a pooled
+  connection, including opening a new one
+* swiftcart_db_pool_connections{bind,state,pid}: checked out / idle / overflow
+* swiftcart_cache_requests_total{result}: response/fragment cache hits and misses
+* swiftcart_checkouts_total{outcome}, swiftcart_payments_total{outcome,via}
+
+``/healthz`` answers as long as the process does; ``/readyz`` also needs a
+``SELECT 1`` on the primary database to succeed. Set METRICS_TOKEN to
+require ``Authorization: Bearer <token>`` on ``/metrics``.
+"""
+import atexit
+import bisect
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, jsonify, request
+from sqlalchemy import text
+
+from .extensions import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+# name -> (type, help, histogram buckets)
+METRICS = {
+    "swiftcart_http_requests_total": ("counter", "HTTP responses by endpoint and status.", None),
+    "swiftcart_http_request_duration_seconds": ("histogram", "Time to produce a response.", LATENCY_BUCKETS),
+    "swiftcart_db_pool_wait_seconds": ("histogram", "Time to get a pooled database connection.",
+                                       POOL_WAIT_BUCKETS),
+    "swiftcart_db_pool_connections": ("gauge", "Database pool connections by state, per process.", None),
+    "swiftcart_cache_requests_total": ("counter", "Response/fragment cache lookups by result.", None),
+    "swiftcart_checkouts_total": ("counter", "Checkout attempts by outcome.", None),
+    "swiftcart_payments_total": ("counter", "Payment outcomes by how they were learnt of.", None),
+}
+
+
+class Registry:
+    """This process's metric values."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.started = int(time.time())
+        self.flushed = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            h[bisect.bisect_left(buckets, value)] += 1
+            h[-1] += value
+
+    def snapshot(self, gauges):
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[n, dict(l), v] for (n, l), v in self.counters.items()],
+                "histograms": [[n, dict(l), h] for (n, l), h in self.histograms.items()],
+                "gauges": gauges,
+            }
+
+
+registry = Registry()
+_engines = {}  # bind name -> engine, for the pool gauges
+_directory = None
+_flush_interval = 1.0
+
+
+def inc(name, amount=1, **labels):
+    registry.inc(name, amount, **labels)
+    _maybe_flush()
+
+
+def observe(name, value, **labels):
+    registry.observe(name, value, **labels)
+    _maybe_flush()
+
+
+# ---------------- Process files ----------------
+def _pool_gauges():
+    out = []
+    for bind, engine in _engines.items():
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue  # e.g. SQLite :memory:'s singleton pool
+        for state, value in (("checked_out", pool.checkedout()), ("idle", pool.checkedin()),
+                             ("overflow", max(pool.overflow(), 0))):
+            out.append(["swiftcart_db_pool_connections", {"bind": bind, "state": state}, value])
+    return out
+
+
+def flush():
+    """Write this process's values to its file in METRICS_DIR."""
+    if _directory is None:
+        return
+    data = registry.snapshot(_pool_gauges())
+    path = os.path.join(_directory, f"{os.getpid()}-{registry.started}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+    registry.flushed = time.monotonic()
+
+
+def _maybe_flush(force=False):
+    if _directory is not None and (force or time.monotonic() - registry.flushed >= _flush_interval):
+        try:
+            flush()
+        except OSError:
+            pass  # a full disk must not fail the request; the next flush retries
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect(directory):
+    """Merge every process file into {name: {labels tuple: value}}."""
+    counters, histograms, gauges = {}, {}, {}
+    for path in glob.glob(os.path.join(directory, "*.json")):
+        try:
+            with open(path) as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            continue  # vanished or half-written by an old version
+        for name, labels, value in data["counters"]:
+            key = tuple(sorted(labels.items()))
+            counters.setdefault(name, {})
+            counters[name][key] = counters[name].get(key, 0) + value
+        for name, labels, h in data["histograms"]:
+            key = tuple(sorted(labels.items()))
+            merged = histograms.setdefault(name, {}).setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                merged[i] += v
+        if _alive(data["pid"]):
+            for name, labels, value in data["gauges"]:
+                key = tuple(sorted({**labels, "pid": str(data["pid"])}.items()))
+                gauges.setdefault(name, {})[key] = value
+    return counters, histograms, gauges
+
+
+# ---------------- Exposition ----------------
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(counters, histograms, gauges):
+    """The Prometheus text exposition format."""
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        series = (counters if kind == "counter" else histograms if kind == "histogram" else gauges).get(name)
+        if not series:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for labels, value in sorted(series.items()):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, n in zip((*buckets, "+Inf"), value[:-1]):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Views ----------------
+def metrics_view():
+    token = current_app.config.get("METRICS_TOKEN")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return Response("unauthorized\n", 401, mimetype="text/plain")
+    flush()
+    body = render(*collect(_directory))
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+def healthz():
+    return jsonify(status="ok")
+
+
+def readyz():
+    try:
+        with db.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+    except Exception as exc:
+        current_app.logger.warning("readiness check failed: %s", exc)
+        return jsonify(status="unavailable", error=exc.__class__.__name__), 503
+    return jsonify(status="ok")
+
+
+# ---------------- Hooks ----------------
+_UNTIMED = {"metrics", "healthz", "readyz", "static"}
+
+
+def _start_timer():
+    g._metrics_started = time.perf_counter()
+
+
+def _record(response):
+    started = g.pop("_metrics_started", None)
+    endpoint = request.endpoint or "unmatched"
+    if started is None or endpoint in _UNTIMED:
+        return response
+    blueprint = request.blueprint or ""
+    registry.inc("swiftcart_http_requests_total", blueprint=blueprint, endpoint=endpoint,
+                 method=request.method, status=str(response.status_code))
+    registry.observe("swiftcart_http_request_duration_seconds", time.perf_counter() - started,
+                     blueprint=blueprint, endpoint=endpoint)
+    _maybe_flush()
+    return response
+
+
+def _timed_connect(bind, connect):
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return connect(*args, **kwargs)
+        finally:
+            observe("swiftcart_db_pool_wait_seconds", time.perf_counter() - started, bind=bind)
+    return wrapper
+
+
+def init_app(app):
+    """Register the hooks and the /metrics, /healthz and /readyz routes."""
+    global _directory, _flush_interval
+    if not app.config.get("METRICS_ENABLED", True):
+        return
+    _directory = app.config.get("METRICS_DIR") or os.path.join(app.instance_path, "metrics")
+    _flush_interval = app.config.get("METRICS_FLUSH_INTERVAL", 1.0)
+    os.makedirs(_directory, exist_ok=True)
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            bind = bind or "primary"
+            _engines[bind] = engine
+            # the engine asks its pool for every connection it uses
+            engine.pool.connect = _timed_connect(bind, engine.pool.connect)
+    app.before_request(_start_timer)
+    app.after_request(_record)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+    app.add_url_rule("/healthz", "healthz", healthz)
+    app.add_url_rule("/readyz", "readyz", readyz)
+    atexit.register(_maybe_flush, force=True)
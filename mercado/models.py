@@ -1,7 +1,7 @@
 from datetime import datetime
+from sqlalchemy import literal_column
 from .extensions import db
 from flask_login import UserMixin
-import math
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
@@ -45,24 +45,46 @@ class Product(db.Model):
     # 🔗 category_id foreign key
     category_id = db.Column(db.Integer, db.ForeignKey("category.id"), nullable=True)
 
-    # @property
-    # def sale_price(self):
-    #     if self.discount_percent and self.discount_percent > 0:
-    #         return round(self.price * (1 - self.discount_percent / 100), 2)
-    #     return round(self.price or 0, 2)
-    
-    @property
-    def sale_price(self):
-        if self.discount_percent and self.discount_percent > 0:
-            raw_price = self.price * (1 - self.discount_percent / 100)
-            # round down to nearest whole number
-            base = math.floor(raw_price)
-            # adjust to nearest xx99 (psychological pricing)
-            if base > 99:
-                return (base // 100) * 100 + 99
-            else:
-                return base
-        return round(self.price or 0, 2)
+    # selling price after discount and xx99 rounding; stored (and indexed) so
+    # listings sort/filter on it in SQL. Kept up to date by pricing.py.
+    sale_price = db.Column(db.Float, nullable=False, default=0.0)
+
+    # merchant's stock-keeping unit; bulk imports upsert on it
+    sku = db.Column(db.String(64), nullable=True)
+
+    # units still available to sell (held units already taken off); NULL
+    # means stock is not tracked. Only changed through inventory.py.
+    stock = db.Column(db.Integer, nullable=True)
+
+    # local copy of the picture (images.py): SHA-256 of the stored original
+    # and the size it displays at. NULL while image_url still has to be
+    # fetched, "" when fetching it failed (pages then link image_url)
+    image_key = db.Column(db.String(64), nullable=True)
+    image_width = db.Column(db.Integer, nullable=True)
+    image_height = db.Column(db.Integer, nullable=True)
+
+    # keep in sync with migrations/versions/ (c3d1f2a9e7b4, d8e2a4b61c37, c6f1a8d3e250, 9b4e2d7f1a63)
+    __table_args__ = (
+        db.Index("ix_product_sku", "sku", unique=True),
+        db.Index("ix_product_featured_id", "is_featured", "id"),
+        db.Index("ix_product_category_id", "category_id", "id"),
+        db.Index("ix_product_discount_id", "discount_percent", "id"),
+        db.Index("ix_product_sale_price_id", "sale_price", "id"),
+        db.Index("ix_product_created_at", "created_at"),
+        # partial: only on-sale rows, matches the ON_SALE filter below
+        db.Index("ix_product_on_sale", "id",
+                 sqlite_where=literal_column("discount_percent > 0"),
+                 postgresql_where=literal_column("discount_percent > 0")),
+        # partial: products whose image_url is waiting for images.fetch
+        db.Index("ix_product_image_pending", "id",
+                 sqlite_where=literal_column("image_key IS NULL"),
+                 postgresql_where=literal_column("image_key IS NULL")),
+    )
+
+
+# Rendered as a literal (not a bound parameter) so SQLite can match it
+# against the partial index ix_product_on_sale.
+ON_SALE = Product.discount_percent > literal_column("0")
 
 
 class AdminSettings(db.Model):
@@ -88,12 +110,34 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     razorpay_order_id = db.Column(db.String(200))
     razorpay_payment_id = db.Column(db.String(200))
-    total_amount = db.Column(db.Float, default=0.0)
+    # why creating the gateway order failed, shown on the payment page
+    payment_error = db.Column(db.String(255), nullable=True)
+    # who cancelled it: "expired" (the inventory sweeper) or "admin"; only
+    # expired ones are revived if the gateway turns out to have been paid
+    cancel_reason = db.Column(db.String(20), nullable=True)
+    # money is stored in integer paise, never as floats
+    total_paise = db.Column(db.BigInteger, nullable=False, default=0)
+    # from the checkout form: a resubmitted form finds this order instead
+    # of placing another
+    idempotency_key = db.Column(db.String(64), nullable=True)
 
     items = db.relationship(
         "OrderItem", backref="order", lazy=True, cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        db.Index("ix_order_status_created_at", "status", "created_at"),
+        db.Index("ix_order_created_at", "created_at"),
+        db.Index("ix_order_user_id", "user_id"),
+        # admin order filters/sorts (a0c4e7d2b913)
+        db.Index("ix_order_customer_email_created_at", "customer_email", "created_at"),
+        db.Index("ix_order_pincode_created_at", "pincode", "created_at"),
+        db.Index("ix_order_total_paise_id", "total_paise", "id"),
+        db.Index("ix_order_idempotency_key", "idempotency_key", unique=True),
+        # webhooks and the reconciler look orders up by gateway order id
+        db.Index("ix_order_razorpay_order_id", "razorpay_order_id"),
+    )
+
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -101,5 +145,115 @@ class OrderItem(db.Model):
     product_id = db.Column(db.Integer, db.ForeignKey("product.id"), nullable=False)
     product_title = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.Integer, default=1)
-    price_each = db.Column(db.Float, default=0.0)
+    price_each_paise = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_order_item_order_id", "order_id"),
+    )
+
 
+
+class StatCounter(db.Model):
+    """Running totals for the dashboard, maintained by stats.py."""
+    name = db.Column(db.String(60), primary_key=True)  # "products", "orders", "status:Paid", ...
+    value = db.Column(db.BigInteger, nullable=False, default=0)  # "orders_paise" outgrows 32 bits
+
+
+class StatBucket(db.Model):
+    """Orders placed and revenue per hour ("h") or day ("d"), by order time."""
+    granularity = db.Column(db.String(1), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue_paise = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class StatDelta(db.Model):
+    """A change to a StatCounter (``name``) or a StatBucket (``granularity``
+    and ``bucket_start``) not yet folded in by stats.rollup. Only ever
+    inserted by the transactions that cause it, so they never wait on
+    each other."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(60), nullable=True)
+    granularity = db.Column(db.String(1), nullable=True)
+    bucket_start = db.Column(db.DateTime, nullable=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue_paise = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+class CartItem(db.Model):
+    """One line of a cart; ``owner`` is "u:<user id>" or "a:<visitor token>"."""
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id", ondelete="CASCADE"), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("owner", "product_id", name="uq_cart_item_owner_product"),
+    )
+
+
+class WishlistItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.String(64), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id", ondelete="CASCADE"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint("owner", "product_id", name="uq_wishlist_item_owner_product"),
+    )
+
+
+class StockReservation(db.Model):
+    """Units taken off ``product.stock`` for a cart (``owner``) or an unpaid
+    order (``order_id``) until ``expires_at``; see inventory.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey("product.id", ondelete="CASCADE"), nullable=False)
+    owner = db.Column(db.String(64), nullable=True)
+    order_id = db.Column(db.Integer, db.ForeignKey("order.id"), nullable=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index("ix_stock_reservation_owner_product", "owner", "product_id"),
+        db.Index("ix_stock_reservation_order_id", "order_id"),
+        db.Index("ix_stock_reservation_expires_at", "expires_at"),
+    )
+
+
+class PaymentEvent(db.Model):
+    """A gateway webhook delivery, kept so redeliveries are recognised."""
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.String(100), nullable=False)
+    event = db.Column(db.String(60), nullable=False)
+    razorpay_order_id = db.Column(db.String(200), nullable=True)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index("ix_payment_event_event_id", "event_id", unique=True),
+    )
+
+
+class Job(db.Model):
+    """A unit of background work; see jobs.py."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    # enqueueing twice with the same key creates one job
+    idempotency_key = db.Column(db.String(200), unique=True, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="queued")  # queued/running/done/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # a running job whose lease has expired is picked up again
+    locked_until = db.Column(db.DateTime, nullable=True)
+    locked_by = db.Column(db.String(80), nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index("ix_job_status_run_at", "status", "run_at"),
+    )
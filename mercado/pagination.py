@@ -0,0 +1,126 @@
+"""Keyset (cursor) pagination.
+
+A page is fetched with ``WHERE (sort keys) < (last row's keys)`` instead of
+OFFSET, so page N costs the same as page 1. The cursor is the last row's key
+values, JSON-encoded into an opaque URL-safe token.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from .models import Product, Order
+
+class InvalidCursor(ValueError):
+    pass
+
+
+_INT64 = 2 ** 63 - 1
+
+
+def number(value):
+    """Cursor value -> bind value for a numeric key. The cursor comes from
+    the URL, so anything but a number the database can bind is forged."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or abs(value) > _INT64:
+        raise ValueError(value)
+    return value
+
+
+# expr: what to ORDER BY; value: how to read the same key back from a row
+# (JSON-serialisable); load: turns that cursor value back into a bind value
+SortKey = namedtuple("SortKey", "expr value desc load", defaults=(number,))
+Page = namedtuple("Page", "items next_cursor")
+
+
+PRODUCT_SORTS = {
+    "newest": (
+        SortKey(Product.id, lambda p: p.id, True),
+    ),
+    "price_asc": (
+        SortKey(Product.sale_price, lambda p: p.sale_price, False),
+        SortKey(Product.id, lambda p: p.id, False),
+    ),
+    "price_desc": (
+        SortKey(Product.sale_price, lambda p: p.sale_price, True),
+        SortKey(Product.id, lambda p: p.id, True),
+    ),
+    "discount": (
+        SortKey(Product.discount_percent, lambda p: p.discount_percent, True),
+        SortKey(Product.id, lambda p: p.id, True),
+    ),
+}
+
+ORDER_SORTS = {
+    "newest": (
+        SortKey(Order.created_at, lambda o: o.created_at.isoformat(), True, datetime.fromisoformat),
+        SortKey(Order.id, lambda o: o.id, True),
+    ),
+    "oldest": (
+        SortKey(Order.created_at, lambda o: o.created_at.isoformat(), False, datetime.fromisoformat),
+        SortKey(Order.id, lambda o: o.id, False),
+    ),
+    "total_desc": (
+        SortKey(Order.total_paise, lambda o: o.total_paise, True),
+        SortKey(Order.id, lambda o: o.id, True),
+    ),
+    "total_asc": (
+        SortKey(Order.total_paise, lambda o: o.total_paise, False),
+        SortKey(Order.id, lambda o: o.id, False),
+    ),
+}
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    # a real cursor is a few short values; a long one is forged (and deep
+    # JSON nesting would hit the recursion limit)
+    if len(token) > 512:
+        raise InvalidCursor(token[:32])
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError) as exc:
+        raise InvalidCursor(token) from exc
+    if not isinstance(values, list):
+        raise InvalidCursor(token)
+    return values
+
+
+def _after(keys, values):
+    """Rows strictly after ``values`` in ``keys`` order, expanded as
+    (a > x) OR (a = x AND b > y) ... so it works on every backend."""
+    if len(values) != len(keys):
+        raise InvalidCursor(values)
+    try:
+        values = [k.load(v) for k, v in zip(keys, values)]
+    except (TypeError, ValueError, OverflowError) as exc:
+        raise InvalidCursor(values) from exc
+    clauses = []
+    for i, key in enumerate(keys):
+        step = key.expr < values[i] if key.desc else key.expr > values[i]
+        equal = [keys[j].expr == values[j] for j in range(i)]
+        clauses.append(and_(*equal, step))
+    return or_(*clauses)
+
+
+def keyset_query(query, keys, cursor=None, per_page=24):
+    if cursor:
+        query = query.filter(_after(keys, decode_cursor(cursor)))
+    order = [k.expr.desc() if k.desc else k.expr.asc() for k in keys]
+    # one extra row tells us whether there is a next page
+    return query.order_by(*order).limit(per_page + 1)
+
+
+def keyset_page(query, keys, cursor=None, per_page=24):
+    rows = keyset_query(query, keys, cursor, per_page).all()
+    if len(rows) <= per_page:
+        return Page(rows, None)
+    rows = rows[:per_page]
+    return Page(rows, encode_cursor([k.value(rows[-1]) for k in keys]))
@@ -0,0 +1,449 @@
+"""Payment gateway access.
+
+Gateways are cached per key pair, so every checkout reuses one pooled
+keep-alive HTTP session instead of opening a new TLS connection. Calls have a
+(connect, read) timeout and are retried with exponential backoff on
+timeouts, connection errors and gateway 5xx. With PAYMENT_GATEWAY="stub"
+no network is used, and ``stub_app()`` is a tiny local HTTP stand-in for the
+Razorpay orders API, to point PAYMENT_GATEWAY_URL at.
+
+An order becomes Paid in one of three ways, all through ``mark_paid``: the
+checkout callback (after checking the payment signature), a signed gateway
+webhook (recorded once per event id and reconciled by ``flask worker``), or
+the periodic reconciler, which asks the gateway about orders left Pending.
+"""
+import hashlib
+import hmac
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import razorpay
+import requests
+from flask import Flask, current_app, jsonify, request
+from requests.adapters import HTTPAdapter
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from .database import insert_new
+from .extensions import db
+from .jobs import enqueue, job
+from .models import AdminSettings, Order, PaymentEvent
+from . import inventory, metrics, stats
+
+
+class GatewayError(Exception):
+    """The gateway could not be reached or refused the request."""
+
+
+class RazorpayGateway:
+    def __init__(self, key_id, key_secret, base_url=None, timeout=(3.05, 10),
+                 retries=2, backoff=0.5, pool_size=10):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        options = {"base_url": base_url} if base_url else {}
+        self.client = razorpay.Client(session=session, auth=(key_id, key_secret), **options)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    def _call(self, fn, *args, before_retry=None):
+        for attempt in range(self.retries + 1):
+            if attempt and before_retry is not None:
+                found = before_retry()
+                if found is not None:
+                    return found
+            try:
+                return fn(*args, timeout=self.timeout)
+            except razorpay.errors.BadRequestError as exc:
+                # our fault; retrying will not help
+                raise GatewayError(str(exc)) from exc
+            except (requests.RequestException, razorpay.errors.ServerError,
+                    razorpay.errors.GatewayError, ValueError) as exc:
+                if attempt == self.retries:
+                    raise GatewayError(str(exc) or type(exc).__name__) from exc
+                time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() / 4))
+
+    def create_order(self, amount_paise, receipt, currency="INR"):
+        # a timed-out create may still have reached the gateway, so a retry
+        # first looks for the order it made
+        return self._call(self.client.order.create, {
+            "amount": amount_paise,
+            "currency": currency,
+            "payment_capture": 1,
+            "receipt": receipt,
+        }, before_retry=lambda: self.find_order(receipt, amount_paise))
+
+    def find_order(self, receipt, amount_paise):
+        """The unpaid gateway order already created for ``receipt``, or None."""
+        page = self._call(self.client.order.all, {"receipt": receipt, "count": 10})
+        return _unpaid_match(page.get("items", []), amount_paise)
+
+    def fetch_order(self, gateway_order_id):
+        return self._call(self.client.order.fetch, gateway_order_id)
+
+    def order_payments(self, gateway_order_id):
+        return self._call(self.client.order.payments, gateway_order_id).get("items", [])
+
+    def list_orders(self, since, until):
+        """Yield the gateway orders created between two unix times, 100 per request."""
+        skip = 0
+        while True:
+            page = self._call(self.client.order.all, {"from": since, "to": until, "count": 100, "skip": skip})
+            items = page.get("items", [])
+            yield from items
+            if len(items) < 100:
+                return
+            skip += len(items)
+
+
+class StubGateway:
+    """In-process gateway for development and tests; PAYMENT_STUB_DELAY
+    simulates a slow gateway."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.orders = {}
+        self.payments = {}
+
+    def create_order(self, amount_paise, receipt, currency="INR"):
+        time.sleep(self.delay)
+        gateway_order = {"id": "order_stub_" + uuid.uuid4().hex[:14], "amount": amount_paise,
+                         "currency": currency, "receipt": receipt, "status": "created",
+                         "created_at": int(time.time())}
+        self.orders[gateway_order["id"]] = gateway_order
+        self.payments[gateway_order["id"]] = []
+        return gateway_order
+
+    def find_order(self, receipt, amount_paise):
+        time.sleep(self.delay)
+        return _unpaid_match([o for o in self.orders.values() if o["receipt"] == receipt], amount_paise)
+
+    def fetch_order(self, gateway_order_id):
+        time.sleep(self.delay)
+        try:
+            return self.orders[gateway_order_id]
+        except KeyError:
+            raise GatewayError(f"unknown order {gateway_order_id}") from None
+
+    def order_payments(self, gateway_order_id):
+        self.fetch_order(gateway_order_id)
+        return self.payments[gateway_order_id]
+
+    def list_orders(self, since, until):
+        time.sleep(self.delay)
+        return [o for o in self.orders.values() if since <= o["created_at"] <= until]
+
+    def pay(self, gateway_order_id):
+        """Simulate the customer paying; returns the captured payment."""
+        gateway_order = self.fetch_order(gateway_order_id)
+        payment = {"id": "pay_stub_" + uuid.uuid4().hex[:14], "order_id": gateway_order_id,
+                   "amount": gateway_order["amount"], "status": "captured"}
+        gateway_order.update(status="paid", amount_paid=gateway_order["amount"])
+        self.payments[gateway_order_id].append(payment)
+        return payment
+
+
+def _unpaid_match(gateway_orders, amount_paise):
+    # order ids can be reused after a rolled-back checkout, so the amount must match too
+    return next((o for o in gateway_orders
+                 if o.get("amount") == amount_paise and o.get("status") == "created"), None)
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway(key_id, key_secret):
+    cfg = current_app.config
+    if cfg.get("PAYMENT_GATEWAY") == "stub":
+        key = ("stub",)
+        make = lambda: StubGateway(cfg.get("PAYMENT_STUB_DELAY", 0.0))
+    else:
+        base_url = cfg.get("PAYMENT_GATEWAY_URL") or None
+        key = (key_id, key_secret, base_url)
+        make = lambda: RazorpayGateway(
+            key_id, key_secret, base_url=base_url,
+            timeout=(cfg.get("PAYMENT_CONNECT_TIMEOUT", 3.05), cfg.get("PAYMENT_READ_TIMEOUT", 10)),
+            retries=cfg.get("PAYMENT_RETRIES", 2),
+            pool_size=cfg.get("PAYMENT_POOL_SIZE", 10),
+        )
+    gateway = _gateways.get(key)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(key)
+            if gateway is None:
+                gateway = _gateways[key] = make()
+    return gateway
+
+
+def keys():
+    """(key id, key secret): the admin settings, else the environment."""
+    settings = AdminSettings.query.first()
+    cfg = current_app.config
+    key_id = (settings.razorpay_key_id if settings else None) or cfg.get("RAZORPAY_KEY_ID", "")
+    key_secret = (settings.razorpay_key_secret if settings else None) or cfg.get("RAZORPAY_KEY_SECRET", "")
+    return key_id, key_secret
+
+
+# ---------------- Order creation ----------------
+def create_gateway_order(order, key_id, key_secret):
+    """Create the gateway order for ``order`` and store its id; an order
+    that already has one keeps it. Raises GatewayError."""
+    if order.razorpay_order_id:
+        return order.razorpay_order_id
+    gateway_order = get_gateway(key_id, key_secret).create_order(
+        order.total_paise, f"order_{order.id}")
+    order.razorpay_order_id = gateway_order.get("id")
+    order.payment_error = None
+    db.session.commit()
+    return order.razorpay_order_id
+
+
+def gateway_order_failed(order, exc):
+    """Cancel ``order`` after its gateway order could not be created, giving
+    its held units back, in a short transaction of its own."""
+    # on the order, so the payment page sees it whichever worker it polls
+    order.payment_error = str(exc)[:255]
+    # the customer checks out again; don't keep the stock held
+    inventory.cancel(order)
+    db.session.commit()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get("PAYMENT_WORKERS", 4),
+                    thread_name_prefix="payments",
+                )
+    return _executor
+
+
+def _create_in_background(app, order_id, key_id, key_secret):
+    with app.app_context():
+        order = db.session.get(Order, order_id)
+        try:
+            create_gateway_order(order, key_id, key_secret)
+        except GatewayError as exc:
+            db.session.rollback()
+            current_app.logger.warning("gateway order for #%s failed: %s", order_id, exc)
+            metrics.inc("swiftcart_payments_total", outcome="gateway_error", via="checkout")
+            gateway_order_failed(order, exc)
+
+
+def create_gateway_order_async(order, key_id, key_secret):
+    """Queue gateway order creation; the payment page polls ``order_status``."""
+    app = current_app._get_current_object()
+    _get_executor().submit(_create_in_background, app, order.id, key_id, key_secret)
+
+
+def order_status(order):
+    return {
+        "ready": bool(order.razorpay_order_id),
+        "razorpay_order_id": order.razorpay_order_id,
+        "error": None if order.razorpay_order_id else order.payment_error,
+    }
+
+
+# ---------------- Signatures ----------------
+def sign(secret, message):
+    """HMAC-SHA256 hex digest of ``message`` (bytes), as the gateway signs."""
+    return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _hmac_ok(secret, message, signature):
+    return bool(signature) and hmac.compare_digest(sign(secret, message), signature)
+
+
+def verify_payment(gateway_order_id, payment_id, signature, key_secret):
+    """Check the signature checkout.js hands back with a successful payment."""
+    return _hmac_ok(key_secret, f"{gateway_order_id}|{payment_id}".encode(), signature)
+
+
+def verify_webhook(body, signature):
+    """Check a webhook body against RAZORPAY_WEBHOOK_SECRET."""
+    secret = current_app.config.get("RAZORPAY_WEBHOOK_SECRET")
+    return bool(secret) and _hmac_ok(secret, body, signature)
+
+
+# ---------------- Settlement ----------------
+PAID_STATUSES = {"Paid", "Shipped", "Delivered"}
+
+
+def mark_paid(order, payment_id, via="callback"):
+    """Record ``payment_id`` against ``order``. Callback, webhook and
+    reconciler (``via``) can race on the same order; a conditional UPDATE
+    lets exactly one of them win, so stock and stats are settled once.
+    Returns True for the winner. Part of the caller's transaction."""
+    old, reason = order.status, order.cancel_reason
+    if old in PAID_STATUSES:
+        return False
+    won = db.session.execute(
+        update(Order).where(Order.id == order.id, Order.status == old,
+                            Order.cancel_reason.is_not_distinct_from(reason))
+        .values(status="Paid", razorpay_payment_id=payment_id, cancel_reason=None),
+        execution_options={"synchronize_session": False},
+    ).rowcount
+    if not won:
+        db.session.refresh(order)
+        return False
+    inventory.settle(order)  # still sees the old status
+    set_committed_value(order, "status", "Paid")
+    set_committed_value(order, "razorpay_payment_id", payment_id)
+    set_committed_value(order, "cancel_reason", None)
+    stats.status_changed(order, old, "Paid")
+    enqueue("order.paid", {"order_id": order.id}, key=f"order.paid:{order.id}")
+    metrics.inc("swiftcart_payments_total", outcome="paid", via=via)
+    return True
+
+
+def _captured_payment(gateway, gateway_order_id):
+    for payment in gateway.order_payments(gateway_order_id):
+        if payment.get("status") == "captured":
+            return payment.get("id")
+    return None
+
+
+@job("payments.reconcile")
+def reconcile(razorpay_order_id, payment_id=None):
+    """Bring one order in line with the gateway (queued by the webhook)."""
+    order = Order.query.filter_by(razorpay_order_id=razorpay_order_id).first()
+    if order is None or order.status in PAID_STATUSES:
+        return
+    gateway = get_gateway(*keys())
+    if gateway.fetch_order(razorpay_order_id).get("status") != "paid":
+        return
+    mark_paid(order, payment_id or _captured_payment(gateway, razorpay_order_id), via="webhook")
+
+
+def reconcile_pending(older_than=None, batch=None):
+    """Ask the gateway about unpaid online orders placed more than
+    ``older_than`` seconds ago (PAYMENT_RECONCILE_AFTER) and at most
+    PAYMENT_RECONCILE_DAYS ago. Orders the sweeper cancelled are included:
+    when callback and webhook are both lost, it cancels a paid order once its
+    hold runs out, and only this brings it back (mark_paid takes the units
+    again). Orders an admin cancelled stay cancelled. One listing request per 100 gateway orders in that window rather
+    than one per order; only the orders it reports paid are loaded, ``batch``
+    at a time. Returns how many were paid."""
+    cfg = current_app.config
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=older_than if older_than is not None else cfg.get("PAYMENT_RECONCILE_AFTER", 600))
+    unpaid = (or_(Order.status == "Pending", and_(Order.status == "Cancelled", Order.cancel_reason == "expired")),
+              Order.razorpay_order_id.isnot(None),
+              Order.created_at < cutoff,
+              Order.created_at >= now - timedelta(days=cfg.get("PAYMENT_RECONCILE_DAYS", 2)))
+    oldest = db.session.scalar(select(func.min(Order.created_at)).where(*unpaid))
+    if oldest is None:
+        return 0
+    key_id, key_secret = keys()
+    if not (key_id and key_secret):
+        return 0
+    gateway = get_gateway(key_id, key_secret)
+    epoch = datetime(1970, 1, 1)
+    # a little slack either side for clock differences with the gateway
+    since = int((oldest - epoch).total_seconds()) - 300
+    until = int((now - epoch).total_seconds()) + 300
+    paid_ids = [o["id"] for o in gateway.list_orders(since, until) if o.get("status") == "paid"]
+    paid = 0
+    batch = batch or cfg.get("PAYMENT_RECONCILE_BATCH", 200)
+    for start in range(0, len(paid_ids), batch):
+        for order in Order.query.filter(Order.razorpay_order_id.in_(paid_ids[start:start + batch]), *unpaid):
+            paid += mark_paid(order, _captured_payment(gateway, order.razorpay_order_id), via="reconciler")
+        db.session.commit()
+    return paid
+
+
+@job("payments.reconcile_pending", max_attempts=1, timeout=600, every=300)
+def reconcile_pending_job():
+    paid = reconcile_pending()
+    if paid:
+        current_app.logger.info("payment reconciler: %s stuck orders marked paid", paid)
+
+
+# ---------------- Webhook ----------------
+def _gateway_ids(payload):
+    entities = payload.get("payload") or {}
+    payment = (entities.get("payment") or {}).get("entity") or {}
+    order = (entities.get("order") or {}).get("entity") or {}
+    return order.get("id") or payment.get("order_id"), payment.get("id")
+
+
+def record_event(body, event_id=None):
+    """Store a verified webhook once and queue its reconciliation. Returns
+    False for a redelivery of an event already recorded."""
+    payload = json.loads(body)
+    # Razorpay sends X-Razorpay-Event-Id; fall back to the body's digest
+    event_id = event_id or hashlib.sha256(body).hexdigest()
+    gateway_order_id, payment_id = _gateway_ids(payload)
+    # stored in the same transaction as the reconcile job, so a crash in
+    # between leaves neither and the gateway's redelivery is processed
+    if insert_new(db.session, PaymentEvent, dict(event_id=event_id, event=str(payload.get("event", ""))[:60],
+                                                 razorpay_order_id=gateway_order_id, payload=payload)) is None:
+        db.session.rollback()
+        return False
+    if gateway_order_id:
+        enqueue("payments.reconcile", {"razorpay_order_id": gateway_order_id, "payment_id": payment_id},
+                key=f"payments.reconcile:{event_id}")
+    db.session.commit()
+    return True
+
+
+# ---------------- Local stub server ----------------
+def stub_app(delay=0.0):
+    """A WSGI app answering the subset of the Razorpay orders API we use."""
+    stub = StubGateway(delay)
+    app = Flask("payments_stub")
+
+    @app.post("/v1/orders")
+    def create():
+        data = request.get_json(force=True)
+        return jsonify(stub.create_order(data["amount"], data.get("receipt"), data.get("currency", "INR")))
+
+    def bad_request(exc):
+        return jsonify({"error": {"code": "BAD_REQUEST_ERROR", "description": str(exc)}}), 400
+
+    @app.get("/v1/orders")
+    def list_all():
+        since = request.args.get("from", 0, type=int)
+        until = request.args.get("to", 2 ** 31, type=int)
+        skip, count = request.args.get("skip", 0, type=int), request.args.get("count", 10, type=int)
+        items = stub.list_orders(since, until)[skip:skip + count]
+        return jsonify({"entity": "collection", "count": len(items), "items": items})
+
+    @app.get("/v1/orders/<order_id>")
+    def fetch(order_id):
+        try:
+            return jsonify(stub.fetch_order(order_id))
+        except GatewayError as exc:
+            return bad_request(exc)
+
+    @app.get("/v1/orders/<order_id>/payments")
+    def payments(order_id):
+        try:
+            items = stub.order_payments(order_id)
+        except GatewayError as exc:
+            return bad_request(exc)
+        return jsonify({"entity": "collection", "count": len(items), "items": items})
+
+    # not part of the Razorpay API: lets a test or developer "pay" an order
+    @app.post("/v1/orders/<order_id>/pay")
+    def pay(order_id):
+        try:
+            return jsonify(stub.pay(order_id))
+        except GatewayError as exc:
+            return bad_request(exc)
+
+    return app
@@ -0,0 +1,56 @@
+"""Query-plan inspection for the queries behind each route (``flask perf explain``)."""
+from .extensions import db
+from .models import Product, Order, OrderItem, ON_SALE
+from .pagination import PRODUCT_SORTS, ORDER_SORTS, keyset_query
+from . import catalog
+
+
+def route_queries():
+    """(name, query) pairs mirroring what the routes run, with sample arguments."""
+    cats = catalog.categories()
+    cid = cats[0].id if cats else 1
+    per_page = 24
+    return [
+        ("shop.home featured", Product.query.filter_by(is_featured=True).order_by(Product.id.desc()).limit(8)),
+        ("shop.home sale", Product.query.filter(ON_SALE).order_by(Product.id.desc()).limit(8)),
+        ("shop.home latest", Product.query.order_by(Product.id.desc()).limit(8)),
+        ("shop.shop_all newest", keyset_query(Product.query, PRODUCT_SORTS["newest"], per_page=per_page)),
+        ("shop.shop_all sale", keyset_query(Product.query.filter(ON_SALE), PRODUCT_SORTS["newest"], per_page=per_page)),
+        ("shop.shop_all price_asc", keyset_query(Product.query, PRODUCT_SORTS["price_asc"], per_page=per_page)),
+        ("shop.shop_all price range", keyset_query(Product.query.filter(Product.sale_price.between(500, 2000)),
+                                                   PRODUCT_SORTS["price_asc"], per_page=per_page)),
+        ("shop.shop_all discount", keyset_query(Product.query, PRODUCT_SORTS["discount"], per_page=per_page)),
+        ("shop.category", keyset_query(Product.query.filter_by(category_id=cid), PRODUCT_SORTS["newest"],
+                                       per_page=per_page)),
+        ("admin.dashboard pending", Order.query.filter_by(status="Pending")),
+        ("admin.dashboard latest orders", Order.query.order_by(Order.created_at.desc()).limit(8)),
+        ("admin.orders newest", keyset_query(Order.query, ORDER_SORTS["newest"], per_page=50)),
+        ("admin.orders status", keyset_query(Order.query.filter_by(status="Paid"), ORDER_SORTS["newest"],
+                                             per_page=50)),
+        ("admin.orders email", keyset_query(Order.query.filter_by(customer_email="a@example.com"),
+                                            ORDER_SORTS["newest"], per_page=50)),
+        ("admin.orders total_desc", keyset_query(Order.query, ORDER_SORTS["total_desc"], per_page=50)),
+        ("admin.order_detail items", OrderItem.query.filter_by(order_id=1)),
+        ("orders by user", Order.query.filter_by(user_id=1)),
+    ]
+
+
+def explain(query):
+    """Return the database's plan for ``query`` as a list of text lines."""
+    engine = db.engine
+    compiled = query.statement.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(params[name] for name in compiled.positiontup)
+
+    if engine.dialect.name == "sqlite":
+        sql = "EXPLAIN QUERY PLAN " + str(compiled)
+    else:
+        sql = "EXPLAIN " + str(compiled)
+
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(sql, params).fetchall()
+    if engine.dialect.name == "sqlite":
+        # (id, parent, notused, detail)
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
@@ -0,0 +1,107 @@
+"""Pricing engine: computes the stored ``Product.sale_price``.
+
+The selling price is stored on the row so listings can sort and filter by it
+in SQL and templates just read it. ORM writes recompute it automatically;
+``reprice`` applies a discount to many products with batched UPDATEs.
+"""
+import math
+from decimal import Decimal, ROUND_HALF_UP
+
+from sqlalchemy import event, select, update
+
+from .extensions import db, cache
+from .models import Product
+from . import catalog
+
+
+def compute_sale_price(price, discount_percent):
+    if discount_percent and discount_percent > 0:
+        raw_price = price * (1 - discount_percent / 100)
+        # round down to nearest whole number
+        base = math.floor(raw_price)
+        # adjust to nearest xx99 (psychological pricing)
+        if base > 99:
+            return (base // 100) * 100 + 99
+        else:
+            return base
+    return round(price or 0, 2)
+
+
+def to_paise(rupees):
+    """Rupees (as stored on products) -> integer paise, rounding half up."""
+    return int((Decimal(str(rupees or 0)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def rupees(paise):
+    """Integer paise -> exact Decimal rupees, e.g. 123450 -> Decimal("1234.50")."""
+    return Decimal(paise or 0).scaleb(-2)
+
+
+@event.listens_for(Product, "before_insert")
+@event.listens_for(Product, "before_update")
+def _apply(mapper, connection, product):
+    product.sale_price = compute_sale_price(product.price, product.discount_percent)
+
+
+def _batches(ids, category_id, batch):
+    cols = select(Product.id, Product.price, Product.discount_percent, Product.category_id)
+    if category_id is not None:
+        cols = cols.where(Product.category_id == category_id)
+    if ids is not None:
+        ids = sorted(set(ids))
+        for i in range(0, len(ids), batch):
+            yield db.session.execute(cols.where(Product.id.in_(ids[i:i + batch]))).all()
+        return
+    last_id = 0
+    while True:
+        rows = db.session.execute(cols.where(Product.id > last_id).order_by(Product.id).limit(batch)).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def ids_for_skus(skus, batch=500):
+    """Map SKUs to product ids, looked up in batches."""
+    skus = list(set(skus))
+    found = {}
+    for i in range(0, len(skus), batch):
+        found.update(db.session.execute(
+            select(Product.sku, Product.id).where(Product.sku.in_(skus[i:i + batch]))).all())
+    return found
+
+
+def reprice(ids=None, category_id=None, discount=None, discounts=None, batch=500):
+    """Set discounts and recompute sale prices in batched UPDATEs.
+
+    Selects products by ``ids`` and/or ``category_id`` (all products when
+    both are None). ``discount`` applies one discount to every match;
+    ``discounts`` maps product id -> discount and wins over ``discount``.
+    With neither, the current discount is kept and only sale_price is
+    recomputed. Each batch is committed on its own. Returns the number of
+    products updated.
+    """
+    touched_categories = set()
+    updated = 0
+    for rows in _batches(ids, category_id, batch):
+        params = []
+        for pid, price, current, cid in rows:
+            d = current or 0
+            if discounts is not None and pid in discounts:
+                d = discounts[pid]
+            elif discount is not None:
+                d = discount
+            params.append({"id": pid, "discount_percent": d, "sale_price": compute_sale_price(price, d)})
+            touched_categories.add(cid)
+        if not params:
+            continue
+        # ORM bulk UPDATE by primary key: one executemany per batch
+        db.session.execute(update(Product), params)
+        db.session.commit()
+        cache.invalidate(*(f"product:{p['id']}" for p in params))
+        updated += len(params)
+
+    if updated:
+        catalog.bump("products")
+        cache.invalidate("listing", *(f"category:{cid}" for cid in touched_categories if cid))
+    return updated
@@ -0,0 +1,250 @@
+"""Bulk product import and export as CSV or JSON Lines.
+
+Both directions stream: rows are read and validated one at a time and
+written in chunks, each chunk committed in its own short transaction, and
+exports are generated in keyset batches. Memory therefore stays flat for any
+catalog size. A row whose ``id`` is an existing product (as in an export)
+updates that product, as does a row carrying a ``sku`` that already exists;
+everything else is inserted. A blank ``stock`` means untracked;
+files without a stock column leave existing products' stock alone, and
+for existing products a stock value is applied as the change from the
+level at import time (see ``inventory.restock``).
+Validation reuses ProductForm's rules (via ProductImportForm).
+"""
+import csv
+import io
+import json
+import os
+from collections import namedtuple
+
+from flask import current_app
+
+from sqlalchemy import insert, or_, select, update
+from werkzeug.datastructures import MultiDict
+
+from .extensions import db, cache
+from .forms import ProductImportForm
+from .models import Product
+from .jobs import job
+from . import catalog, inventory, pricing, search, stats
+
+FIELDS = ("sku", "title", "description", "price", "discount_percent",
+          "image_url", "is_featured", "category", "stock")
+EXPORT_FIELDS = ("id", *FIELDS, "sale_price")
+
+RowError = namedtuple("RowError", "line errors")
+
+
+class ImportResult:
+    MAX_ERRORS = 100
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []  # the first MAX_ERRORS RowErrors
+        self.error_count = 0
+
+    def fail(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(RowError(line, errors))
+
+
+def guess_format(filename, default="csv"):
+    name = (filename or "").lower()
+    if name.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if name.endswith(".csv"):
+        return "csv"
+    return default
+
+
+# ---------------- Import ----------------
+def read_rows(stream, fmt):
+    """Yield (line number, dict) from a text stream."""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield line_no, row if isinstance(row, dict) else {"__invalid__": "not a JSON object"}
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+
+
+def _category_ids():
+    by_name = {c.name.lower(): c.id for c in catalog.categories()}
+    by_name.update({str(c.id): c.id for c in catalog.categories()})
+    return by_name
+
+
+def validate(row, categories, choices):
+    """Return (values, None) for a valid row or (None, {field: [errors]})."""
+    if "__invalid__" in row:
+        return None, {"row": [row["__invalid__"]]}
+    data = {k: "" if row.get(k) is None else str(row.get(k)).strip() for k in ("id", *FIELDS)}
+    data["is_featured"] = "y" if data["is_featured"].lower() in ("1", "true", "yes", "y") else ""
+    data.pop("category")
+    category = row.get("category") or row.get("category_id") or ""
+    cid = categories.get(str(category).strip().lower())
+    data["category_id"] = str(cid) if cid else ""
+
+    form = ProductImportForm(formdata=MultiDict(data))
+    form.category_id.choices = choices
+    if not form.validate():
+        return None, form.errors
+    discount = form.discount_percent.data or 0
+    values = {
+        "id": form.id.data,
+        "sku": form.sku.data or None,
+        "title": form.title.data,
+        "description": form.description.data or "",
+        "price": form.price.data,
+        "discount_percent": discount,
+        "sale_price": pricing.compute_sale_price(form.price.data, discount),
+        "image_url": form.image_url.data or "",
+        "is_featured": bool(form.is_featured.data),
+        "category_id": form.category_id.data,
+    }
+    if "stock" in row:
+        values["stock"] = form.stock.data
+    return values, None
+
+
+def _write_chunk(chunk, result):
+    ids = [v["id"] for v in chunk if v["id"]]
+    skus = [v["sku"] for v in chunk if v["sku"]]
+    by_id, by_sku, old_categories = {}, {}, set()
+    if ids or skus:
+        for row in db.session.execute(
+                select(Product.id, Product.sku, Product.category_id, Product.image_url, Product.image_key,
+                       Product.stock).where(or_(Product.id.in_(ids), Product.sku.in_(skus)))):
+            by_id[row.id] = row
+            if row.sku:
+                by_sku[row.sku] = row
+            old_categories.add(row.category_id)
+
+    # a row matches on its id, else on its sku; the last row wins when
+    # several match one product (or share a new SKU) within a chunk
+    matched, new_by_sku, no_sku = {}, {}, []
+    for values in chunk:
+        values = dict(values)
+        found = by_id.get(values.pop("id")) or (values["sku"] and by_sku.get(values["sku"]))
+        if found:
+            matched[found.id] = (found, values)
+        elif values["sku"]:
+            new_by_sku[values["sku"]] = values
+        else:
+            no_sku.append(values)
+
+    # bulk writes skip images.py's attribute event: a changed URL is marked
+    # for fetching here
+    updates = [{"id": pid, **values,
+                "image_key": found.image_key if values["image_url"] == found.image_url else None}
+               for pid, (found, values) in matched.items()]
+    # existing products' stock moves by the difference to the level just
+    # read, through inventory.py, so sales made meanwhile are kept
+    restocks = [(u["id"], matched[u["id"]][0].stock, u.pop("stock")) for u in updates if "stock" in u]
+    inserts = [{"stock": None, **values} for values in new_by_sku.values()]
+    inserts += [{"stock": None, **values} for values in no_sku]
+    if updates:
+        # ORM bulk UPDATE by primary key: one executemany
+        db.session.execute(update(Product), updates)
+    for pid, loaded, new in restocks:
+        inventory.restock(pid, loaded, new)
+    new_ids = []
+    if inserts:
+        new_ids = db.session.scalars(insert(Product).returning(Product.id), inserts).all()
+        stats.adjust(products=len(inserts))
+    touched = [u["id"] for u in updates] + list(new_ids)
+    search.index_products(touched)
+    db.session.commit()
+
+    cache.invalidate(*(f"product:{u['id']}" for u in updates),
+                     *{f"category:{cid}" for cid in old_categories | {v["category_id"] for v in chunk} if cid})
+    result.updated += len(updates)
+    result.created += len(inserts)
+
+
+def import_products(rows, chunk_size=1000, dry_run=False):
+    """Validate and upsert ``rows`` ((line, dict) pairs) in chunks."""
+    result = ImportResult()
+    categories = _category_ids()
+    choices = catalog.category_choices()
+    chunk = []
+    for line, row in rows:
+        values, errors = validate(row, categories, choices)
+        if errors:
+            result.fail(line, errors)
+            continue
+        chunk.append(values)
+        if len(chunk) >= chunk_size:
+            if not dry_run:
+                _write_chunk(chunk, result)
+            chunk = []
+    if chunk and not dry_run:
+        _write_chunk(chunk, result)
+    if result.created or result.updated:
+        catalog.bump("products")
+        cache.invalidate("listing")
+    return result
+
+
+@job("catalog.import", max_attempts=1, timeout=3600)
+def import_file(path, fmt):
+    """Import an uploaded file too big to process inside the request."""
+    try:
+        with open(path, newline="", encoding="utf-8-sig") as fh:
+            result = import_products(read_rows(fh, fmt))
+    finally:
+        os.remove(path)
+    current_app.logger.info("catalog import %s: %s created, %s updated, %s rejected",
+                            os.path.basename(path), result.created, result.updated, result.error_count)
+
+
+# ---------------- Export ----------------
+def _export_rows(batch=1000):
+    names = {c.id: c.name for c in catalog.categories()}
+    cols = select(Product.id, Product.sku, Product.title, Product.description, Product.price,
+                  Product.discount_percent, Product.image_url, Product.is_featured,
+                  Product.category_id, Product.sale_price, Product.stock).order_by(Product.id).limit(batch)
+    last_id = 0
+    while True:
+        rows = db.session.execute(cols.where(Product.id > last_id)).all()
+        if not rows:
+            return
+        for r in rows:
+            yield {
+                "id": r.id, "sku": r.sku or "", "title": r.title, "description": r.description or "",
+                "price": r.price, "discount_percent": r.discount_percent or 0,
+                "image_url": r.image_url or "", "is_featured": bool(r.is_featured),
+                "category": names.get(r.category_id, ""), "stock": "" if r.stock is None else r.stock,
+                "sale_price": r.sale_price,
+            }
+        last_id = rows[-1].id
+
+
+def export_products(fmt="csv", batch=1000):
+    """Yield the catalog as text chunks (one per ``batch`` rows)."""
+    buf = io.StringIO()
+    writer = None
+    if fmt == "csv":
+        writer = csv.DictWriter(buf, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+    n = 0
+    for row in _export_rows(batch):
+        if writer:
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(row, ensure_ascii=False) + "\n")
+        n += 1
+        if n % batch == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
@@ -0,0 +1,201 @@
+"""Accounting exports: order lines as CSV/JSONL/columnar CSV, and a GST summary.
+
+Exports read order lines in batches of ``REPORT_BATCH_SIZE``. On SQLite each
+batch is its own short read transaction (keyset on order_item.id), so a
+long export never holds the database lock that checkout's writes wait on.
+On PostgreSQL the rows come through a server-side cursor (``yield_per``).
+Either way memory stays flat and a streamed download yields between batches.
+Amounts are summed in integer paise and written as exact two-decimal rupees.
+"""
+import csv
+import io
+import json
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from .extensions import db
+from .models import Category, Order, OrderItem, Product
+from .pricing import rupees
+from .stats import REVENUE_STATUSES
+
+# (column, type) of one exported order line; the types double as the
+# schema for the columnar format
+COLUMNS = (
+    ("order_id", "int64"),
+    ("created_at", "timestamp"),
+    ("status", "string"),
+    ("customer_name", "string"),
+    ("customer_email", "string"),
+    ("city", "string"),
+    ("state", "string"),
+    ("pincode", "string"),
+    ("order_total", "decimal(14,2)"),
+    ("razorpay_payment_id", "string"),
+    ("item_id", "int64"),
+    ("product_id", "int64"),
+    ("product_title", "string"),
+    ("quantity", "int64"),
+    ("price_each", "decimal(14,2)"),
+    ("line_total", "decimal(14,2)"),
+)
+FIELDNAMES = [name for name, _ in COLUMNS]
+FORMATS = ("csv", "jsonl", "columnar")
+
+
+def parse_date(value):
+    """``YYYY-MM-DD`` -> datetime, or None for an empty value. Raises ValueError."""
+    return datetime.strptime(value, "%Y-%m-%d") if value else None
+
+
+def _filtered(stmt, date_from=None, date_to=None, statuses=None):
+    if date_from:
+        stmt = stmt.where(Order.created_at >= date_from)
+    if date_to:
+        # inclusive of the whole "to" day
+        stmt = stmt.where(Order.created_at < date_to + timedelta(days=1))
+    if statuses:
+        stmt = stmt.where(Order.status.in_(statuses))
+    return stmt
+
+
+def _lines_stmt(**filters):
+    return _filtered(
+        select(Order.id, Order.created_at, Order.status, Order.customer_name, Order.customer_email,
+               Order.city, Order.state, Order.pincode, Order.total_paise, Order.razorpay_payment_id,
+               OrderItem.id, OrderItem.product_id, OrderItem.product_title, OrderItem.quantity,
+               OrderItem.price_each_paise)
+        .join(OrderItem, OrderItem.order_id == Order.id),
+        **filters,
+    ).order_by(OrderItem.id)
+
+
+def _row(r):
+    qty, each = r[13] or 0, r[14] or 0
+    row = dict(zip(FIELDNAMES, (*r, qty * each)))
+    for name in ("order_total", "price_each", "line_total"):
+        row[name] = rupees(row[name])
+    return row
+
+
+def _json_default(value):
+    # exact amounts are written as strings, "1234.50"
+    return str(value) if isinstance(value, Decimal) else value.isoformat()
+
+
+def order_lines(batch=None, **filters):
+    """Yield one dict per order line matching ``filters``."""
+    batch = batch or current_app.config.get("REPORT_BATCH_SIZE", 2000)
+    pause = current_app.config.get("REPORT_BATCH_PAUSE", 0.0)
+    stmt = _lines_stmt(**filters)
+
+    if db.engine.dialect.name == "postgresql":
+        result = db.session.execute(stmt, execution_options={"yield_per": batch})
+        for part in result.partitions():
+            for r in part:
+                yield _row(r)
+            if pause:
+                time.sleep(pause)
+        return
+
+    last_id = 0
+    while True:
+        rows = db.session.execute(stmt.where(OrderItem.id > last_id).limit(batch)).all()
+        # end the read transaction between batches so writers are never held up
+        db.session.rollback()
+        if not rows:
+            return
+        for r in rows:
+            yield _row(r)
+        last_id = rows[-1][10]
+        if pause:
+            time.sleep(pause)
+
+
+def _columnar(value, kind):
+    if value is None:
+        return ""
+    if kind == "timestamp":
+        return value.strftime("%Y-%m-%dT%H:%M:%S.%f")
+    if kind == "string":
+        # one physical line per record, for readers that split on newlines
+        return str(value).replace("\r", " ").replace("\n", " ")
+    return value
+
+
+def export_orders(fmt="csv", **filters):
+    """Yield the export as text chunks, one per batch of lines."""
+    buf = io.StringIO()
+    writer = None
+    if fmt in ("csv", "columnar"):
+        writer = csv.DictWriter(buf, fieldnames=FIELDNAMES, lineterminator="\n" if fmt == "columnar" else "\r\n")
+        writer.writeheader()
+    flush_every = current_app.config.get("REPORT_BATCH_SIZE", 2000)
+    for n, row in enumerate(order_lines(**filters), 1):
+        if fmt == "columnar":
+            writer.writerow({name: _columnar(row[name], kind) for name, kind in COLUMNS})
+        elif writer:
+            writer.writerow(row)
+        else:
+            buf.write(json.dumps(row, default=_json_default) + "\n")
+        if n % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def columnar_schema():
+    """Schema for the columnar format, e.g. for pyarrow.csv/DuckDB read options."""
+    return {"format": "csv", "header": True, "timestamp_format": "%Y-%m-%dT%H:%M:%S.%f",
+            "columns": [{"name": n, "type": t} for n, t in COLUMNS]}
+
+
+# ---------------- GST summary ----------------
+def _paise(amount):
+    return amount.quantize(Decimal(1), rounding=ROUND_HALF_UP)
+
+
+def gst_summary(date_from=None, date_to=None, statuses=None):
+    """Gross sales per (day, state, category), aggregated in SQL, with GST
+    backed out of tax-inclusive prices: CGST+SGST for shipments within the
+    store's state, IGST otherwise. Amounts are Decimal rupees."""
+    rate = Decimal(str(current_app.config.get("GST_RATE", 18))) / 100
+    home_state = (current_app.config.get("STORE_STATE") or "").strip().lower()
+    day = func.date(Order.created_at)
+    category = func.coalesce(Category.name, "Uncategorised")
+    stmt = _filtered(
+        select(day.label("day"), Order.state, category.label("category"),
+               func.count(func.distinct(Order.id)).label("orders"),
+               func.sum(OrderItem.quantity).label("units"),
+               func.sum(OrderItem.quantity * OrderItem.price_each_paise).label("gross"))
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .outerjoin(Product, Product.id == OrderItem.product_id)
+        .outerjoin(Category, Category.id == Product.category_id),
+        date_from, date_to, statuses or REVENUE_STATUSES,
+    ).group_by(day, Order.state, category).order_by(day, Order.state, category)
+
+    out = []
+    for r in db.session.execute(stmt):
+        # all in paise: the tax is rounded once and split so the parts add up
+        gross = Decimal(r.gross or 0)
+        taxable = _paise(gross / (1 + rate))
+        tax = gross - taxable
+        intra = home_state and (r.state or "").strip().lower() == home_state
+        cgst = _paise(tax / 2) if intra else 0
+        out.append({
+            "day": str(r.day), "state": r.state, "category": r.category,
+            "orders": r.orders, "units": r.units or 0,
+            "gross": rupees(gross), "taxable": rupees(taxable),
+            "cgst": rupees(cgst),
+            "sgst": rupees(tax - cgst) if intra else rupees(0),
+            "igst": rupees(0) if intra else rupees(tax),
+        })
+    return out
+
+
+GST_FIELDS = ("day", "state", "category", "orders", "units", "gross", "taxable", "cgst", "sgst", "igst")
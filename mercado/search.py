@@ -0,0 +1,263 @@
+"""Product search index over title, description and category name.
+
+On SQLite the index is an FTS5 virtual table kept in the same database, so
+index writes share the admin route's transaction. A missing table is built
+by the first search, on a connection of its own so the request's session is
+never committed early; index writes before then are skipped, since the build
+reads every committed product anyway. Elsewhere a pure-Python
+inverted index is built per process and refreshed every SEARCH_MEMORY_TTL
+seconds to pick up edits made by other workers.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from flask import current_app
+from sqlalchemy import text
+
+from .extensions import db
+from .models import Product, Category
+
+# relative weight of a hit in title, description, category
+WEIGHTS = (10.0, 1.0, 3.0)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(value):
+    value = unicodedata.normalize("NFKD", value or "")
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(value.lower())
+
+
+def _documents(ids=None, batch=1000):
+    """Yield (id, title, description, category name) rows for indexing."""
+    q = (db.session.query(Product.id, Product.title, Product.description, Category.name)
+         .outerjoin(Category, Product.category_id == Category.id)
+         .order_by(Product.id))
+    if ids is not None:
+        q = q.filter(Product.id.in_(ids))
+    for row in q.yield_per(batch):
+        yield row.id, row.title or "", row.description or "", row.name or ""
+
+
+# ---------------- SQLite FTS5 ----------------
+class Fts5Index:
+    table = "product_fts"
+
+    def __init__(self):
+        self._ready = False
+
+    def ensure(self):
+        """Build the table, in a transaction of its own, if it is missing."""
+        if self._ready:
+            return
+        with db.engine.begin() as conn:
+            if not self._exists(conn):
+                # the DELETE in rebuild takes the write lock, so a second
+                # worker doing the same waits and then rebuilds it again
+                self.rebuild(conn)
+        self._ready = True
+
+    def _exists(self, conn):
+        return conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:t"), {"t": self.table}
+        ).first() is not None
+
+    def _writable(self):
+        # an admin write holds the write lock, so it can't wait for ensure()
+        if not self._ready and self._exists(db.session):
+            self._ready = True
+        return self._ready
+
+    def rebuild(self, conn=None):
+        conn = conn or db.session
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "title, description, category, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+        conn.execute(text(f"DELETE FROM {self.table}"))
+        self._insert(_documents(), conn)
+
+    def _insert(self, docs, conn=None):
+        conn = conn or db.session
+        stmt = text(f"INSERT INTO {self.table}(rowid, title, description, category) "
+                    "VALUES (:id, :title, :description, :category)")
+        batch = []
+        for pid, title, description, category in docs:
+            batch.append({"id": pid, "title": title, "description": description, "category": category})
+            if len(batch) >= 1000:
+                conn.execute(stmt, batch)
+                batch = []
+        if batch:
+            conn.execute(stmt, batch)
+
+    def upsert(self, ids):
+        if not self._writable():
+            return
+        self.remove(ids)
+        self._insert(_documents(ids))
+
+    def remove(self, ids):
+        if not self._writable():
+            return
+        db.session.execute(text(f"DELETE FROM {self.table} WHERE rowid = :id"), [{"id": i} for i in ids])
+
+    def search(self, terms, limit, offset):
+        self.ensure()
+        # every term is quoted (no FTS syntax from user input) and prefix-matched
+        match = " ".join('"%s"*' % t for t in terms)
+        rank = "bm25(%s, %s)" % (self.table, ", ".join(str(w) for w in WEIGHTS))
+        rows = db.session.execute(
+            text(f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH :m "
+                 f"ORDER BY {rank} LIMIT :limit OFFSET :offset"),
+            {"m": match, "limit": limit, "offset": offset},
+        )
+        return [r[0] for r in rows]
+
+
+# ---------------- Pure-Python fallback ----------------
+class MemoryIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built_at = None
+        self._postings = {}   # token -> {product id: weighted term frequency}
+        self._vocab = []      # sorted tokens, for prefix lookups
+        self._doc_tokens = {}  # product id -> tokens, so a document can be removed
+
+    def _add(self, pid, title, description, category):
+        weights = {}
+        for field, weight in zip((title, description, category), WEIGHTS):
+            for tok in tokenize(field):
+                weights[tok] = weights.get(tok, 0.0) + weight
+        for tok, w in weights.items():
+            posting = self._postings.get(tok)
+            if posting is None:
+                posting = self._postings[tok] = {}
+                bisect.insort(self._vocab, tok)
+            posting[pid] = w
+        self._doc_tokens[pid] = tuple(weights)
+
+    def _drop(self, pid):
+        for tok in self._doc_tokens.pop(pid, ()):
+            posting = self._postings.get(tok)
+            if posting is None:
+                continue
+            posting.pop(pid, None)
+            if not posting:
+                del self._postings[tok]
+                i = bisect.bisect_left(self._vocab, tok)
+                if i < len(self._vocab) and self._vocab[i] == tok:
+                    del self._vocab[i]
+
+    def ensure(self):
+        ttl = current_app.config.get("SEARCH_MEMORY_TTL", 300)
+        if self._built_at is not None and time.monotonic() - self._built_at < ttl:
+            return
+        with self._lock:
+            if self._built_at is not None and time.monotonic() - self._built_at < ttl:
+                return
+            self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._postings, self._vocab, self._doc_tokens = {}, [], {}
+            for doc in _documents():
+                self._add(*doc)
+            self._built_at = time.monotonic()
+
+    def upsert(self, ids):
+        self.ensure()
+        with self._lock:
+            for pid in ids:
+                self._drop(pid)
+            for doc in _documents(ids):
+                self._add(*doc)
+
+    def remove(self, ids):
+        self.ensure()
+        with self._lock:
+            for pid in ids:
+                self._drop(pid)
+
+    def _expand(self, prefix):
+        i = bisect.bisect_left(self._vocab, prefix)
+        while i < len(self._vocab) and self._vocab[i].startswith(prefix):
+            yield self._vocab[i]
+            i += 1
+
+    def search(self, terms, limit, offset):
+        self.ensure()
+        with self._lock:
+            n_docs = max(len(self._doc_tokens), 1)
+            scores = None
+            for term in terms:
+                term_scores = {}
+                for tok in self._expand(term):
+                    posting = self._postings[tok]
+                    idf = math.log(1 + n_docs / len(posting))
+                    for pid, w in posting.items():
+                        s = w * idf
+                        if s > term_scores.get(pid, 0.0):
+                            term_scores[pid] = s
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # all terms must match
+                    scores = {pid: s + term_scores[pid] for pid, s in scores.items() if pid in term_scores}
+                if not scores:
+                    return []
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda kv: (kv[1], kv[0]))
+        return [pid for pid, _ in top[offset:]]
+
+
+# ---------------- Public API ----------------
+def _fts5_available():
+    if db.engine.dialect.name != "sqlite":
+        return False
+    opts = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+    return "ENABLE_FTS5" in opts
+
+
+def get_index():
+    state = current_app.extensions.setdefault("search", {})
+    index = state.get("index")
+    if index is None:
+        backend = current_app.config.get("SEARCH_BACKEND", "auto")
+        if backend == "auto":
+            backend = "fts5" if _fts5_available() else "memory"
+        index = state["index"] = Fts5Index() if backend == "fts5" else MemoryIndex()
+    return index
+
+
+def search(query, limit=8, offset=0):
+    """Return product ids matching every term of ``query``, best match first."""
+    terms = tokenize(query)
+    if not terms:
+        return []
+    return get_index().search(terms, limit, offset)
+
+
+def index_product(product):
+    """(Re)index one product. Call after flush and before the route's commit."""
+    get_index().upsert([product.id])
+
+
+def index_products(ids):
+    """(Re)index many products at once, e.g. after a bulk import chunk."""
+    if ids:
+        get_index().upsert(list(ids))
+
+
+def remove_product(pid):
+    get_index().remove([pid])
+
+
+def reindex():
+    get_index().rebuild()
+    db.session.commit()
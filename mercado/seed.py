@@ -0,0 +1,170 @@
+"""Synthetic store data for load tests: ``flask seed``.
+
+Generates categories, products (with discounts, featured flags and stock),
+customers and a history of orders with their lines. Everything goes in
+through batched multi-row INSERTs, one short transaction per batch, so a
+million products or several million orders take minutes and flat memory.
+The same ``seed`` number always produces the same data, which keeps
+benchmark runs comparable.
+
+Bulk inserts skip the ORM flush hooks, so the dashboard counters and the
+search index are rebuilt once at the end. Never run this against a real
+store: it adds rows, it does not replace them.
+"""
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+from werkzeug.security import generate_password_hash
+
+from .extensions import db, cache
+from .models import Category, Order, OrderItem, Product, User
+from . import catalog, pricing, search, stats
+
+SEED_DOMAIN = "seed.example.com"
+SEED_PASSWORD = "seed-pass"
+
+CATEGORY_NAMES = ("Mobiles", "Laptops", "Audio", "Cameras", "Televisions", "Wearables", "Kitchen",
+                  "Home Decor", "Furniture", "Fashion", "Footwear", "Beauty", "Toys", "Books",
+                  "Sports", "Grocery", "Stationery", "Automotive", "Pet Supplies", "Garden")
+ADJECTIVES = ("Classic", "Smart", "Ultra", "Compact", "Wireless", "Premium", "Eco", "Pro", "Mini",
+              "Deluxe", "Portable", "Vintage", "Rugged", "Slim", "Turbo", "Essential")
+NOUNS = ("Speaker", "Backpack", "Kettle", "Watch", "Lamp", "Headphones", "Charger", "Bottle", "Jacket",
+         "Sneakers", "Blender", "Keyboard", "Mouse", "Notebook", "Tripod", "Router", "Mixer", "Chair",
+         "Saree", "Kurta", "Pressure Cooker", "Power Bank", "Trimmer", "Yoga Mat", "Football")
+CITIES = (("Bengaluru", "Karnataka", "560001"), ("Mumbai", "Maharashtra", "400001"),
+          ("Delhi", "Delhi", "110001"), ("Chennai", "Tamil Nadu", "600001"),
+          ("Kolkata", "West Bengal", "700001"), ("Hyderabad", "Telangana", "500001"),
+          ("Pune", "Maharashtra", "411001"), ("Jaipur", "Rajasthan", "302001"))
+# (status, weight) of historical orders
+STATUSES = (("Delivered", 55), ("Paid", 15), ("cashondelivery", 12), ("Shipped", 8),
+            ("Pending", 4), ("Cancelled", 6))
+DISCOUNTS = (0, 0, 0, 0, 5, 10, 10, 15, 20, 25, 30, 40, 50, 60)
+
+
+def _batches(total, batch):
+    start = 0
+    while start < total:
+        yield start, min(batch, total - start)
+        start += batch
+
+
+def _categories(n):
+    existing = set(db.session.scalars(select(Category.name)))
+    names = [CATEGORY_NAMES[i % len(CATEGORY_NAMES)] + (f" {i // len(CATEGORY_NAMES) + 1}"
+                                                        if i >= len(CATEGORY_NAMES) else "")
+             for i in range(n)]
+    rows = [{"name": name} for name in names if name not in existing]
+    if rows:
+        db.session.execute(insert(Category), rows)
+        db.session.commit()
+    return db.session.scalars(select(Category.id).where(Category.name.in_(names))).all()
+
+
+def _product(rng, category_ids, now, days):
+    price = rng.choice((99, 149, 199, 299, 499, 799, 999, 1499, 1999, 2999, 4999, 9999, 19999, 49999))
+    discount = rng.choice(DISCOUNTS)
+    return {
+        "title": f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.randint(100, 9999)}",
+        "description": f"{rng.choice(ADJECTIVES)} build, {rng.randint(1, 5)} year warranty.",
+        "price": float(price),
+        "discount_percent": discount,
+        "sale_price": pricing.compute_sale_price(price, discount),
+        "image_url": "",
+        "is_featured": rng.random() < 0.02,
+        "category_id": rng.choice(category_ids),
+        # most products are not stock-tracked, the rest have plenty
+        "stock": rng.randint(50, 5000) if rng.random() < 0.3 else None,
+        "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+    }
+
+
+def _products(rng, n, category_ids, batch, now, days, progress):
+    for done, size in _batches(n, batch):
+        rows = [_product(rng, category_ids, now, days) for _ in range(size)]
+        db.session.execute(insert(Product), rows)
+        db.session.commit()
+        progress("products", done + size, n)
+
+
+def _users(n, batch, progress):
+    first = db.session.scalar(select(func.count(User.id)).where(User.email.like(f"%@{SEED_DOMAIN}")))
+    # hashing is deliberately slow: every seeded user shares one hash
+    password_hash = generate_password_hash(SEED_PASSWORD)
+    for done, size in _batches(n, batch):
+        db.session.execute(insert(User), [
+            {"name": f"Customer {first + i}", "email": f"user{first + i}@{SEED_DOMAIN}",
+             "password_hash": password_hash, "is_admin": False}
+            for i in range(done, done + size)])
+        db.session.commit()
+        progress("users", done + size, n)
+
+
+def _sample(*columns, limit=20000):
+    """Up to ``limit`` rows of ``columns``, spread evenly over the table by id."""
+    pk = columns[0]
+    step = max(1, (db.session.scalar(select(func.count(pk))) or 0) // limit)
+    return db.session.execute(select(*columns).where(pk % step == 0).limit(limit)).all()
+
+
+def _orders(rng, n, batch, now, days, max_items, progress):
+    products = {r.id: (r.title, pricing.to_paise(r.sale_price))
+                for r in _sample(Product.id, Product.title, Product.sale_price)}
+    customers = _sample(User.id, User.name, User.email) or [(None, "Guest", f"guest@{SEED_DOMAIN}")]
+    if not products:
+        return
+    product_ids = list(products)
+    statuses, weights = zip(*STATUSES)
+    status_weights = list(itertools.accumulate(weights))
+    # a few products sell far more than the rest
+    popularity = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(product_ids))))
+
+    for done, size in _batches(n, batch):
+        orders, lines = [], []
+        for _ in range(size):
+            city, state, pincode = rng.choice(CITIES)
+            picked = rng.choices(product_ids, cum_weights=popularity, k=rng.randint(1, max_items))
+            items = [(pid, rng.randint(1, 3)) for pid in dict.fromkeys(picked)]
+            lines.append(items)
+            uid, name, email = rng.choice(customers)
+            orders.append({
+                "user_id": uid, "customer_name": name,
+                "customer_email": email, "customer_phone": "9999999999",
+                "address_line1": f"{rng.randint(1, 999)} Market Road", "address_line2": "",
+                "city": city, "state": state, "pincode": pincode,
+                "status": rng.choices(statuses, cum_weights=status_weights)[0],
+                "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+                "total_paise": sum(products[pid][1] * qty for pid, qty in items),
+            })
+        order_ids = db.session.scalars(insert(Order).returning(Order.id, sort_by_parameter_order=True),
+                                       orders).all()
+        db.session.execute(insert(OrderItem), [
+            {"order_id": oid, "product_id": pid, "product_title": products[pid][0],
+             "quantity": qty, "price_each_paise": products[pid][1]}
+            for oid, items in zip(order_ids, lines) for pid, qty in items])
+        db.session.commit()
+        progress("orders", done + size, n)
+
+
+def seed(categories=20, products=10000, users=1000, orders=20000, max_items=4, days=365,
+         batch=5000, seed=42, progress=None):
+    """Add synthetic data; see the module docstring. ``progress(kind, done,
+    total)`` is called after every batch."""
+    rng = random.Random(seed)
+    progress = progress or (lambda kind, done, total: None)
+    now = datetime.utcnow()
+    category_ids = _categories(categories)
+    if products:
+        _products(rng, products, category_ids, batch, now, days, progress)
+    if users:
+        _users(users, batch, progress)
+    if orders:
+        _orders(rng, orders, batch, now, days, max_items, progress)
+
+    search.reindex()
+    progress("search index", 1, 1)
+    stats.rebuild(batch=batch)
+    progress("dashboard stats", 1, 1)
+    catalog.bump("categories", "products")
+    cache.invalidate("listing")
@@ -0,0 +1,250 @@
+"""Dashboard statistics kept up to date as orders and products change.
+
+Every flush that inserts, deletes or changes the status/total of an Order
+(checkout, payment_callback, admin.order_status, ...) or inserts/deletes a
+Product records the difference as ``stat_delta`` rows inside the same
+transaction. Those are plain INSERTs: updating the shared ``orders`` counter
+or the current hour's bucket directly would make every checkout wait for the
+previous one's row lock until it commits. ``rollup``, queued every few
+seconds by ``flask worker``, folds the deltas into ``stat_counter`` and the
+hourly/daily ``stat_bucket`` rows with ``value = value + n`` upserts, and
+the readers add whatever is still pending, so the dashboard reads a handful
+of rows however long the order history is and is never behind.
+``flask stats rebuild`` recomputes everything from scratch, for the initial
+load and after writes that bypass the ORM.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from .extensions import db
+from .jobs import job
+from .models import Order, Product, StatBucket, StatCounter, StatDelta
+
+# statuses whose order total counts as revenue
+REVENUE_STATUSES = {"Paid", "Shipped", "Delivered", "cashondelivery"}
+
+GRANULARITIES = {
+    "h": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "d": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+
+
+class _Delta:
+    def __init__(self):
+        self.counters = Counter()
+        self.buckets = defaultdict(lambda: [0, 0])  # (granularity, start) -> [orders, revenue in paise]
+
+    def order(self, created_at, status, total_paise, sign):
+        """Add (sign=1) or remove (sign=-1) one order's contribution."""
+        self.counters["orders"] += sign
+        self.counters["orders_paise"] += sign * (total_paise or 0)
+        self.counters[f"status:{status}"] += sign
+        revenue = (total_paise or 0) if status in REVENUE_STATUSES else 0
+        for g, floor in GRANULARITIES.items():
+            bucket = self.buckets[(g, floor(created_at or datetime.utcnow()))]
+            bucket[0] += sign
+            bucket[1] += sign * revenue
+
+    def __bool__(self):
+        return any(self.counters.values()) or any(o or r for o, r in self.buckets.values())
+
+
+def _old(state, attr):
+    hist = state.attrs[attr].history
+    return hist.deleted[0] if hist.deleted else getattr(state.obj(), attr)
+
+
+def _collect(db_session):
+    delta = _Delta()
+    for obj in db_session.new:
+        if isinstance(obj, Order):
+            delta.order(obj.created_at, obj.status, obj.total_paise, 1)
+        elif isinstance(obj, Product):
+            delta.counters["products"] += 1
+    for obj in db_session.deleted:
+        if isinstance(obj, Order):
+            state = inspect(obj)
+            delta.order(obj.created_at, _old(state, "status"), _old(state, "total_paise"), -1)
+        elif isinstance(obj, Product):
+            delta.counters["products"] -= 1
+    for obj in db_session.dirty:
+        if isinstance(obj, Order):
+            state = inspect(obj)
+            if state.attrs.status.history.has_changes() or state.attrs.total_paise.history.has_changes():
+                delta.order(obj.created_at, _old(state, "status"), _old(state, "total_paise"), -1)
+                delta.order(obj.created_at, obj.status, obj.total_paise, 1)
+    return delta
+
+
+def _upsert(conn, table, keys, increments):
+    """``INSERT ... ON CONFLICT DO UPDATE SET col = col + n`` on SQLite and
+    PostgreSQL; UPDATE-then-INSERT elsewhere."""
+    dialect = conn.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(**keys, **increments)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={col: table.c[col] + stmt.excluded[col] for col in increments},
+        ))
+        return
+    where = [table.c[k] == v for k, v in keys.items()]
+    result = conn.execute(update(table).where(*where)
+                          .values({col: table.c[col] + n for col, n in increments.items()}))
+    if not result.rowcount:
+        conn.execute(table.insert().values(**keys, **increments))
+
+
+def _apply(conn, delta):
+    """Add ``delta`` to the counter and bucket rows (rollup and rebuild only)."""
+    for name, n in delta.counters.items():
+        if n:
+            _upsert(conn, StatCounter.__table__, {"name": name}, {"value": n})
+    for (g, start), (orders, revenue) in delta.buckets.items():
+        if orders or revenue:
+            _upsert(conn, StatBucket.__table__, {"granularity": g, "bucket_start": start},
+                    {"orders": orders, "revenue_paise": revenue})
+
+
+def _record(conn, delta):
+    """Queue ``delta`` as stat_delta rows for ``rollup``: one INSERT, no
+    shared row touched."""
+    blank = {"name": None, "granularity": None, "bucket_start": None, "value": 0, "orders": 0, "revenue_paise": 0}
+    rows = [{**blank, "name": name, "value": n} for name, n in delta.counters.items() if n]
+    rows += [{**blank, "granularity": g, "bucket_start": start, "orders": orders, "revenue_paise": revenue}
+             for (g, start), (orders, revenue) in delta.buckets.items() if orders or revenue]
+    if rows:
+        conn.execute(insert(StatDelta), rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _on_flush(db_session, flush_context):
+    delta = _collect(db_session)
+    if delta:
+        _record(db_session.connection(), delta)
+
+
+def adjust(**counters):
+    """Apply counter deltas for writes made outside the ORM unit of work
+    (bulk INSERTs), e.g. ``adjust(products=1000)``. Part of the caller's
+    transaction."""
+    delta = _Delta()
+    delta.counters.update(counters)
+    _record(db.session.connection(), delta)
+
+
+def status_changed(order, old_status, new_status):
+    """Record a status change written with a plain UPDATE (so invisible to
+    the flush hook). Part of the caller's transaction."""
+    delta = _Delta()
+    delta.order(order.created_at, old_status, order.total_paise, -1)
+    delta.order(order.created_at, new_status, order.total_paise, 1)
+    _record(db.session.connection(), delta)
+
+
+def rollup(batch=5000):
+    """Fold pending stat_delta rows into the counters and buckets, one short
+    transaction per ``batch``. Returns the number of rows folded."""
+    folded = 0
+    while True:
+        ids = db.session.scalars(select(StatDelta.id).order_by(StatDelta.id).limit(batch)).all()
+        if not ids:
+            return folded
+        # only the rows this DELETE removed are ours to add, so two
+        # overlapping runs never count a delta twice
+        rows = db.session.execute(
+            delete(StatDelta).where(StatDelta.id.in_(ids))
+            .returning(StatDelta.name, StatDelta.granularity, StatDelta.bucket_start,
+                       StatDelta.value, StatDelta.orders, StatDelta.revenue_paise),
+            execution_options={"synchronize_session": False},
+        ).all()
+        delta = _Delta()
+        for r in rows:
+            if r.name is not None:
+                delta.counters[r.name] += r.value
+            else:
+                bucket = delta.buckets[(r.granularity, r.bucket_start)]
+                bucket[0] += r.orders
+                bucket[1] += r.revenue_paise
+        _apply(db.session.connection(), delta)
+        db.session.commit()
+        folded += len(rows)
+        if len(ids) < batch:
+            return folded
+
+
+@job("stats.rollup", max_attempts=1, timeout=120, every=10)
+def rollup_job():
+    rollup()
+
+
+# ---------------- Reading ----------------
+def counters():
+    rows = dict(db.session.execute(select(StatCounter.name, StatCounter.value)).all())
+    # plus what rollup has not folded in yet
+    for name, n in db.session.execute(select(StatDelta.name, func.sum(StatDelta.value))
+                                      .where(StatDelta.name.is_not(None)).group_by(StatDelta.name)):
+        rows[name] = rows.get(name, 0) + n
+    return {
+        "products": rows.get("products", 0),
+        "orders": rows.get("orders", 0),
+        "orders_paise": rows.get("orders_paise", 0),  # total of every order, any status
+        "pending": rows.get("status:Pending", 0),
+        "paid": rows.get("status:Paid", 0),
+        "shipped": rows.get("status:Shipped", 0),
+        "delivered": rows.get("status:Delivered", 0),
+        "cod": rows.get("status:cashondelivery", 0),
+        "cancelled": rows.get("status:Cancelled", 0),
+    }
+
+
+def series(granularity, periods, now=None):
+    """The last ``periods`` buckets, oldest first, as (start, orders, revenue
+    in paise); empty buckets included."""
+    floor = GRANULARITIES[granularity]
+    step = timedelta(hours=1) if granularity == "h" else timedelta(days=1)
+    end = floor(now or datetime.utcnow())
+    start = end - step * (periods - 1)
+    rows = {r.bucket_start: [r.orders, r.revenue_paise] for r in StatBucket.query.filter(
+        StatBucket.granularity == granularity, StatBucket.bucket_start >= start)}
+    for ts, orders, revenue in db.session.execute(
+            select(StatDelta.bucket_start, func.sum(StatDelta.orders), func.sum(StatDelta.revenue_paise))
+            .where(StatDelta.granularity == granularity, StatDelta.bucket_start >= start)
+            .group_by(StatDelta.bucket_start)):
+        row = rows.setdefault(ts, [0, 0])
+        row[0] += orders
+        row[1] += revenue
+    out = []
+    for i in range(periods):
+        ts = start + step * i
+        orders, revenue = rows.get(ts, (0, 0))
+        out.append((ts, orders, revenue))
+    return out
+
+
+# ---------------- Rebuild ----------------
+def rebuild(batch=1000):
+    """Recompute every counter and bucket from the product and order tables."""
+    delta = _Delta()
+    delta.counters["products"] = db.session.scalar(select(db.func.count(Product.id)))
+    last_id = 0
+    cols = select(Order.id, Order.created_at, Order.status, Order.total_paise).order_by(Order.id).limit(batch)
+    while True:
+        rows = db.session.execute(cols.where(Order.id > last_id)).all()
+        if not rows:
+            break
+        for row in rows:
+            delta.order(row.created_at, row.status, row.total_paise, 1)
+        last_id = rows[-1].id
+    db.session.execute(delete(StatCounter))
+    db.session.execute(delete(StatBucket))
+    db.session.execute(delete(StatDelta))
+    _apply(db.session.connection(), delta)
+    db.session.commit()
+    return delta.counters["orders"]
@@ -0,0 +1,47 @@
+"""Post-order background jobs, run by ``flask worker``."""
+import smtplib
+from email.message import EmailMessage
+
+from flask import current_app
+
+from .extensions import db
+from .jobs import job
+from .models import Order
+
+
+def send_mail(to, subject, body):
+    """Send a plain-text mail through MAIL_SERVER; only logs it when unset."""
+    cfg = current_app.config
+    if not cfg.get("MAIL_SERVER"):
+        current_app.logger.info("mail to %s: %s", to, subject)
+        return
+    msg = EmailMessage()
+    msg["From"] = cfg.get("MAIL_FROM")
+    msg["To"] = to
+    msg["Subject"] = subject
+    msg.set_content(body)
+    with smtplib.SMTP(cfg["MAIL_SERVER"], cfg.get("MAIL_PORT", 587), timeout=30) as smtp:
+        if cfg.get("MAIL_USE_TLS", True):
+            smtp.starttls()
+        if cfg.get("MAIL_USERNAME"):
+            smtp.login(cfg["MAIL_USERNAME"], cfg.get("MAIL_PASSWORD", ""))
+        smtp.send_message(msg)
+
+
+def _order_mail(order_id, subject):
+    order = db.session.get(Order, order_id)
+    if order is None:
+        return
+    # no request here, so skip render_template's context processors
+    body = current_app.jinja_env.get_template("emails/order.txt").render(order=order, items=order.items)
+    send_mail(order.customer_email, subject.format(id=order.id), body)
+
+
+@job("order.placed")
+def order_placed(order_id):
+    _order_mail(order_id, "Order #{id} received")
+
+
+@job("order.paid")
+def order_paid(order_id):
+    _order_mail(order_id, "Payment received for order #{id}")
@@ -0,0 +1,35 @@
+"""Add Product.image_key/image_width/image_height for local images
+
+Revision ID: 9b4e2d7f1a63
+Revises: f3a9d6b2c417
+Create Date: 2026-10-18 23:41:07.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e2d7f1a63'
+down_revision = 'f3a9d6b2c417'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('image_width', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('image_height', sa.Integer(), nullable=True))
+        # partial: only products still waiting for the images.fetch job
+        batch_op.create_index('ix_product_image_pending', ['id'], unique=False,
+                              sqlite_where=sa.text('image_key IS NULL'),
+                              postgresql_where=sa.text('image_key IS NULL'))
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_image_pending')
+        batch_op.drop_column('image_height')
+        batch_op.drop_column('image_width')
+        batch_op.drop_column('image_key')
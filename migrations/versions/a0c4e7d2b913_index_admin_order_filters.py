@@ -0,0 +1,29 @@
+"""Index admin order filters and sorts
+
+Revision ID: a0c4e7d2b913
+Revises: f7a3c5e18b92
+Create Date: 2026-10-18 19:11:05.318604
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a0c4e7d2b913'
+down_revision = 'f7a3c5e18b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_customer_email_created_at', ['customer_email', 'created_at'], unique=False)
+        batch_op.create_index('ix_order_pincode_created_at', ['pincode', 'created_at'], unique=False)
+        batch_op.create_index('ix_order_total_amount_id', ['total_amount', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_total_amount_id')
+        batch_op.drop_index('ix_order_pincode_created_at')
+        batch_op.drop_index('ix_order_customer_email_created_at')
@@ -0,0 +1,29 @@
+"""Widen stat_counter.value for the orders_paise counter
+
+Revision ID: a7c2e9f4b158
+Revises: 9b4e2d7f1a63
+Create Date: 2026-10-19 10:12:44.301958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c2e9f4b158'
+down_revision = '9b4e2d7f1a63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # b5d9e3f07a61 creates it as BIGINT now; this covers databases upgraded before that
+    with op.batch_alter_table('stat_counter', schema=None) as batch_op:
+        batch_op.alter_column('value', existing_type=sa.Integer(), type_=sa.BigInteger(),
+                              existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stat_counter', schema=None) as batch_op:
+        batch_op.alter_column('value', existing_type=sa.BigInteger(), type_=sa.Integer(),
+                              existing_nullable=False)
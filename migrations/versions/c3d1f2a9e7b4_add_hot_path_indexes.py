@@ -0,0 +1,59 @@
+"""Add indexes for hot filter/sort columns
+
+Revision ID: c3d1f2a9e7b4
+Revises: b196520754bf
+Create Date: 2026-10-18 10:12:41.203117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d1f2a9e7b4'
+down_revision = 'b196520754bf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # NULL discounts would fall out of keyset comparisons on the discount sort
+    op.execute("UPDATE product SET discount_percent = 0 WHERE discount_percent IS NULL")
+
+    # (x, id) composites serve "WHERE x = ? ORDER BY id DESC" with a backward
+    # index scan on both SQLite and PostgreSQL
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.create_index('ix_product_featured_id', ['is_featured', 'id'], unique=False)
+        batch_op.create_index('ix_product_category_id', ['category_id', 'id'], unique=False)
+        batch_op.create_index('ix_product_discount_id', ['discount_percent', 'id'], unique=False)
+        batch_op.create_index('ix_product_price_id', ['price', 'id'], unique=False)
+        batch_op.create_index('ix_product_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_product_on_sale', ['id'], unique=False,
+                              sqlite_where=sa.text('discount_percent > 0'),
+                              postgresql_where=sa.text('discount_percent > 0'))
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_status_created_at', ['status', 'created_at'], unique=False)
+        batch_op.create_index('ix_order_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_order_user_id', ['user_id'], unique=False)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.create_index('ix_order_item_order_id', ['order_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_item_order_id')
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_user_id')
+        batch_op.drop_index('ix_order_created_at')
+        batch_op.drop_index('ix_order_status_created_at')
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_on_sale')
+        batch_op.drop_index('ix_product_created_at')
+        batch_op.drop_index('ix_product_price_id')
+        batch_op.drop_index('ix_product_discount_id')
+        batch_op.drop_index('ix_product_category_id')
+        batch_op.drop_index('ix_product_featured_id')
@@ -0,0 +1,34 @@
+"""Add stat_delta for append-only dashboard counter changes
+
+Revision ID: c4f8a2d6e913
+Revises: a7c2e9f4b158
+Create Date: 2026-10-19 11:03:27.648215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f8a2d6e913'
+down_revision = 'a7c2e9f4b158'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stat_delta',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=60), nullable=True),
+    sa.Column('granularity', sa.String(length=1), nullable=True),
+    sa.Column('bucket_start', sa.DateTime(), nullable=True),
+    sa.Column('value', sa.BigInteger(), nullable=False),
+    sa.Column('orders', sa.Integer(), nullable=False),
+    sa.Column('revenue_paise', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    # pending changes are lost; run `flask stats rebuild` after downgrading
+    op.drop_table('stat_delta')
@@ -0,0 +1,29 @@
+"""Add Product.sku for bulk import upserts
+
+Revision ID: c6f1a8d3e250
+Revises: b5d9e3f07a61
+Create Date: 2026-10-18 22:05:48.019377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1a8d3e250'
+down_revision = 'b5d9e3f07a61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sku', sa.String(length=64), nullable=True))
+        # unique, but NULLs (products created before SKUs) do not collide
+        batch_op.create_index('ix_product_sku', ['sku'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_sku')
+        batch_op.drop_column('sku')
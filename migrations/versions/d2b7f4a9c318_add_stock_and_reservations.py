@@ -0,0 +1,49 @@
+"""Add Product.stock and the stock_reservation table
+
+Revision ID: d2b7f4a9c318
+Revises: c6f1a8d3e250
+Create Date: 2026-10-18 23:10:27.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7f4a9c318'
+down_revision = 'c6f1a8d3e250'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing products stay untracked (NULL) until a merchant sets stock
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stock', sa.Integer(), nullable=True))
+
+    op.create_table('stock_reservation',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('owner', sa.String(length=64), nullable=True),
+    sa.Column('order_id', sa.Integer(), nullable=True),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['order_id'], ['order.id'], ),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.create_index('ix_stock_reservation_owner_product', ['owner', 'product_id'], unique=False)
+        batch_op.create_index('ix_stock_reservation_order_id', ['order_id'], unique=False)
+        batch_op.create_index('ix_stock_reservation_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stock_reservation', schema=None) as batch_op:
+        batch_op.drop_index('ix_stock_reservation_expires_at')
+        batch_op.drop_index('ix_stock_reservation_order_id')
+        batch_op.drop_index('ix_stock_reservation_owner_product')
+
+    op.drop_table('stock_reservation')
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_column('stock')
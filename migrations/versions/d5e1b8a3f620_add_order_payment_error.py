@@ -0,0 +1,26 @@
+"""Add order.payment_error for failed gateway order creation
+
+Revision ID: d5e1b8a3f620
+Revises: c4f8a2d6e913
+Create Date: 2026-10-19 14:21:05.318402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5e1b8a3f620'
+down_revision = 'c4f8a2d6e913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payment_error', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_column('payment_error')
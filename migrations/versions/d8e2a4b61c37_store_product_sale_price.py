@@ -0,0 +1,58 @@
+"""Store Product.sale_price
+
+Revision ID: d8e2a4b61c37
+Revises: c3d1f2a9e7b4
+Create Date: 2026-10-18 11:02:17.554810
+
+"""
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8e2a4b61c37'
+down_revision = 'c3d1f2a9e7b4'
+branch_labels = None
+depends_on = None
+
+
+def _sale_price(price, discount_percent):
+    # frozen copy of mercado.pricing.compute_sale_price at this revision
+    if discount_percent and discount_percent > 0:
+        base = math.floor(price * (1 - discount_percent / 100))
+        return (base // 100) * 100 + 99 if base > 99 else base
+    return round(price or 0, 2)
+
+
+def upgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sale_price', sa.Float(), nullable=False, server_default='0'))
+
+    conn = op.get_bind()
+    product = sa.table('product', sa.column('id'), sa.column('price'),
+                       sa.column('discount_percent'), sa.column('sale_price'))
+    stmt = product.update().where(product.c.id == sa.bindparam('pid')) \
+        .values(sale_price=sa.bindparam('sale'))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(product.c.id, product.c.price, product.c.discount_percent)
+            .where(product.c.id > last_id).order_by(product.c.id).limit(1000)
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(stmt, [{'pid': r.id, 'sale': _sale_price(r.price, r.discount_percent)} for r in rows])
+        last_id = rows[-1].id
+
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_price_id')
+        batch_op.create_index('ix_product_sale_price_id', ['sale_price', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('product', schema=None) as batch_op:
+        batch_op.drop_index('ix_product_sale_price_id')
+        batch_op.create_index('ix_product_price_id', ['price', 'id'], unique=False)
+        batch_op.drop_column('sale_price')
@@ -0,0 +1,64 @@
+"""Store order money in integer paise; add Order.idempotency_key
+
+Revision ID: e8c3a1f5b704
+Revises: d2b7f4a9c318
+Create Date: 2026-10-19 00:12:44.861530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c3a1f5b704'
+down_revision = 'd2b7f4a9c318'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_paise', sa.BigInteger(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('price_each_paise', sa.Integer(), nullable=False, server_default='0'))
+    with op.batch_alter_table('stat_bucket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revenue_paise', sa.BigInteger(), nullable=False, server_default='0'))
+
+    op.execute('UPDATE "order" SET total_paise = CAST(ROUND(COALESCE(total_amount, 0) * 100) AS INTEGER)')
+    op.execute('UPDATE order_item SET price_each_paise = CAST(ROUND(COALESCE(price_each, 0) * 100) AS INTEGER)')
+    op.execute('UPDATE stat_bucket SET revenue_paise = CAST(ROUND(revenue * 100) AS INTEGER)')
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_total_amount_id')
+        batch_op.drop_column('total_amount')
+        batch_op.create_index('ix_order_total_paise_id', ['total_paise', 'id'], unique=False)
+        batch_op.create_index('ix_order_idempotency_key', ['idempotency_key'], unique=True)
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('price_each')
+    with op.batch_alter_table('stat_bucket', schema=None) as batch_op:
+        batch_op.drop_column('revenue')
+
+
+def downgrade():
+    with op.batch_alter_table('stat_bucket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revenue', sa.Float(), nullable=False, server_default='0'))
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('price_each', sa.Float(), nullable=True))
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_amount', sa.Float(), nullable=True))
+
+    op.execute('UPDATE "order" SET total_amount = total_paise / 100.0')
+    op.execute('UPDATE order_item SET price_each = price_each_paise / 100.0')
+    op.execute('UPDATE stat_bucket SET revenue = revenue_paise / 100.0')
+
+    with op.batch_alter_table('stat_bucket', schema=None) as batch_op:
+        batch_op.drop_column('revenue_paise')
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_column('price_each_paise')
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_idempotency_key')
+        batch_op.drop_index('ix_order_total_paise_id')
+        batch_op.drop_column('idempotency_key')
+        batch_op.drop_column('total_paise')
+        batch_op.create_index('ix_order_total_amount_id', ['total_amount', 'id'], unique=False)
@@ -0,0 +1,28 @@
+"""Add order.cancel_reason so the reconciler skips orders cancelled by hand
+
+Revision ID: f2a7c9d4b316
+Revises: d5e1b8a3f620
+Create Date: 2026-10-19 16:08:37.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c9d4b316'
+down_revision = 'd5e1b8a3f620'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('cancel_reason', sa.String(length=20), nullable=True))
+    # existing cancellations can't be told apart and are left without a
+    # reason, so the reconciler leaves them alone
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_column('cancel_reason')
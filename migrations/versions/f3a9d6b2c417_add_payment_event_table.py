@@ -0,0 +1,43 @@
+"""Add payment_event table for webhook dedupe; index Order.razorpay_order_id
+
+Revision ID: f3a9d6b2c417
+Revises: e8c3a1f5b704
+Create Date: 2026-10-19 01:03:15.227904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9d6b2c417'
+down_revision = 'e8c3a1f5b704'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('payment_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(length=100), nullable=False),
+    sa.Column('event', sa.String(length=60), nullable=False),
+    sa.Column('razorpay_order_id', sa.String(length=200), nullable=True),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('payment_event', schema=None) as batch_op:
+        batch_op.create_index('ix_payment_event_event_id', ['event_id'], unique=True)
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_razorpay_order_id', ['razorpay_order_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_razorpay_order_id')
+
+    with op.batch_alter_table('payment_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_event_event_id')
+
+    op.drop_table('payment_event')
@@ -0,0 +1,43 @@
+"""Add server-side cart and wishlist tables
+
+Revision ID: f7a3c5e18b92
+Revises: e41b7c09d2a5
+Create Date: 2026-10-18 17:36:52.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7a3c5e18b92'
+down_revision = 'e41b7c09d2a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cart_item',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner', sa.String(length=64), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner', 'product_id', name='uq_cart_item_owner_product')
+    )
+    op.create_table('wishlist_item',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner', sa.String(length=64), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['product.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner', 'product_id', name='uq_wishlist_item_owner_product')
+    )
+
+
+def downgrade():
+    op.drop_table('wishlist_item')
+    op.drop_table('cart_item')
@@ -0,0 +1,60 @@
+"""Shared fixtures: the app on a throwaway SQLite file with a small catalog.
+
+The database is a real file, not ``:memory:``, so tests that open a second
+connection (or a second thread) see the same data and the same locks as
+gunicorn workers would.
+"""
+import pytest
+
+from mercado import create_app
+from mercado.config import Config
+from mercado.extensions import db
+from mercado.models import Category, Product, User
+
+PASSWORD = "secret1"
+
+
+@pytest.fixture
+def app(tmp_path):
+    class Testing(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        METRICS_DIR = str(tmp_path / "metrics")
+        IMAGES_DIR = str(tmp_path / "images")
+        PERF_INSTRUMENT = False
+        PAYMENT_GATEWAY = "stub"
+        RAZORPAY_KEY_ID = "rzp_test"
+        RAZORPAY_KEY_SECRET = "test-secret"
+        RAZORPAY_WEBHOOK_SECRET = "hook-secret"
+
+    app = create_app(Testing)
+    with app.app_context():
+        db.create_all()
+        phones, audio = Category(name="Phones"), Category(name="Audio")
+        db.session.add_all([phones, audio])
+        db.session.flush()
+        for i in range(30):
+            db.session.add(Product(title=f"Phone {i}", description="an android phone", price=1000 + 10 * i,
+                                   discount_percent=(i % 3) * 10, category_id=(phones if i % 2 else audio).id,
+                                   stock=5 if i < 5 else None))
+        admin = User(name="Admin", email="admin@example.com", is_admin=True)
+        shopper = User(name="Shopper", email="shopper@example.com")
+        for user in (admin, shopper):
+            user.set_password(PASSWORD)
+        db.session.add_all([admin, shopper])
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def login(client, email="shopper@example.com"):
+    return client.post("/login", data={"email": email, "password": PASSWORD})
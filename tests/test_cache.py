@@ -0,0 +1,40 @@
+import threading
+
+from mercado import metrics
+from mercado.extensions import cache
+
+
+def lookups(result):
+    return metrics.registry.counters.get(("swiftcart_cache_requests_total", (("result", result),)), 0)
+
+
+def test_concurrent_lookups_are_all_counted(app):
+    with app.app_context():
+        cache.set("k", "v")
+        hits, misses = lookups("hit"), lookups("miss")
+
+        def look():
+            for _ in range(500):
+                cache.get("k")
+                cache.get("absent")
+        threads = [threading.Thread(target=look) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert (lookups("hit") - hits, lookups("miss") - misses) == (4000, 4000)
+
+
+def test_views_are_keyed_on_the_parameters_they_read(client):
+    first = client.get("/shop?filter=sale&junk=1")
+    hits = lookups("hit")
+    # an unknown parameter neither makes a new entry nor shows up in the page
+    second = client.get("/shop?filter=sale&junk=2")
+    assert lookups("hit") == hits + 1
+    assert second.get_data() == first.get_data()
+    assert b"junk" not in second.get_data()
+    # the ones the view reads still tell pages apart
+    assert client.get("/shop?filter=new").get_data() != first.get_data()
+    assert lookups("hit") == hits + 1
+    page = client.get("/shop?filter=new&junk=3&format=json").get_json()
+    assert "filter=new" in page["next"] and "junk" not in page["next"]
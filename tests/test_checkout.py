@@ -0,0 +1,92 @@
+import re
+import sqlite3
+import threading
+from unittest import mock
+
+from mercado import payments
+from mercado.extensions import db
+from mercado.models import Order, Product
+
+from .conftest import login
+
+ADDRESS = {"customer_name": "Shopper", "customer_email": "shopper@example.com", "address_line1": "1 Road",
+           "city": "Pune", "state": "MH", "pincode": "411001", "payment_method": "online"}
+
+
+def checkout(client, pid=1, qty=1, key=None):
+    for _ in range(qty):
+        client.get(f"/add_to_cart/{pid}")
+    return client.post("/checkout", data={**ADDRESS, "idempotency_key": key or ""})
+
+
+def form_key(response):
+    return re.search(rb'name="idempotency_key"[^>]*value="([^"]+)"', response.data).group(1).decode()
+
+
+def test_gateway_is_called_outside_the_checkout_transaction(app, client):
+    db_path = app.config["SQLALCHEMY_DATABASE_URI"].removeprefix("sqlite:///")
+    real_create = payments.StubGateway.create_order
+
+    def create_order(gateway, *args):
+        # another writer gets the database straight away, not after the call
+        con = sqlite3.connect(db_path, timeout=0)
+        con.execute("UPDATE product SET title = 'Renamed' WHERE id = 2")
+        con.commit()
+        con.close()
+        return real_create(gateway, *args)
+
+    login(client)
+    with mock.patch.object(payments.StubGateway, "create_order", create_order):
+        assert checkout(client).status_code == 200
+    with app.app_context():
+        order = Order.query.one()
+        assert order.status == "Pending" and order.razorpay_order_id
+        assert db.session.get(Product, 2).title == "Renamed"
+
+
+def test_gateway_failure_cancels_the_committed_order(app, client):
+    login(client)
+    with mock.patch.object(payments.StubGateway, "create_order", side_effect=payments.GatewayError("down")):
+        response = checkout(client, qty=2)
+    assert b"not responding" in response.data
+    key = form_key(response)
+    with app.app_context():
+        order = Order.query.one()
+        assert (order.status, order.payment_error) == ("Cancelled", "down")
+        assert db.session.get(Product, 1).stock == 5
+    # the re-rendered form carries a new key, so trying again places an order
+    assert checkout(client, qty=0, key=key).status_code == 200
+    with app.app_context():
+        assert Order.query.count() == 2
+        assert db.session.get(Product, 1).stock == 3
+
+
+def test_checkouts_of_one_product_do_not_wait_on_each_others_gateway_call(app):
+    # each gateway call waits until the other checkout is in its own call
+    # too, which it can only reach if the first isn't holding the stock row
+    both_in_gateway = threading.Barrier(2, timeout=5)
+    real_create = payments.StubGateway.create_order
+
+    def create_order(gateway, *args):
+        both_in_gateway.wait()
+        return real_create(gateway, *args)
+
+    statuses = {}
+
+    def shop(email):
+        client = app.test_client()
+        login(client, email)
+        statuses[email] = checkout(client, pid=1, qty=2).status_code
+
+    with mock.patch.object(payments.StubGateway, "create_order", create_order):
+        threads = [threading.Thread(target=shop, args=(email,))
+                   for email in ("shopper@example.com", "admin@example.com")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+    assert not both_in_gateway.broken
+    assert list(statuses.values()) == [200, 200]
+    with app.app_context():
+        assert [o.status for o in Order.query] == ["Pending", "Pending"]
+        assert db.session.get(Product, 1).stock == 1
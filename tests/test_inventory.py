@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from mercado import inventory
+from mercado.extensions import db
+from mercado.models import Product, StockReservation
+
+
+def stock(pid):
+    db.session.expire_all()
+    return db.session.get(Product, pid).stock
+
+
+def test_hold_takes_units_and_release_gives_them_back(app):
+    with app.test_request_context():
+        assert inventory.hold("a:one", 1, 3) == 3
+        db.session.commit()
+        assert stock(1) == 2
+        # changing the held quantity moves only the difference
+        assert inventory.hold("a:one", 1, 1) == 1
+        db.session.commit()
+        assert stock(1) == 4
+        inventory.release("a:one")
+        db.session.commit()
+        assert stock(1) == 5
+        assert StockReservation.query.count() == 0
+
+
+def test_hold_beyond_stock_changes_nothing(app):
+    with app.test_request_context():
+        inventory.hold("a:one", 1, 2)
+        db.session.commit()
+        with pytest.raises(inventory.OutOfStock) as exc:
+            inventory.hold("a:two", 1, 4)
+        db.session.rollback()
+        assert exc.value.available == 3
+        assert stock(1) == 3
+        # partial holds whatever is left
+        assert inventory.hold("a:two", 1, 4, partial=True) == 3
+        db.session.commit()
+        assert stock(1) == 0
+
+
+def test_untracked_products_never_run_out(app):
+    with app.test_request_context():
+        assert inventory.hold("a:one", 10, 1000) == 1000
+        db.session.commit()
+        assert stock(10) is None
+        assert StockReservation.query.count() == 0
+
+
+def test_sweep_returns_expired_holds_once(app):
+    with app.test_request_context():
+        inventory.hold("a:one", 2, 4)
+        db.session.commit()
+        StockReservation.query.update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        assert inventory.sweep() == (1, 0)
+        assert inventory.sweep() == (0, 0)
+        assert stock(2) == 5
+
+
+def test_restock_applies_the_difference(app):
+    with app.test_request_context():
+        inventory.hold("a:one", 3, 2)  # sold meanwhile: 5 -> 3
+        db.session.commit()
+        # the admin saw 5 and typed 8: three more units arrived
+        assert inventory.restock(3, 5, 8)
+        db.session.commit()
+        assert stock(3) == 6
+        # a cut below what is left stops at zero
+        assert inventory.restock(3, 8, 0)
+        db.session.commit()
+        assert stock(3) == 0
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+from mercado import jobs
+from mercado.extensions import db
+from mercado.models import Job
+
+calls = []
+
+
+@jobs.job("test.ok", max_attempts=3)
+def _ok(value):
+    calls.append(value)
+
+
+@jobs.job("test.flaky", max_attempts=2)
+def _flaky():
+    raise RuntimeError("try again")
+
+
+def test_enqueue_with_key_queues_once(app):
+    with app.app_context():
+        first = jobs.enqueue("test.ok", {"value": 1}, key="once")
+        second = jobs.enqueue("test.ok", {"value": 2}, key="once")
+        db.session.commit()
+        assert first.id == second.id
+        assert Job.query.count() == 1
+
+
+def test_a_job_is_leased_to_one_worker(app):
+    with app.app_context():
+        jobs.enqueue("test.ok", {"value": 7})
+        db.session.commit()
+        claimed = jobs.claim("w1", 10)
+        assert len(claimed) == 1
+        assert jobs.claim("w2", 10) == []
+        calls.clear()
+        assert jobs.run(claimed[0], "w1")
+        assert calls == [7]
+        assert db.session.get(Job, claimed[0]).status == "done"
+
+
+def test_an_expired_lease_is_picked_up_again(app):
+    with app.app_context():
+        jobs.enqueue("test.ok", {"value": 8})
+        db.session.commit()
+        [jid] = jobs.claim("w1", 10)
+        Job.query.filter_by(id=jid).update({"locked_until": datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+        assert jobs.claim("w2", 10) == [jid]
+        # the first worker's result is discarded: it no longer holds the lease
+        assert not jobs.run(jid, "w1")
+        assert jobs.run(jid, "w2")
+
+
+def test_failures_back_off_then_give_up(app):
+    with app.app_context():
+        job = jobs.enqueue("test.flaky")
+        db.session.commit()
+        [jid] = jobs.claim("w1", 10)
+        assert not jobs.run(jid, "w1")
+        job = db.session.get(Job, jid)
+        assert (job.status, job.attempts) == ("queued", 1)
+        assert job.run_at > datetime.utcnow()
+        job.run_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        [jid] = jobs.claim("w1", 10)
+        assert not jobs.run(jid, "w1")
+        assert db.session.get(Job, jid).status == "failed"
+
+
+def test_an_enqueued_job_rolls_back_with_its_transaction(app):
+    with app.app_context():
+        # the first write of the transaction, as when a request queues a job
+        jobs.enqueue("test.ok", {"value": 1}, key="rolled-back")
+        db.session.rollback()
+        assert Job.query.count() == 0
+        jobs.enqueue("test.ok", {"value": 1}, key="rolled-back")
+        db.session.commit()
+        assert Job.query.count() == 1
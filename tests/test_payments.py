@@ -0,0 +1,99 @@
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
+import pytest
+
+from mercado import inventory, payments
+from mercado.extensions import db
+from mercado.models import Job, Order, PaymentEvent, StockReservation
+
+from .conftest import login
+
+
+def make_order(status="Pending", total_paise=100000):
+    order = Order(customer_name="Shopper", customer_email="shopper@example.com", address_line1="1 Road",
+                  city="Pune", state="MH", pincode="411001", status=status, total_paise=total_paise)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def test_payment_signature(app):
+    good = payments.sign("test-secret", b"order_1|pay_1")
+    assert payments.verify_payment("order_1", "pay_1", good, "test-secret")
+    assert not payments.verify_payment("order_1", "pay_2", good, "test-secret")
+    assert not payments.verify_payment("order_1", "pay_1", "", "test-secret")
+
+
+def test_webhook_rejects_a_bad_signature(client):
+    body = json.dumps({"event": "payment.captured"}).encode()
+    response = client.post("/payments/webhook", data=body, headers={"X-Razorpay-Signature": "nope"})
+    assert response.status_code == 400
+
+
+def test_webhook_redelivery_is_recorded_once(app, client):
+    body = json.dumps({"event": "payment.captured", "payload": {"payment": {"entity": {
+        "id": "pay_1", "order_id": "order_1"}}}}).encode()
+    headers = {"X-Razorpay-Signature": payments.sign("hook-secret", body), "X-Razorpay-Event-Id": "evt_1"}
+    assert client.post("/payments/webhook", data=body, headers=headers).status_code == 204
+    assert client.post("/payments/webhook", data=body, headers=headers).status_code == 204
+    with app.app_context():
+        assert PaymentEvent.query.count() == 1
+        assert Job.query.filter_by(name="payments.reconcile").count() == 1
+
+
+def test_mark_paid_settles_once(app):
+    with app.app_context():
+        order = make_order()
+        assert payments.mark_paid(order, "pay_1")
+        db.session.commit()
+        assert not payments.mark_paid(order, "pay_2", via="webhook")
+        db.session.commit()
+        db.session.expire_all()
+        order = db.session.get(Order, order.id)
+        assert (order.status, order.razorpay_payment_id) == ("Paid", "pay_1")
+
+
+def test_reconciler_marks_orders_the_gateway_saw_paid(app):
+    with app.app_context():
+        order = make_order()
+        payments.create_gateway_order(order, "rzp_test", "test-secret")
+        payments.get_gateway("rzp_test", "test-secret").pay(order.razorpay_order_id)
+        assert payments.reconcile_pending(older_than=-60) == 1
+        db.session.expire_all()
+        assert db.session.get(Order, order.id).status == "Paid"
+
+
+def test_reconciler_revives_only_orders_the_sweeper_cancelled(app, client):
+    with app.app_context():
+        swept, by_hand = make_order(), make_order()
+        for order in (swept, by_hand):
+            payments.create_gateway_order(order, "rzp_test", "test-secret")
+            payments.get_gateway("rzp_test", "test-secret").pay(order.razorpay_order_id)
+        db.session.add(StockReservation(order_id=swept.id, product_id=1, quantity=1,
+                                        expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        assert inventory.sweep() == (1, 1)
+        swept_id, by_hand_id = swept.id, by_hand.id
+    login(client, "admin@example.com")
+    client.post(f"/admin/orders/{by_hand_id}/status", data={"status": "Cancelled"})
+    with app.app_context():
+        assert payments.reconcile_pending(older_than=-60) == 1
+        assert db.session.get(Order, swept_id).status == "Paid"
+        assert db.session.get(Order, by_hand_id).status == "Cancelled"
+
+
+def test_webhook_event_is_not_kept_if_its_transaction_rolls_back(app):
+    body = json.dumps({"event": "payment.captured", "payload": {"payment": {"entity": {
+        "id": "pay_1", "order_id": "order_1"}}}}).encode()
+    with app.app_context():
+        # a crash between storing the event and queueing its reconciliation
+        with mock.patch.object(payments, "enqueue", side_effect=RuntimeError("crash")):
+            with pytest.raises(RuntimeError):
+                payments.record_event(body, "evt_1")
+        db.session.rollback()
+        assert PaymentEvent.query.count() == 0
+        # so the gateway's redelivery is processed, not taken for a duplicate
+        assert payments.record_event(body, "evt_1")
+        assert Job.query.filter_by(name="payments.reconcile").count() == 1
@@ -0,0 +1,55 @@
+import io
+
+from mercado import product_io
+from mercado.extensions import db
+from mercado.models import Product
+
+HEADER = "sku,title,price,discount_percent,category,stock\n"
+
+
+def run_import(text):
+    return product_io.import_products(product_io.read_rows(io.StringIO(text), "csv"))
+
+
+def test_import_creates_then_updates_by_sku(app):
+    with app.app_context():
+        before = Product.query.count()
+        result = run_import(HEADER + "SKU-1,Earbuds,999,10,Audio,4\n")
+        assert (result.created, result.updated, result.error_count) == (1, 0, 0)
+        result = run_import(HEADER + "SKU-1,Earbuds Pro,1299,0,Audio,4\n")
+        assert (result.created, result.updated) == (0, 1)
+        product = Product.query.filter_by(sku="SKU-1").one()
+        assert (product.title, product.price, product.sale_price) == ("Earbuds Pro", 1299, 1299)
+        assert Product.query.count() == before + 1
+
+
+def test_bad_rows_are_reported_by_line_and_skipped(app):
+    with app.app_context():
+        result = run_import(HEADER + "SKU-1,Earbuds,lots,0,Audio,\n"
+                                     "SKU-2,Speaker,500,0,Nowhere,\n"
+                                     "SKU-3,Cable,99,0,Audio,\n")
+        assert (result.created, result.error_count) == (1, 2)
+        assert [(e.line, sorted(e.errors)) for e in result.errors] == [(2, ["price"]), (3, ["category_id"])]
+        db.session.expire_all()
+        assert Product.query.filter_by(sku="SKU-3").count() == 1
+
+
+def test_reimporting_an_export_updates_in_place(app):
+    with app.app_context():
+        # products from before SKUs existed have none, so only the id matches them
+        assert Product.query.filter(Product.sku.is_not(None)).count() == 0
+        before = Product.query.count()
+        exported = "".join(product_io.export_products("csv")).replace("Phone 7,", "Phone Seven,")
+        result = run_import(exported)
+        assert (result.created, result.updated, result.error_count) == (0, before, 0)
+        assert Product.query.count() == before
+        assert db.session.get(Product, 8).title == "Phone Seven"
+        assert db.session.get(Product, 1).stock == 5
+
+
+def test_an_unknown_id_falls_back_to_the_sku(app):
+    with app.app_context():
+        run_import(HEADER + "SKU-1,Earbuds,999,0,Audio,\n")
+        result = run_import("id," + HEADER + "9999,SKU-1,Earbuds Pro,999,0,Audio,\n,,Cable,99,0,Audio,\n")
+        assert (result.created, result.updated) == (1, 1)
+        assert Product.query.filter_by(sku="SKU-1").one().title == "Earbuds Pro"